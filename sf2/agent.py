@@ -0,0 +1,304 @@
+import os
+import os.path
+import time
+import socket
+import logging
+import socketserver
+from contextlib import suppress
+from pathlib import Path
+from threading import Lock
+
+import msgpack
+from cryptography.hazmat.primitives.serialization import load_ssh_private_key
+from cryptography.hazmat.primitives.serialization import Encoding
+from cryptography.hazmat.primitives.serialization import PublicFormat
+
+from sf2.wrap_pool import unwrap_master_key
+from sf2 import key_index
+
+SOCKET_ENV = "SF2_AGENT_SOCK"
+
+
+def get_default_socket()->str:
+    """
+    It returns the socket of the agent: SF2_AGENT_SOCK if set, else sf2-agent.sock in the
+    user runtime directory, else in ~/.sf2.
+
+    :return: The socket path.
+    """
+    if os.environ.get(SOCKET_ENV):
+        return os.environ[SOCKET_ENV]
+
+    directory = os.environ.get("XDG_RUNTIME_DIR") or os.path.join(str(Path.home()), ".sf2")
+    return os.path.join(directory, "sf2-agent.sock")
+
+
+class AgentError(Exception):
+    pass
+
+
+class Agent:
+    """
+    Keep unlocked SSH private keys in memory and unwrap master keys for the clients of a Unix
+    socket, so passphrase protected keys are only loaded once. Keys expire after a
+    time-to-live, and all of them are dropped when the agent is idle or locked.
+    Only the private keys stay in the agent, clients only receive master keys.
+    """
+    DEFAULT_TTL = 3600
+    DEFAULT_IDLE = 900
+
+    def __init__(self, socket_path:str=None, ttl:float=None, idle:float=None, _clock:callable=time.monotonic) -> None:
+        self._socket_path = socket_path or get_default_socket()
+        self._ttl = ttl or Agent.DEFAULT_TTL
+        self._idle = idle or Agent.DEFAULT_IDLE
+        self._clock = _clock
+
+        self._lock = Lock()
+        self._keys = dict()
+        self._last_request = self._clock()
+        self._server = None
+
+        self._log = logging.getLogger(self.__class__.__name__)
+
+    def add(self, private_key_file:str, password:bytes=None)->None:
+        """
+        It loads a private key and keeps it until its time-to-live expires.
+
+        :param private_key_file: The path to the private key file
+        :type private_key_file: str
+        :param password: The password of the private key file
+        :type password: bytes
+        """
+        if isinstance(password, str):
+            password = bytes(password, "utf8")
+
+        with open(private_key_file, "rb") as f:
+            private_key = load_ssh_private_key(f.read(), password)
+
+        with self._lock:
+            self._keys[self.get_key_id(private_key_file)] = (private_key, self._clock() + self._ttl)
+
+    def unwrap(self, private_key_file:str, encrypted_master_key:bytes)->bytes:
+        """
+        It decrypts a master key with a private key added before.
+
+        :param private_key_file: The path to the private key file
+        :type private_key_file: str
+        :param encrypted_master_key: The master key encrypted for this private key
+        :type encrypted_master_key: bytes
+        :return: The master key.
+        """
+        return unwrap_master_key(self.get_private_key(private_key_file), encrypted_master_key)
+
+    def fingerprint(self, private_key_file:str)->str:
+        """
+        It returns the fingerprint of the public key of a private key added before, so the user
+        of a key is found without unlocking it again.
+
+        :param private_key_file: The path to the private key file
+        :type private_key_file: str
+        :return: The fingerprint.
+        """
+        public_key = self.get_private_key(private_key_file).public_key().public_bytes(Encoding.OpenSSH, PublicFormat.OpenSSH)
+
+        return key_index.get_public_key_fingerprint(str(public_key, "ascii"))
+
+    def get_private_key(self, private_key_file:str):
+        with self._lock:
+            entry = self._keys.get(self.get_key_id(private_key_file))
+
+        if entry is None:
+            raise AgentError(f"{private_key_file} is not unlocked")
+
+        return entry[0]
+
+    def lock(self)->None:
+        with self._lock:
+            self._keys.clear()
+
+    def list(self)->list:
+        with self._lock:
+            return sorted(path for path, _ in self._keys)
+
+    def expire(self)->None:
+        """
+        It drops the expired keys, and every key if the agent was idle for too long.
+        """
+        now = self._clock()
+        with self._lock:
+            if now - self._last_request >= self._idle:
+                self._keys.clear()
+            else:
+                self._keys = {k:v for k, v in self._keys.items() if v[1] > now}
+
+    def get_key_id(self, private_key_file:str)->tuple:
+        # A key file replaced on disk is loaded again
+        private_key_file = os.path.abspath(private_key_file)
+        return private_key_file, os.stat(private_key_file).st_mtime_ns
+
+    def handle(self, request:dict)->dict:
+        """
+        It runs the request of a client.
+
+        :param request: The command and its arguments
+        :type request: dict
+        :return: The response, with an error message if the command failed.
+        """
+        self.expire()
+        self._last_request = self._clock()
+
+        try:
+            command = request["command"]
+            if command == "add":
+                self.add(request["private_key_file"], request.get("password"))
+                return {}
+            elif command == "unwrap":
+                return {"master_key" : self.unwrap(request["private_key_file"], request["encrypted_master_key"])}
+            elif command == "fingerprint":
+                return {"fingerprint" : self.fingerprint(request["private_key_file"])}
+            elif command == "lock":
+                self.lock()
+                return {}
+            elif command == "list":
+                return {"keys" : self.list()}
+            else:
+                raise AgentError(f"Command {command} is not supported")
+        except Exception as e:
+            self._log.debug(f"{request.get('command')} failed : {e}")
+            return {"error" : str(e), "locked" : isinstance(e, AgentError)}
+
+    def serve_forever(self)->None:
+        agent = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                unpacker = msgpack.Unpacker(self.rfile)
+                request = unpacker.unpack()
+                self.wfile.write(msgpack.packb(agent.handle(request)))
+
+        class Server(socketserver.ThreadingUnixStreamServer):
+            daemon_threads = True
+
+            def service_actions(self):
+                agent.expire()
+
+        if AgentClient(self._socket_path).is_running():
+            raise Exception(f"An agent already listens on {self._socket_path}")
+
+        # The socket of a stopped agent is replaced
+        with suppress(FileNotFoundError):
+            os.remove(self._socket_path)
+
+        # Only the user can connect to the socket
+        umask = os.umask(0o177)
+        try:
+            self._server = Server(self._socket_path, Handler)
+        finally:
+            os.umask(umask)
+
+        self._log.info(f"Agent listening on {self._socket_path}")
+        try:
+            self._server.serve_forever(poll_interval=1)
+        finally:
+            self._server.server_close()
+            self.lock()
+            with suppress(FileNotFoundError):
+                os.remove(self._socket_path)
+
+    def shutdown(self)->None:
+        if self._server is not None:
+            self._server.shutdown()
+
+
+class AgentClient:
+    """
+    Client of a running Agent. Each call opens a connection to the socket.
+    """
+
+    def __init__(self, socket_path:str=None, timeout:float=10) -> None:
+        self._socket_path = socket_path or get_default_socket()
+        self._timeout = timeout
+
+    def is_available(self)->bool:
+        return os.path.exists(self._socket_path)
+
+    def is_running(self)->bool:
+        try:
+            self.list()
+            return True
+        except OSError:
+            return False
+
+    def request(self, request:dict)->dict:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+            s.settimeout(self._timeout)
+            s.connect(self._socket_path)
+            s.sendall(msgpack.packb(request))
+            s.shutdown(socket.SHUT_WR)
+
+            unpacker = msgpack.Unpacker()
+            while True:
+                data = s.recv(65536)
+                if not data:
+                    break
+                unpacker.feed(data)
+
+        response = unpacker.unpack()
+        if "error" in response:
+            if response.get("locked"):
+                raise AgentError(response["error"])
+            raise Exception(response["error"])
+
+        return response
+
+    def add(self, private_key_file:str, password:bytes=None)->None:
+        self.request({"command" : "add", "private_key_file" : os.path.abspath(private_key_file), "password" : password})
+
+    def unwrap(self, private_key_file:str, encrypted_master_key:bytes)->bytes:
+        request = {"command" : "unwrap", "private_key_file" : os.path.abspath(private_key_file), "encrypted_master_key" : encrypted_master_key}
+        return self.request(request)["master_key"]
+
+    def fingerprint(self, private_key_file:str)->str:
+        return self.request({"command" : "fingerprint", "private_key_file" : os.path.abspath(private_key_file)})["fingerprint"]
+
+    def get_master_key(self, private_key_file:str, password:bytes, encrypted_master_key:bytes)->bytes:
+        """
+        It unwraps a master key with the agent, the private key is added to the agent first if
+        it is not unlocked yet.
+
+        :param private_key_file: The path to the private key file
+        :type private_key_file: str
+        :param password: The password of the private key file
+        :type password: bytes
+        :param encrypted_master_key: The master key encrypted for this private key
+        :type encrypted_master_key: bytes
+        :return: The master key.
+        """
+        try:
+            return self.unwrap(private_key_file, encrypted_master_key)
+        except AgentError:
+            self.add(private_key_file, password)
+            return self.unwrap(private_key_file, encrypted_master_key)
+
+    def get_fingerprint(self, private_key_file:str, password:bytes)->str:
+        """
+        It returns the fingerprint of a private key held by the agent, the private key is added
+        to the agent first if it is not unlocked yet.
+
+        :param private_key_file: The path to the private key file
+        :type private_key_file: str
+        :param password: The password of the private key file
+        :type password: bytes
+        :return: The fingerprint.
+        """
+        try:
+            return self.fingerprint(private_key_file)
+        except AgentError:
+            self.add(private_key_file, password)
+            return self.fingerprint(private_key_file)
+
+    def lock(self)->None:
+        self.request({"command" : "lock"})
+
+    def list(self)->list:
+        return self.request({"command" : "list"})["keys"]
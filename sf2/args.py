@@ -54,6 +54,24 @@ def add_io(subparser):
 def add_program(subparser):
     subparser.add_argument('-p', "--program", required=False, default="nano", dest='program', help='Program used to open the plain text file')
 
+def add_workers(subparser):
+    subparser.add_argument("--workers", type=int, required=False, default=None, dest='workers', help='Number of threads encrypting and decrypting the data. Default is 1')
+
+def add_mmap(subparser):
+    subparser.add_argument("--mmap", action='store_true', required=False, default=False, dest='mapped', help="Read the container through a memory mapping, chunks are decrypted without being copied. Message pack only, and only with --atomic: a container written in place while it is mapped would kill the reader")
+
+def add_atomic(subparser):
+    subparser.add_argument("--atomic", action='store_true', required=False, default=False, dest='atomic', help="Write the container to a temporary file, then rename it, so it is never seen partially written. Without it, changed chunks are patched in place. Every writer of a container read with --mmap must use it")
+
+def add_deep(subparser):
+    subparser.add_argument("--deep", action='store_true', required=False, default=False, dest='deep', help="Also create a new master data key and encrypt the data again. Default only changes the keys protecting it")
+
+def add_debounce(subparser):
+    subparser.add_argument("--debounce", type=float, required=False, default=None, dest='debounce', help='Seconds without writes before the plain text file is encrypted again. Default is 0.2')
+
+def add_memfd(subparser):
+    subparser.add_argument("--memfd", action='store_true', required=False, default=False, dest='memfd', help="Give the program an anonymous memory file instead of a file of /dev/shm, sealed when the container is read only")
+
 def add_configFile(subparser):
     subparser.add_argument('-F', action='store', required=False, dest="config_file", help='Provide the config file')
 
@@ -67,6 +85,8 @@ def get_args(cli_args=None):
     add_password(encrypt_parser)
     add_log(encrypt_parser)
     add_io(encrypt_parser)
+    add_workers(encrypt_parser)
+    add_atomic(encrypt_parser)
     add_format(encrypt_parser)
 
     # decrypt
@@ -75,6 +95,9 @@ def get_args(cli_args=None):
     add_log(decrypt_parser)
     add_io(decrypt_parser)
     add_configFile(decrypt_parser)
+    add_workers(decrypt_parser)
+    add_mmap(decrypt_parser)
+    add_atomic(decrypt_parser)
     add_format(decrypt_parser)
 
     # convert
@@ -91,6 +114,11 @@ def get_args(cli_args=None):
     open_parser.add_argument('-c', "--config", required=False, default=None, dest='config_file', help='Define the configuration path. Default is /home/[dude]/.sf2/config')
     add_program(open_parser)
     add_configFile(open_parser)
+    add_workers(open_parser)
+    add_mmap(open_parser)
+    add_debounce(open_parser)
+    add_memfd(open_parser)
+    add_atomic(open_parser)
     add_format_and_tail_file(open_parser)
 
     # verify
@@ -98,6 +126,10 @@ def get_args(cli_args=None):
     create_exclusive_secret(verify_parser)
     add_log(verify_parser)
     add_configFile(verify_parser)
+    add_workers(verify_parser)
+    add_mmap(verify_parser)
+    add_atomic(verify_parser)
+    verify_parser.add_argument("-j", "--jobs", type=int, required=False, default=None, dest='jobs', help='Number of files verified at the same time, each by a process. Default is 1')
     add_format_and_tail_file(verify_parser)
 
     # ssh
@@ -109,6 +141,7 @@ def get_args(cli_args=None):
     add_ssh_parser.add_argument("-k", '--public', required=False, default=None, dest='public_key_file', help='Select the public key. Default is ~/{curent_user}/.ssh/id_rsa.pub')
     add_ssh_parser.add_argument("-a", '--auth-id', required=False, default=None, dest='auth_id', help='Define the authentification id, default is the one in the public key')
     add_password(add_ssh_parser)
+    add_atomic(add_ssh_parser)
     add_format_and_tail_file(add_ssh_parser)
     # ssh remove
     rm_ssh_parser = ssh_subparser.add_parser('rm',  help='Remove an ssh key from a container')
@@ -116,6 +149,8 @@ def get_args(cli_args=None):
     rm_ssh_parser.add_argument('-p', action='store', required=False, default=None, dest="auth_id_pattern", help='Provide a search pattern. Default display all')
     rm_ssh_parser.add_argument('-m', action='store', required=False, dest="password", help='Provide the password')
     add_configFile(rm_ssh_parser)
+    add_deep(rm_ssh_parser)
+    add_atomic(rm_ssh_parser)
     add_format_and_tail_file(rm_ssh_parser)
     # ssh ls
     ls_ssh_parser = ssh_subparser.add_parser('ls',  help='List all ssh public file')
@@ -128,6 +163,7 @@ def get_args(cli_args=None):
     add_password(new_parser)
     new_parser.add_argument("-f", "--force", action='store_true', dest='force', help="Force the output overwrite")
     add_log(new_parser)
+    add_atomic(new_parser)
     add_format_and_tail_file(new_parser)
 
     # change password
@@ -135,8 +171,18 @@ def get_args(cli_args=None):
     add_password(change_password_parser)
     change_password_parser.add_argument('-n', action='store', required=False, dest="new_password", default=None, help='Provide the new password')
     add_log(change_password_parser)
+    add_deep(change_password_parser)
+    add_atomic(change_password_parser)
     add_format_and_tail_file(change_password_parser)
 
+    # agent
+    agent_parser = subparsers.add_parser('agent', help='Run an agent keeping the SSH private keys unlocked')
+    agent_parser.add_argument("-s", "--socket", required=False, default=None, dest='socket', help='Select the socket path. Default is $SF2_AGENT_SOCK, else sf2-agent.sock in $XDG_RUNTIME_DIR or ~/.sf2')
+    agent_parser.add_argument("--ttl", type=float, required=False, default=None, dest='ttl', help='Seconds an unlocked key is kept. Default is 3600')
+    agent_parser.add_argument("--idle", type=float, required=False, default=None, dest='idle', help='Seconds without request before all keys are dropped. Default is 900')
+    agent_parser.add_argument("--lock", action='store_true', required=False, default=False, dest='lock', help='Drop the keys of the running agent instead of starting one')
+    add_log(agent_parser)
+
     # app
     app_parser = subparsers.add_parser('app', help='Run gui')
     add_configFile(app_parser)
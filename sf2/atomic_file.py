@@ -0,0 +1,104 @@
+import os
+import os.path
+import stat
+import shutil
+from contextlib import contextmanager
+from contextlib import suppress
+from tempfile import mkstemp
+
+
+@contextmanager
+def atomic_open(filename:str, mode:str="wb", sync_directory:bool=True):
+    """
+    It opens a temporary file next to filename, then once written, flushes it to the disk
+    and renames it over filename. Readers see the old or the new file, never a truncated one.
+    On failure, the temporary file is removed and filename is left untouched.
+
+    :param filename: The file to replace
+    :type filename: str
+    :param mode: The write mode, "w" or "wb"
+    :type mode: str
+    :param sync_directory: If True, the directory is flushed too, so the rename survives a crash
+    :type sync_directory: bool
+    """
+    directory = os.path.dirname(os.path.abspath(filename))
+    fd, tmp_filename = mkstemp(dir=directory, prefix=f".{os.path.basename(filename)}.", suffix=".tmp")
+
+    try:
+        # mkstemp creates a private file, give it the permissions open() would have
+        try:
+            os.chmod(tmp_filename, stat.S_IMODE(os.stat(filename).st_mode))
+        except FileNotFoundError:
+            umask = os.umask(0)
+            os.umask(umask)
+            os.chmod(tmp_filename, 0o666 & ~umask)
+
+        with os.fdopen(fd, mode) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+
+        os.replace(tmp_filename, filename)
+    except:
+        with suppress(FileNotFoundError):
+            os.remove(tmp_filename)
+        raise
+
+    if sync_directory:
+        directory_fd = os.open(directory, os.O_RDONLY)
+        try:
+            os.fsync(directory_fd)
+        finally:
+            os.close(directory_fd)
+
+
+def replace_head(filename:str, head_size:int, head:bytes, atomic:bool=False, block_size:int=1024 * 1024)->None:
+    """
+    It replaces the first head_size bytes of a file with head, the rest of the file is copied
+    as raw bytes, it is never parsed. In place, the tail is moved block by block when the
+    head changes of size.
+
+    :param filename: The file to change
+    :type filename: str
+    :param head_size: The size of the head to replace
+    :type head_size: int
+    :param head: The new head
+    :type head: bytes
+    :param atomic: If True, the file is written to a temporary file then renamed
+    :type atomic: bool
+    :param block_size: The size of the blocks moved
+    :type block_size: int
+    """
+    if atomic:
+        with open(filename, "rb") as src, atomic_open(filename, "wb") as dst:
+            dst.write(head)
+            src.seek(head_size)
+            shutil.copyfileobj(src, dst, block_size)
+        return
+
+    with open(filename, "r+b") as f:
+        size = os.fstat(f.fileno()).st_size
+        delta = len(head) - head_size
+
+        if delta > 0:
+            # Move from the end, so no block is overwritten before being moved
+            position = size
+            while position > head_size:
+                start = max(head_size, position - block_size)
+                f.seek(start)
+                block = f.read(position - start)
+                f.seek(start + delta)
+                f.write(block)
+                position = start
+        elif delta < 0:
+            position = head_size
+            while position < size:
+                f.seek(position)
+                block = f.read(block_size)
+                f.seek(position + delta)
+                f.write(block)
+                position += len(block)
+            f.truncate(size + delta)
+
+        f.seek(0)
+        f.write(head)
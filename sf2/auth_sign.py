@@ -28,24 +28,33 @@ class AuthSign:
         else:
             self._iterations = _iterations
 
+        # Set by add_keys, so a following sign doesn't need to derive the key again
+        self._private_key = None
+
     def dict_to_bytes(self, data)->bytes:
+        output = []
+        self.feed(output.append, data)
+
+        return b"".join(output)
+
+    def feed(self, update:callable, data)->None:
+        # Canonical encoding, piece by piece: sorted keys, each followed by its value
         if isinstance(data, dict):
-            tmp = b""
             for k in sorted(data.keys()) :
-                tmp = tmp + bytes(k, "utf8") + self.dict_to_bytes(data[k])
-
-            return tmp
+                update(bytes(k, "utf8"))
+                self.feed(update, data[k])
         elif isinstance(data, bytes):
-            return data
+            update(data)
         elif isinstance(data, str):
-            return bytes(data, "utf8")
+            update(bytes(data, "utf8"))
         else:
             raise Exception(f"Type {type(data)} is not supported")
         
     def sha256_dict(self, data)->str:
-        fetch = self.dict_to_bytes(data)
-        hash = sha256(fetch).digest()
-        return hash
+        # The encoding is hashed while it is produced, it is never built as a whole
+        hash = sha256()
+        self.feed(hash.update, data)
+        return hash.digest()
     
     def kdf(self, salt:bytes, password:str, iterations:int)->str:
         kdf = PBKDF2HMAC(
@@ -77,17 +86,26 @@ class AuthSign:
             "encrypted_private_key" : private_key_bytes_encrypted,
             "auth_iv" : auth_salt
         }
+        self._private_key = private_key
 
         return self._container
     
-    def sign(self, password:str)->dict:
+    def get_private_key(self, password:str)->Ed25519PrivateKey:
+        if self._private_key is not None:
+            return self._private_key
+
         private_key_bytes_encrypted = self._container["auth"]["sign"]["encrypted_private_key"]
         auth_salt = self._container["auth"]["sign"]["auth_iv"]
         key = self.kdf(auth_salt, password, self._iterations)
 
         fernet = Fernet(key)
         private_key_bytes = fernet.decrypt(private_key_bytes_encrypted)
-        private_key = Ed25519PrivateKey.from_private_bytes(private_key_bytes)
+        self._private_key = Ed25519PrivateKey.from_private_bytes(private_key_bytes)
+
+        return self._private_key
+
+    def sign(self, password:str)->dict:
+        private_key = self.get_private_key(password)
 
         hash_value = self.sha256_dict(self._container["auth"])
         signature = private_key.sign(hash_value)
@@ -0,0 +1,220 @@
+import os
+import struct
+import base64
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from cryptography.fernet import Fernet
+from cryptography.fernet import InvalidToken
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+
+class ChunkCipher:
+    """
+    Encrypt data as a sequence of independently authenticated chunks (container v3).
+    Each chunk carries its index and a last chunk flag, so chunks can't be
+    reordered, dropped or truncated without failing the decryption.
+    With several workers, chunks are encrypted and decrypted concurrently by a thread pool.
+    """
+    NAME = "fernet"
+    CHUNK_SIZE = 1024 * 1024
+    HEADER = struct.Struct(">QB")
+
+    def __init__(self, master_data_key:bytes, chunk_size:int=None, workers:int=None) -> None:
+        if chunk_size is None:
+            chunk_size = ChunkCipher.CHUNK_SIZE
+
+        self._fernet = Fernet(master_data_key)
+        self._chunk_size = chunk_size
+        self._workers = max(1, workers or 1)
+        self._log = logging.getLogger(self.__class__.__name__)
+
+    def get_chunk_size(self)->int:
+        return self._chunk_size
+
+    def count(self, size:int)->int:
+        """
+        It returns the number of chunks needed to store size bytes. Empty data still uses one chunk.
+
+        :param size: The size of the plain data
+        :type size: int
+        :return: The number of chunks.
+        """
+        return max(1, -(-size // self._chunk_size))
+
+    def split(self, data:bytes):
+        """
+        It yields the plain data chunk by chunk
+
+        :param data: The plain data
+        :type data: bytes
+        """
+        view = memoryview(data)
+        for start in range(0, self.count(len(data)) * self._chunk_size, self._chunk_size):
+            yield view[start:start+self._chunk_size]
+
+    def split_stream(self, stream):
+        """
+        It reads a binary stream chunk by chunk, so only one chunk is in memory at a time
+
+        :param stream: A file object opened in binary mode
+        """
+        chunk = stream.read(self._chunk_size)
+        yield chunk
+
+        while len(chunk) == self._chunk_size:
+            chunk = stream.read(self._chunk_size)
+            if chunk:
+                yield chunk
+
+    def encrypt_chunk(self, index:int, count:int, plain:bytes)->bytes:
+        header = ChunkCipher.HEADER.pack(index, index == count - 1)
+        return self._fernet.encrypt(header + plain)
+
+    def decrypt_chunk(self, index:int, count:int, token:bytes)->bytes:
+        """
+        It decrypts a chunk and checks it is at the expected place
+
+        :param index: The position of the chunk
+        :type index: int
+        :param count: The number of chunks of the data
+        :type count: int
+        :param token: The encrypted chunk
+        :type token: bytes
+        :return: The plain chunk.
+        """
+        # Fernet only takes bytes, a chunk of a mapped file is copied
+        plain = self._fernet.decrypt(bytes(token))
+
+        chunk_index, last = ChunkCipher.HEADER.unpack_from(plain)
+        plain = plain[ChunkCipher.HEADER.size:]
+
+        if chunk_index != index or bool(last) != (index == count - 1):
+            raise InvalidToken(f"Chunk {index} is out of place")
+
+        self._check_size(index, last, plain)
+
+        return plain
+
+    def _check_size(self, index:int, last:bool, plain:bytes)->None:
+        if len(plain) > self._chunk_size or (not last and len(plain) != self._chunk_size):
+            raise InvalidToken(f"Chunk {index} has an invalid size")
+
+    def encrypt(self, plain_chunks, count:int):
+        """
+        It yields the encrypted chunks
+
+        :param plain_chunks: An iterable of plain chunks, all of chunk size except the last one
+        :param count: The number of chunks
+        :type count: int
+        """
+        def jobs():
+            index = 0
+            for plain in plain_chunks:
+                if index >= count:
+                    raise Exception(f"More than {count} chunks to encrypt, the data changed while reading")
+                yield index, count, plain
+                index += 1
+
+            if index != count:
+                raise Exception(f"{index} chunks encrypted instead of {count}, the data changed while reading")
+
+        return self.map(self.encrypt_chunk, jobs())
+
+    def decrypt(self, chunks):
+        """
+        It yields the plain chunks
+
+        :param chunks: The sized iterable of encrypted chunks
+        """
+        count = len(chunks)
+        if count == 0:
+            raise InvalidToken("No chunk found")
+
+        yield from self.map(self.decrypt_chunk, ((index, count, token) for index, token in enumerate(chunks)))
+
+    def map(self, function, jobs):
+        """
+        It yields function(*job) for each job, in order. With several workers, the jobs run
+        in a thread pool and only a few of them are queued ahead, so a stream is never
+        fully loaded in memory.
+
+        :param function: encrypt_chunk or decrypt_chunk
+        :param jobs: An iterable of argument tuples
+        """
+        if self._workers == 1:
+            for job in jobs:
+                yield function(*job)
+            return
+
+        with ThreadPoolExecutor(self._workers) as executor:
+            pending = deque()
+            try:
+                for job in jobs:
+                    pending.append(executor.submit(function, *job))
+                    if len(pending) >= 2 * self._workers:
+                        yield pending.popleft().result()
+
+                while pending:
+                    yield pending.popleft().result()
+            finally:
+                for future in pending:
+                    future.cancel()
+
+
+class AesGcmChunkCipher(ChunkCipher):
+    """
+    Encrypt chunks with AES-256-GCM. A chunk is stored as raw bytes, the nonce followed by
+    the ciphertext and its tag, instead of a base64 Fernet token. The index and the last
+    chunk flag are authenticated as associated data.
+    """
+    NAME = "aes-256-gcm"
+    NONCE_SIZE = 12
+
+    def __init__(self, master_data_key:bytes, chunk_size:int=None, workers:int=None) -> None:
+        super().__init__(master_data_key, chunk_size, workers)
+
+        # The master data key is a Fernet key, a dedicated key is derived for AES-GCM
+        hkdf = HKDF(algorithm=hashes.SHA256(), length=32, salt=None, info=b"sf2 chunk aes-256-gcm")
+        self._aesgcm = AESGCM(hkdf.derive(base64.urlsafe_b64decode(master_data_key)))
+
+    def encrypt_chunk(self, index:int, count:int, plain:bytes)->bytes:
+        nonce = os.urandom(AesGcmChunkCipher.NONCE_SIZE)
+        header = ChunkCipher.HEADER.pack(index, index == count - 1)
+        return nonce + self._aesgcm.encrypt(nonce, plain, header)
+
+    def decrypt_chunk(self, index:int, count:int, token:bytes)->bytes:
+        """
+        It decrypts a chunk and checks it is at the expected place
+
+        :param index: The position of the chunk
+        :type index: int
+        :param count: The number of chunks of the data
+        :type count: int
+        :param token: The encrypted chunk
+        :type token: bytes
+        :return: The plain chunk.
+        """
+        last = index == count - 1
+        header = ChunkCipher.HEADER.pack(index, last)
+        # A slice of bytes is a copy, the ciphertext is given as a view of the token
+        token = memoryview(token)
+        nonce = token[:AesGcmChunkCipher.NONCE_SIZE]
+
+        try:
+            plain = self._aesgcm.decrypt(nonce, token[AesGcmChunkCipher.NONCE_SIZE:], header)
+        except InvalidTag:
+            raise InvalidToken(f"Chunk {index} is invalid or out of place")
+
+        self._check_size(index, last, plain)
+
+        return plain
+
+
+# Ciphers of the data section of a v3 container, by name
+CHUNK_CIPHERS = {c.NAME:c for c in (ChunkCipher, AesGcmChunkCipher)}
+DEFAULT_CHUNK_CIPHER = AesGcmChunkCipher
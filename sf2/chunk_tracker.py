@@ -0,0 +1,73 @@
+from hashlib import sha256
+
+
+class ChunkTracker:
+    """
+    Remember the digest of each chunk of the plain data last read from or written to a
+    container file, so the next write only encrypts and writes the chunks that changed.
+    Digests are only kept in memory.
+    """
+
+    def __init__(self) -> None:
+        self._digests = None
+        self._chunk_size = None
+        self._fingerprint = None
+
+    def update(self, digests:list, chunk_size:int, fingerprint:tuple)->None:
+        """
+        It records the plain data now stored in the container file.
+
+        :param digests: The digests of the plain data, see digests
+        :type digests: list
+        :param chunk_size: The chunk size of the container
+        :type chunk_size: int
+        :param fingerprint: The fingerprint of the container file, see get_fingerprint of supports
+        :type fingerprint: tuple
+        """
+        self._digests = digests
+        self._chunk_size = chunk_size
+        self._fingerprint = fingerprint
+
+    def reset(self)->None:
+        self._digests = None
+        self._chunk_size = None
+        self._fingerprint = None
+
+    def is_synchronized(self, chunk_size:int, fingerprint:tuple)->bool:
+        """
+        It returns True if the container file was not changed since the last update.
+
+        :param chunk_size: The chunk size of the container
+        :type chunk_size: int
+        :param fingerprint: The current fingerprint of the container file
+        :type fingerprint: tuple
+        :return: a boolean value.
+        """
+        return self._digests is not None and self._chunk_size == chunk_size and self._fingerprint == fingerprint
+
+    def digests(self, data:bytes, chunk_size:int)->list:
+        view = memoryview(data)
+        count = max(1, -(-len(data) // chunk_size))
+
+        return [sha256(view[i*chunk_size:(i+1)*chunk_size]).digest() for i in range(count)]
+
+    def get_dirty(self, digests:list)->list:
+        """
+        It returns the indexes of the chunks that must be encrypted again: the modified ones,
+        the new ones and the ones whose last chunk flag changed.
+
+        :param digests: The digests of the new plain data
+        :type digests: list
+        :return: The sorted list of indexes.
+        """
+        count = len(digests)
+        old_count = len(self._digests)
+
+        dirty = list()
+        for index, digest in enumerate(digests):
+            if index >= old_count or digest != self._digests[index]:
+                dirty.append(index)
+            elif (index == count - 1) != (index == old_count - 1):
+                dirty.append(index)
+
+        return dirty
@@ -1,7 +1,10 @@
 
 import base64
+import struct
 import secrets
 import logging
+from hashlib import sha256
+from contextlib import contextmanager
 
 from cryptography.fernet import Fernet
 from cryptography.hazmat.primitives import hashes
@@ -9,9 +12,14 @@ from cryptography.hazmat.primitives.hmac import HMAC
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
 
 from cryptography.exceptions import InvalidSignature
+from cryptography.fernet import InvalidToken
 
 from sf2.cipher import Cipher
 from sf2.auth_sign import AuthSign
+from sf2.key_session import KeySession
+from sf2.chunk_cipher import ChunkCipher, CHUNK_CIPHERS, DEFAULT_CHUNK_CIPHER
+from sf2.chunk_tracker import ChunkTracker
+from sf2.transaction import Transaction
 
 
 class ContainerBase:
@@ -24,9 +32,13 @@ class ContainerBase:
     MASTER_KEY_CHECK_SIZE = 32
     KDF_ITERATION = 48000
     KDF_LENGTH = 32
+    VERSION = "3"
+    SUPPORTED_VERSIONS = ("2", "3")
 
-    def __init__(self, support) -> None:
+    def __init__(self, support, workers:int=None) -> None:
         self._support = support
+        # Number of threads encrypting and decrypting the chunks of v3 containers
+        self._workers = workers
 
         self._log = logging.getLogger(f"{self.__class__.__name__}({support.get_filename()})")
 
@@ -132,21 +144,47 @@ class ContainerBase:
             self._log.debug(f"signature is {generated_signature}, expected is {signature}")
             raise InvalidSignature("Master key is invalid")
         
-    def _create_container(self, password:str, data:bytes, users:dict, _iterations:int=None)->dict:    
+    def _create_header(self, password:str, users:dict, _iterations:int=None)->tuple:
+        """
+        It creates a signed container without data section.
+        
+        :param password: The password used to encrypt the container
+        :type password: str
+        :param users: The users of the auth section
+        :type users: dict
+        :param _iterations: The number of iterations to use when generating the master key
+        :type _iterations: int
+        :return: The container and its master data key.
+        """
+        container, _, master_data_key, auth_sign = self._create_auth(password, users, _iterations)
+        container = auth_sign.sign(password)
+
+        return container, master_data_key
+
+    def _create_auth(self, password:str, users:dict, _iterations:int=None, master_data_key:bytes=None)->tuple:
+        """
+        It creates a container with a new auth section, not signed yet.
         
+        :param password: The password used to encrypt the container
+        :type password: str
+        :param users: The users of the auth section
+        :type users: dict
+        :param _iterations: The number of iterations to use when generating the master key
+        :type _iterations: int
+        :param master_data_key: The raw master data key to wrap, a new one is created if None
+        :type master_data_key: bytes
+        :return: The container, its master key, its master data key and the AuthSign able to sign it.
+        """
         master_iv = self._create_iv()
-        master_data_key = self._create_master_data_key()
+        if master_data_key is None:
+            master_data_key = self._create_master_data_key()
         master_key = self.kdf(master_iv, password, _iterations)
 
         fernet_master_data_key = Fernet(master_key)
         encrypted_master_data_key = fernet_master_data_key.encrypt(master_data_key)
-        
-        fernet_data = Fernet(self.b64encode(master_data_key))
-        encrypted_data = fernet_data.encrypt(data)
-
 
         container = {
-            "version" : "2",
+            "version" : ContainerBase.VERSION,
             "auth" : {
                 "master_iv" : master_iv,
                 "encrypted_master_data_key" : encrypted_master_data_key,
@@ -154,23 +192,30 @@ class ContainerBase:
                 "challenge":None,
                 "signature":None
 
-            },
-            "data" : encrypted_data
+            }
         }
 
         self.set_master_key_signature(container, master_key)
 
         auth_sign = AuthSign(container, _iterations=_iterations)
         auth_sign.add_keys(password)
-        container = auth_sign.sign(password)
+
+        return container, master_key, self.b64encode(master_data_key), auth_sign
+
+    def _create_container(self, password:str, data:bytes, users:dict, _iterations:int=None)->dict:    
+        
+        container, master_data_key = self._create_header(password, users, _iterations)
+        self.set_plain_data(container, data, master_data_key)
 
         return container
 
 
-    def create(self, password:str, force:bool=False, _iterations:int=None)->None:
+    def create(self, password:str, force:bool=False, _iterations:int=None, data:bytes=b"")->None:
         """
         The function creates a new container file, encrypts the data with a master key, encrypts the
         master key with a password, and stores the encrypted master key in the container file.
+        Each key is derived once and the container is written once, so there is no need to call
+        write after create.
         
         :param password: The password used to encrypt the container
         :type password: str
@@ -179,6 +224,8 @@ class ContainerBase:
         :type force: bool (optional)
         :param _iterations: The number of iterations to use when generating the master key
         :type _iterations: int
+        :param data: The initial plain data of the container, empty by default
+        :type data: bytes
         """
 
         if _iterations is None:
@@ -187,14 +234,45 @@ class ContainerBase:
         if not force and self._support.is_exist():
             raise Exception(f"{self._support.get_filename()} already exists")
         
-        container = self._create_container(password, b"", {}, _iterations)
+        container = self._create_container(password, data, {}, _iterations)
         
         self.dump(container)
 
         self._log.info(f"Creation of {self._support.get_filename()}")
 
+    def create_stream(self, stream, size:int, password:str, force:bool=False, _iterations:int=None)->None:
+        """
+        The function creates a new container file from a binary stream. The data is read, encrypted
+        and written chunk by chunk, so the memory used doesn't depend on the size of the data.
+        
+        :param stream: A file object opened in binary mode
+        :param size: The number of bytes that the stream will provide
+        :type size: int
+        :param password: The password used to encrypt the container
+        :type password: str
+        :param force: If set to True, an existing file is overwritten, defaults to False
+        :type force: bool (optional)
+        :param _iterations: The number of iterations to use when generating the master key
+        :type _iterations: int
+        """
+        if _iterations is None:
+            _iterations = ContainerBase.KDF_ITERATION
+
+        if not force and self._support.is_exist():
+            raise Exception(f"{self._support.get_filename()} already exists")
+
+        container, master_data_key = self._create_header(password, {}, _iterations)
+
+        cipher = DEFAULT_CHUNK_CIPHER(master_data_key, workers=self._workers)
+        container["data"] = self.create_data_section(cipher, size)
+        count = cipher.count(size)
+
+        self._support.dump_stream(container, cipher.encrypt(cipher.split_stream(stream), count), count)
+
+        self._log.info(f"Creation of {self._support.get_filename()}")
+
 
-    def get_master_data_key(self, container:dict, password:str, _iterations:int=None)->bytes:
+    def get_master_data_key(self, container:dict, password:str, _iterations:int=None, session:KeySession=None)->bytes:
         """
         The function takes the encrypted master data key from the container, decrypts it using the
         master key, and returns the decrypted master data key
@@ -205,17 +283,75 @@ class ContainerBase:
         :type password: str
         :param _iterations: The number of iterations to use when generating the master key
         :type _iterations: int
+        :param session: If provided and unlocked with the same password, its keys are used instead of the password. Otherwise it is unlocked.
+        :type session: KeySession
         :return: The master data key is being returned.
         """
 
+        if session is not None:
+            master_data_key = self.get_master_data_key_from_session(container, session, password)
+            if master_data_key is not None:
+                return master_data_key
+
         encrypted_master_data_key = container["auth"]["encrypted_master_data_key"]
 
         master_key = self.get_master_key(container, password, _iterations)
+        master_data_key = self.get_master_data_key_from_master_key(container, master_key)
+
+        if session is not None:
+            session.unlock(master_key, master_data_key, encrypted_master_data_key, password)
+
+        return master_data_key
+
+    def get_master_data_key_from_master_key(self, container:dict, master_key:bytes)->bytes:
+        """
+        It decrypts the master data key of the container with the master key.
+        
+        :param container: the container dictionary
+        :type container: dict
+        :param master_key: The master key, checked by get_master_key
+        :type master_key: bytes
+        :return: The master data key.
+        """
+        encrypted_master_data_key = container["auth"]["encrypted_master_data_key"]
 
         fernet_master_data_key = Fernet(master_key)
-        master_data_key = fernet_master_data_key.decrypt(encrypted_master_data_key)
+        return self.b64encode(fernet_master_data_key.decrypt(encrypted_master_data_key))
+
+
+    def get_master_data_key_from_session(self, container:dict, session:KeySession, credential:bytes=None)->bytes:
+        """
+        It returns the master data key kept by the session, if the session matches the container.
+        
+        :param container: the container dictionary
+        :type container: dict
+        :param session: The session holding the keys
+        :type session: KeySession
+        :param credential: The password or the private key of the caller, it must be the one which unlocked the session
+        :type credential: bytes
+        :return: The master data key, or None if the session is locked or doesn't match the container or the credential.
+        """
+        master_key = session.get_master_key(credential)
+        if master_key is None:
+            return None
+
+        try:
+            self.check_master_key_signature(container, master_key)
+        except InvalidSignature:
+            # The master key was changed since the session was unlocked
+            self._log.debug("Session doesn't match the container anymore")
+            session.lock()
+            return None
+
+        encrypted_master_data_key = container["auth"]["encrypted_master_data_key"]
+        master_data_key = session.get_master_data_key(encrypted_master_data_key, credential)
 
-        return self.b64encode(master_data_key)
+        if master_data_key is None:
+            # The master data key was wrapped again, the cached master key is enough to unwrap it
+            master_data_key = self.get_master_data_key_from_master_key(container, master_key)
+            session.unlock(master_key, master_data_key, encrypted_master_data_key, credential)
+
+        return master_data_key
 
 
     def get_master_key(self, container:dict, password:str, _iterations:int=None)->bytes:
@@ -242,6 +378,55 @@ class ContainerBase:
         return master_key
     
 
+    def get_version(self, container:dict)->str:
+        """
+        It returns the version of the container, or raises an exception if it is not supported.
+        
+        :param container: The container
+        :type container: dict
+        :return: The version.
+        """
+        version = container.get("version")
+
+        if version not in ContainerBase.SUPPORTED_VERSIONS:
+            raise Exception(f"Container version {version} is not supported")
+
+        return version
+
+    def create_data_section(self, cipher:ChunkCipher, size:int)->dict:
+        """
+        It creates the data section of a v3 container, without chunks. The chunk size and the
+        plain size are the index used to find the chunks of a range of data.
+        
+        :param cipher: The cipher used to encrypt the chunks
+        :type cipher: ChunkCipher
+        :param size: The size of the plain data
+        :type size: int
+        :return: The data section.
+        """
+        return {
+            "cipher" : cipher.NAME,
+            "chunk_size" : cipher.get_chunk_size(),
+            "size" : size
+        }
+
+    def get_cipher(self, container:dict, master_data_key:bytes)->ChunkCipher:
+        """
+        It returns the cipher of the data section of a v3 container.
+        
+        :param container: The container
+        :type container: dict
+        :param master_data_key: This is the key that was used to encrypt the data
+        :type master_data_key: bytes
+        :return: The cipher.
+        """
+        data = container["data"]
+
+        if data["cipher"] not in CHUNK_CIPHERS:
+            raise Exception(f"Cipher {data['cipher']} is not supported")
+
+        return CHUNK_CIPHERS[data["cipher"]](master_data_key, data["chunk_size"], self._workers)
+
     def get_plain_data(self, container:dict, master_data_key:bytes)->bytes:
         """
         Decrypts the data in the container using the master key
@@ -250,15 +435,121 @@ class ContainerBase:
         :type container: dict
         :param master_data_key: This is the key that was used to encrypt the data
         :type master_data_key: bytes
-        :return: The data is being returned.
+        :return: The data is being returned, in a bytearray for a v3 container.
         """
-        encrypted_data = container["data"]
-
-        fernet_data = Fernet(master_data_key)
-        data = fernet_data.decrypt(encrypted_data)
+        if self.get_version(container) == "2":
+            encrypted_data = container["data"]
+
+            fernet_data = Fernet(master_data_key)
+            return fernet_data.decrypt(encrypted_data)
+
+        # Each plain chunk is copied to its place as soon as it is decrypted, instead of keeping
+        # them all for a join, so only the plain data and a few chunks are in memory
+        data = bytearray(self.get_plain_size(container, master_data_key))
+        view = memoryview(data)
+        position = 0
+        for plain in self._decrypt_chunks(container, master_data_key):
+            if position + len(plain) > len(data):
+                raise InvalidToken(f"Data is larger than {len(data)}")
+            view[position:position + len(plain)] = plain
+            position += len(plain)
 
         return data
 
+    def _decrypt_chunks(self, container:dict, master_data_key:bytes):
+        cipher = self.get_cipher(container, master_data_key)
+        data = container["data"]
+
+        size = 0
+        for plain in cipher.decrypt(data["chunks"]):
+            size += len(plain)
+            yield plain
+
+        if size != data["size"]:
+            raise InvalidToken(f"Data size is {size}, expected is {data['size']}")
+
+    def get_plain_size(self, container:dict, master_data_key:bytes)->int:
+        """
+        It returns the size of the plain data, checked against the number of chunks.
+        
+        :param container: The container
+        :type container: dict
+        :param master_data_key: This is the key that was used to encrypt the data
+        :type master_data_key: bytes
+        :return: The size of the plain data.
+        """
+        if self.get_version(container) == "2":
+            return len(self.get_plain_data(container, master_data_key))
+
+        cipher = self.get_cipher(container, master_data_key)
+        data = container["data"]
+
+        if cipher.count(data["size"]) != len(data["chunks"]):
+            raise InvalidToken(f"Data size {data['size']} doesn't match {len(data['chunks'])} chunks")
+
+        return data["size"]
+
+    def get_plain_range(self, container:dict, master_data_key:bytes, offset:int, length:int)->bytes:
+        """
+        Decrypts a range of the data. For a v3 container, only the chunks overlapping the
+        range are decrypted.
+        
+        :param container: The container that you want to decrypt
+        :type container: dict
+        :param master_data_key: This is the key that was used to encrypt the data
+        :type master_data_key: bytes
+        :param offset: The position of the first byte to read
+        :type offset: int
+        :param length: The maximum number of bytes to read
+        :type length: int
+        :return: The data of the range, shorter if the end of the data is reached.
+        """
+        if offset < 0 or length < 0:
+            raise ValueError(f"Invalid range {offset}+{length}")
+
+        if self.get_version(container) == "2":
+            return self.get_plain_data(container, master_data_key)[offset:offset+length]
+
+        size = self.get_plain_size(container, master_data_key)
+        end = min(offset + length, size)
+
+        if offset >= end:
+            return b""
+
+        cipher = self.get_cipher(container, master_data_key)
+        chunk_size = cipher.get_chunk_size()
+        chunks = container["data"]["chunks"]
+        count = len(chunks)
+
+        first = offset // chunk_size
+        indexes = range(first, (end - 1) // chunk_size + 1)
+        output = list(cipher.map(cipher.decrypt_chunk, ((index, count, chunks[index]) for index in indexes)))
+
+        if indexes[-1] == count - 1 and indexes[-1] * chunk_size + len(output[-1]) != size:
+            raise InvalidToken("Data size doesn't match the last chunk")
+
+        start = offset - first * chunk_size
+
+        return b"".join(output)[start:start + end - offset]
+
+    def get_plain_stream(self, container:dict, master_data_key:bytes, stream)->None:
+        """
+        Decrypts the data in the container chunk by chunk and writes it to a stream. For a v3
+        container loaded with load_stream, only one chunk is in memory at a time.
+        
+        :param container: The container that you want to decrypt
+        :type container: dict
+        :param master_data_key: This is the key that was used to encrypt the data
+        :type master_data_key: bytes
+        :param stream: A file object opened in binary mode
+        """
+        if self.get_version(container) == "2":
+            stream.write(self.get_plain_data(container, master_data_key))
+            return
+
+        for plain in self._decrypt_chunks(container, master_data_key):
+            stream.write(plain)
+
 
     def set_plain_data(self, container:dict, data:bytes, master_data_key:bytes)->None:
         """
@@ -271,13 +562,19 @@ class ContainerBase:
         :param master_data_key: This is the key that is used to encrypt the data
         :type master_data_key: bytes
         """
-        fernet_data = Fernet(master_data_key)
-        encrypted_data = fernet_data.encrypt(data)
+        if self.get_version(container) == "2":
+            fernet_data = Fernet(master_data_key)
+            container["data"] = fernet_data.encrypt(data)
+            return
+
+        cipher = DEFAULT_CHUNK_CIPHER(master_data_key, workers=self._workers)
+        data_section = self.create_data_section(cipher, len(data))
+        data_section["chunks"] = list(cipher.encrypt(cipher.split(data), cipher.count(len(data))))
 
-        container["data"] = encrypted_data
+        container["data"] = data_section
 
 
-    def read(self, password:str, _iterations:int=None)->bytes:
+    def read(self, password:str, _iterations:int=None, session:KeySession=None, tracker:ChunkTracker=None)->bytes:
         """
         It takes a password and returns the plaintext data
         
@@ -286,21 +583,90 @@ class ContainerBase:
         :param _iterations: The number of iterations to use when generating the master data key. If not
         specified, the number of iterations specified in the container will be used
         :type _iterations: int
+        :param session: Optional session used to cache the keys between calls
+        :type session: KeySession
+        :param tracker: Optional tracker, updated with the data read so the next write can be incremental
+        :type tracker: ChunkTracker
         :return: The plain data.
         """
-        
-        container = self.load()
+        fingerprint = self.get_fingerprint()
+        # Chunks are read one by one, the encrypted data is never fully in memory
+        container = self.load_stream()
+
+        try:
+            # Check if the auth section was not modifier
+            auth_sign = AuthSign(container)
+            auth_sign.verify()
+
+            master_data_key = self.get_master_data_key(container, password, _iterations, session)
 
-        # Check if the auth section was not modifier
-        auth_sign = AuthSign(container)
-        auth_sign.verify()
+            data = self.get_plain_data(container, master_data_key)
+        finally:
+            self.close_stream(container)
 
-        master_data_key = self.get_master_data_key(container, password, _iterations)
+        self.track(tracker, container, data, fingerprint)
 
-        return self.get_plain_data(container, master_data_key)
+        return data
     
 
-    def write(self, data:bytes, password:str, _iterations:int=None)->None:
+    def read_stream(self, stream, password:str, _iterations:int=None, session:KeySession=None)->None:
+        """
+        It takes a password and writes the plaintext data to a stream, chunk by chunk.
+        
+        :param stream: A file object opened in binary mode
+        :param password: The password used to encrypt the data
+        :type password: str
+        :param _iterations: The number of iterations to use when generating the master data key
+        :type _iterations: int
+        :param session: Optional session used to cache the keys between calls
+        :type session: KeySession
+        """
+        container = self.load_stream()
+
+        try:
+            # Check if the auth section was not modifier
+            auth_sign = AuthSign(container)
+            auth_sign.verify()
+
+            master_data_key = self.get_master_data_key(container, password, _iterations, session)
+
+            self.get_plain_stream(container, master_data_key, stream)
+        finally:
+            self.close_stream(container)
+
+
+    def read_range(self, offset:int, length:int, password:str, _iterations:int=None, session:KeySession=None)->bytes:
+        """
+        It takes a password and returns a range of the plaintext data, without decrypting
+        the whole data.
+        
+        :param offset: The position of the first byte to read
+        :type offset: int
+        :param length: The maximum number of bytes to read
+        :type length: int
+        :param password: The password used to encrypt the data
+        :type password: str
+        :param _iterations: The number of iterations to use when generating the master data key
+        :type _iterations: int
+        :param session: Optional session used to cache the keys between calls
+        :type session: KeySession
+        :return: The plain data of the range.
+        """
+        container = self.load_stream()
+
+        try:
+            # Check if the auth section was not modifier
+            auth_sign = AuthSign(container)
+            auth_sign.verify()
+
+            master_data_key = self.get_master_data_key(container, password, _iterations, session)
+
+            return self.get_plain_range(container, master_data_key, offset, length)
+        finally:
+            self.close_stream(container)
+
+
+    def write(self, data:bytes, password:str, _iterations:int=None, session:KeySession=None, tracker:ChunkTracker=None)->None:
         """
         It takes a password and a data blob, and writes the data blob to the container as encrypted data.
         
@@ -310,19 +676,87 @@ class ContainerBase:
         :type password: str
         :param _iterations: The number of iterations to use when generating the master key
         :type _iterations: int
+        :param session: Optional session used to cache the keys between calls
+        :type session: KeySession
+        :param tracker: Optional tracker of the data last read or written, only changed chunks are written
+        :type tracker: ChunkTracker
         """
+        fingerprint = self.get_fingerprint()
+        container = self.load_stream()
 
-        container = self.load()
+        try:
+            # Check if the auth section was not modifier
+            auth_sign = AuthSign(container)
+            auth_sign.verify()
 
-        # Check if the auth section was not modifier
-        auth_sign = AuthSign(container)
-        auth_sign.verify()
+            master_data_key = self.get_master_data_key(container, password, _iterations, session)
+        finally:
+            self.close_stream(container)
 
-        master_data_key = self.get_master_data_key(container, password, _iterations)
+        self.write_plain_data(container, data, master_data_key, tracker, fingerprint)
 
-        self.set_plain_data(container, data, master_data_key)
+    def write_plain_data(self, container:dict, data:bytes, master_data_key:bytes, tracker:ChunkTracker=None, fingerprint:tuple=None)->None:
+        """
+        It encrypts the data and writes the container. If the tracker is synchronized with the
+        container file, only the changed chunks are encrypted and, when the support allows it,
+        written in place.
+        
+        :param container: The container, as loaded from the file
+        :type container: dict
+        :param data: the data to be encrypted
+        :type data: bytes
+        :param master_data_key: This is the key that is used to encrypt the data
+        :type master_data_key: bytes
+        :param tracker: Optional tracker of the data last read or written
+        :type tracker: ChunkTracker
+        :param fingerprint: The fingerprint of the file when the container was loaded
+        :type fingerprint: tuple
+        """
+        if tracker is not None and self.get_version(container) != "2" and \
+                tracker.is_synchronized(container["data"]["chunk_size"], fingerprint):
+            cipher = self.get_cipher(container, master_data_key)
+            chunk_size = cipher.get_chunk_size()
+
+            digests = tracker.digests(data, chunk_size)
+            count = len(digests)
+            dirty = tracker.get_dirty(digests)
 
+            view = memoryview(data)
+            jobs = ((i, count, view[i*chunk_size:(i+1)*chunk_size]) for i in dirty)
+            chunks = dict(zip(dirty, cipher.map(cipher.encrypt_chunk, jobs)))
+            container["data"]["size"] = len(data)
+
+            if self._support.patch_chunks(container, chunks, count):
+                tracker.update(digests, chunk_size, self.get_fingerprint())
+                self._log.debug(f"{len(dirty)}/{count} chunks written")
+                return
+
+        self.set_plain_data(container, data, master_data_key)
         self.dump(container)
+        self.track(tracker, container, data, self.get_fingerprint())
+
+    def track(self, tracker:ChunkTracker, container:dict, data:bytes, fingerprint:tuple)->None:
+        """
+        It updates the tracker with the plain data of the container.
+        
+        :param tracker: The tracker, nothing is done if None
+        :type tracker: ChunkTracker
+        :param container: The container
+        :type container: dict
+        :param data: The plain data of the container
+        :type data: bytes
+        :param fingerprint: The fingerprint of the file holding this container
+        :type fingerprint: tuple
+        """
+        if tracker is None:
+            return
+
+        if self.get_version(container) == "2":
+            tracker.reset()
+            return
+
+        chunk_size = container["data"]["chunk_size"]
+        tracker.update(tracker.digests(data, chunk_size), chunk_size, fingerprint)
 
 
     def convert_v1_to_v2(self, password:str, _iterations:int=None):
@@ -341,11 +775,59 @@ class ContainerBase:
 
         data = Cipher().decrypt(password, container)
 
-        self.create(password, True, _iterations)
-        self.write(data, password, _iterations)
+        self.create(password, True, _iterations, data)
 
     def load(self)->dict:
         return self._support.load()
+
+    def get_fingerprint(self)->tuple:
+        return self._support.get_fingerprint()
+
+    def get_data_digest(self)->bytes:
+        """
+        It returns a digest of the encrypted data as stored in the container. No key is needed,
+        and it only changes when the data is written again, not when the header changes.
+
+        :return: The SHA-256 digest.
+        """
+        container = self.load_stream()
+
+        try:
+            data = container["data"]
+            digest = sha256()
+            if isinstance(data, dict):
+                # The fields are hashed one by one, each after its size, so the digest doesn't
+                # depend on how the chunks were loaded
+                cipher = bytes(data["cipher"], "utf8")
+                digest.update(struct.pack(">Q", len(cipher)) + cipher)
+                digest.update(struct.pack(">QQQ", data["chunk_size"], data["size"], len(data["chunks"])))
+                for chunk in data["chunks"]:
+                    digest.update(struct.pack(">Q", len(chunk)))
+                    digest.update(chunk)
+            else:
+                digest.update(data)
+        finally:
+            self.close_stream(container)
+
+        return digest.digest()
+
+    def load_header(self)->dict:
+        # Everything but the data section, the data is not read
+        return self._support.load_header()
+
+    def dump_header(self, container:dict)->None:
+        # The data section of the file is kept as it is
+        self._support.dump_header(container)
+
+    def load_stream(self)->dict:
+        return self._support.load_stream()
+
+    def close_stream(self, container:dict)->None:
+        # Chunks of a container loaded with load_stream may keep the file open
+        if isinstance(container.get("data"), dict):
+            close = getattr(container["data"].get("chunks"), "close", None)
+            if close is not None:
+                close()
     
     def dump(self, container:dict)->None:
         self._support.dump(container)
@@ -357,24 +839,33 @@ class ContainerBase:
         auth_sign = AuthSign(container, _iterations)
         container = auth_sign.sign(password)
 
-        self.dump(container)
-
-    def change_password(self, old_password:str, new_password:str, _iterations:int=None)->bytes:
+        # A container loaded with load_header has no data section
+        if "data" in container:
+            self.dump(container)
+        else:
+            self.dump_header(container)
 
+    @contextmanager
+    def transaction(self, password:str, _iterations:int=None):
+        """
+        It loads and verifies the container once, the block applies its changes in memory with
+        the yielded Transaction, then the container is signed and dumped once. Nothing is
+        written if the block raises.
+        
+        :param password: The password of the container
+        :type password: str
+        :param _iterations: The number of iterations to use when generating the master key
+        :type _iterations: int
+        """
         if _iterations is None:
-            _iterations = ContainerBase.KDF_ITERATION 
-       
-        container = self.load()
-
-        # Check if the auth section was not modifier
-        auth_sign = AuthSign(container)
-        auth_sign.verify()
+            _iterations = ContainerBase.KDF_ITERATION
 
-        master_data_key = self.get_master_data_key(container, old_password, _iterations)
+        transaction = Transaction(self, password, _iterations)
+        yield transaction
+        transaction.commit()
 
-        data = self.get_plain_data(container, master_data_key)
-        users = container["auth"]["users"]
+    def change_password(self, old_password:str, new_password:str, _iterations:int=None, deep:bool=False)->bytes:
 
-        new_container = self._create_container(new_password, data, users, _iterations)
-        self.dump(new_container)
+        with self.transaction(old_password, _iterations) as transaction:
+            transaction.change_password(new_password, deep)
 
@@ -1,38 +1,33 @@
 import logging
-import re
-from multiprocessing import Pool
-from typing import Tuple
+from hashlib import sha256
 
-from cryptography.hazmat.primitives import hashes
 from cryptography.fernet import Fernet
 
 from cryptography.hazmat.primitives.serialization import load_ssh_public_key
 from cryptography.hazmat.primitives.serialization import load_ssh_private_key
-from cryptography.hazmat.primitives.asymmetric import padding
 
 from sf2.container_base import ContainerBase
-
-def encrypt_master_key(user:str, public_key_bytes:bytes, master_key:bytes):
-    public_key = load_ssh_public_key(public_key_bytes)
-
-    encrypted_master_key = public_key.encrypt(
-        master_key,
-        padding.OAEP(
-            mgf=padding.MGF1(algorithm=hashes.SHA256()),
-            algorithm=hashes.SHA256(),
-            label=None
-        )
-    )
-
-    return user, encrypted_master_key
+from sf2.key_session import KeySession
+from sf2.chunk_tracker import ChunkTracker
+from sf2.wrap_pool import WrapPool
+from sf2.wrap_pool import wrap_master_key
+from sf2.wrap_pool import unwrap_master_key
+from sf2.agent import AgentClient
+from sf2 import key_index
 
 class ContainerSSH():
     """
     Add support of SSH keys.
     """
 
-    def __init__(self, base:ContainerBase) -> None:
+    def __init__(self, base:ContainerBase, wrap_pool:WrapPool=None, agent:AgentClient=None) -> None:
         self._base = base
+        # Share a pool between containers to avoid starting workers for each of them
+        if wrap_pool is None:
+            wrap_pool = WrapPool()
+        self._wrap_pool = wrap_pool
+        # When an agent runs, it keeps the private keys unlocked and unwraps the master keys
+        self._agent = agent
         self._log = logging.getLogger(f"{self.__class__.__name__}")
 
     def load_ssh_public_key(self, public_ssh_file:str)->None:
@@ -86,7 +81,7 @@ class ContainerSSH():
         specified, the default value is used
         :type _iterations: int
         """
-        container = self._base.load()
+        container = self._base.load_header()
         master_key = self._base.get_master_key(container, password, _iterations)
         
         file_data, user_host, public_key = self.load_ssh_public_key(public_ssh_file)
@@ -94,14 +89,7 @@ class ContainerSSH():
         if auth_id is None:
             auth_id = user_host
 
-        encrypted_master_key = public_key.encrypt(
-            master_key,
-            padding.OAEP(
-                mgf=padding.MGF1(algorithm=hashes.SHA256()),
-                algorithm=hashes.SHA256(),
-                label=None
-            )
-        )
+        encrypted_master_key = wrap_master_key(file_data, master_key)
 
         if auth_id in container["auth"]["users"] and "ssh" in container["auth"]["users"][auth_id]:
             raise Exception(f"Public key for {auth_id} is already present")
@@ -111,29 +99,38 @@ class ContainerSSH():
             "public-key" : file_data,
             "encrypted_master_key" : encrypted_master_key,
         }
+        # The index is only written with a signed auth section
+        index = dict(self.get_index(container))
+        index[key_index.get_public_key_fingerprint(file_data)] = auth_id
+        container["auth"]["fingerprints"] = index
 
         self._base.sign_and_dump(container, password, _iterations)
 
     def update_master_key(self, password:str, _iterations:int=None)->None:
-        container = self._base.load()
-        master_key = self._base.get_master_key(container, password, _iterations)
+        with self._base.transaction(password, _iterations) as transaction:
+            self.wrap_master_key(transaction.get_container(), transaction.get_master_key())
 
-        queue = []
+    def wrap_master_key(self, container:dict, master_key:bytes)->None:
+        """
+        It encrypts the master key again with the public key of each user.
+        
+        :param container: The container, changed in place
+        :type container: dict
+        :param master_key: The master key of the container
+        :type master_key: bytes
+        """
+        public_keys = dict()
         for user in container["auth"]["users"]:
             user_data = container["auth"]["users"][user]["ssh"]
-            public_key_bytes = bytes(user_data["public-key"], "utf8")
-            queue.append((user, public_key_bytes, master_key))
-            
-        with Pool() as p:
-            result = p.starmap(encrypt_master_key, queue)
+            public_keys[user] = user_data["public-key"]
+
+        result = self._wrap_pool.wrap(public_keys, master_key)
 
-        for user, encrypted_master_key in result:
+        for user, encrypted_master_key in result.items():
             user_data = container["auth"]["users"][user]["ssh"]
 
             user_data["encrypted_master_key"] = encrypted_master_key
 
-        self._base.sign_and_dump(container, password, _iterations)
-
 
     def remove_ssh_key(self, password:str, auth_id_pattern:str=None, _iterations:int=None)->None:
         """
@@ -142,23 +139,33 @@ class ContainerSSH():
         :param auth_id: The user's auth_id
         :type auth_id: str
         """
-        container = self._base.load()
+        with self._base.transaction(password, _iterations) as transaction:
+            self.remove_users(transaction.get_container(), auth_id_pattern)
 
+    def remove_users(self, container:dict, auth_id_pattern:str=None)->None:
+        """
+        It removes the users matching the pattern from the container.
+        
+        :param container: The container, changed in place
+        :type container: dict
+        :param auth_id_pattern: The auth_id or a search pattern
+        :type auth_id_pattern: str
+        """
         users_key = self._get_key_by_user(container, auth_id_pattern)
 
         if len(users_key) == 0:
             raise Exception(f"No user match {auth_id_pattern}")
         
         for user in users_key:
-            del container["auth"]["users"][user]            
-            
-        self._base.sign_and_dump(container, password, _iterations)
+            del container["auth"]["users"][user]
+
+        container["auth"]["fingerprints"] = key_index.build_index(container["auth"]["users"])
 
     def list_ssh_key(self, auth_id_pattern:str="^.*$")->dict:       
         """
         This function returns a dictionary of all the users and their public ssh keys
         """
-        container = self._base.load()
+        container = self._base.load_header()
 
         output = self._get_key_by_user(container, auth_id_pattern)
 
@@ -169,21 +176,90 @@ class ContainerSSH():
 
         users = container["auth"]["users"]
 
+        # A fingerprint (SHA256:...) selects the user of this public key
+        if auth_id_pattern and auth_id_pattern.startswith("SHA256:"):
+            auth_id_pattern = self.get_index(container).get(auth_id_pattern, auth_id_pattern)
+
         if auth_id_pattern in users:
             if "ssh" in users[auth_id_pattern]:
                 output[auth_id_pattern] = users[auth_id_pattern]["ssh"]["public-key"]
      
         else:
-            for user, value in container["auth"]["users"].items():
+            pattern = key_index.compile_pattern(auth_id_pattern) if auth_id_pattern else None
+            for user, value in users.items():
                 if "ssh" in value:
-                    if not auth_id_pattern:
+                    if pattern is None or pattern.search(user) is not None:
                         output[user] = value["ssh"]["public-key"]
-                    else:
-                        if re.search(auth_id_pattern, user) is not None:
-                            output[user] = value["ssh"]["public-key"]
 
         return output
 
+    def get_index(self, container:dict)->dict:
+        """
+        It returns the index of the users by public key fingerprint. Containers written before
+        the index get a temporary one, the container is not modified: it would change the signed
+        auth section.
+
+        :param container: The container
+        :type container: dict
+        :return: A dictionary {fingerprint : auth_id}.
+        """
+        auth = container["auth"]
+        if "fingerprints" not in auth:
+            return key_index.build_index(auth["users"])
+
+        return auth["fingerprints"]
+
+    def find_auth_id(self, container:dict, auth_id:str, private_ssh_file:str, password_private_ssh_file:bytes)->str:
+        """
+        It returns auth_id if it is a user of the container, else the user of the public key
+        of the private key file.
+
+        :param container: The container
+        :type container: dict
+        :param auth_id: The expected auth id, can be None
+        :type auth_id: str
+        :param private_ssh_file: The path to the private key file
+        :type private_ssh_file: str
+        :param password_private_ssh_file: The password of the private key file, only needed if its public key is encrypted
+        :type password_private_ssh_file: bytes
+        :return: The auth id.
+        """
+        if auth_id in container["auth"]["users"]:
+            return auth_id
+
+        fingerprint = self.get_fingerprint(private_ssh_file, password_private_ssh_file)
+        user = self.get_index(container).get(fingerprint)
+
+        if user is None:
+            raise Exception(f"Auth_id {auth_id} is invalid and no user has the key {fingerprint}")
+
+        self._log.debug(f"Auth_id {user} found by the key {fingerprint}")
+        return user
+
+    def get_fingerprint(self, private_ssh_file:str, password_private_ssh_file:bytes)->str:
+        """
+        It returns the fingerprint of a private key. It is read from the key file or its .pub
+        file when possible, else asked to the agent, which keeps the key unlocked for the
+        unwrap. The key is only unlocked here as a last resort.
+
+        :param private_ssh_file: The path to the private key file
+        :type private_ssh_file: str
+        :param password_private_ssh_file: The password of the private key file
+        :type password_private_ssh_file: bytes
+        :return: The fingerprint.
+        """
+        fingerprint = key_index.read_public_key_fingerprint(private_ssh_file)
+        if fingerprint is not None:
+            return fingerprint
+
+        if self._agent is not None:
+            try:
+                return self._agent.get_fingerprint(private_ssh_file, password_private_ssh_file)
+            except OSError as e:
+                self._log.debug(f"Agent not available : {e}")
+
+        return key_index.get_private_key_fingerprint(private_ssh_file, password_private_ssh_file)
+
     def get_master_key_ssh(self, container:dict, auth_id:str, private_ssh_file:str, password_private_ssh_file:bytes):
         """
         The function decrypts the master key using the private key of the user.
@@ -199,10 +275,7 @@ class ContainerSSH():
         :return: The master key is being returned.
         """
 
-        private_key = self.load_ssh_private_key(private_ssh_file, password_private_ssh_file)
-
-        if auth_id not in container["auth"]["users"]:
-            raise Exception(f"Auth_id {auth_id} is invalid")
+        auth_id = self.find_auth_id(container, auth_id, private_ssh_file, password_private_ssh_file)
         
         if "ssh" not in container["auth"]["users"][auth_id]:
             raise Exception(f"Not public key register for {auth_id}")
@@ -210,21 +283,39 @@ class ContainerSSH():
         chuck = container["auth"]["users"][auth_id]["ssh"]
         encrypted_master_key = chuck["encrypted_master_key"]
 
-        master_key = private_key.decrypt(
-            encrypted_master_key,
-            padding.OAEP(
-                mgf=padding.MGF1(algorithm=hashes.SHA256()),
-                algorithm=hashes.SHA256(),
-                label=None
-            )
-        )
+        master_key = self.unwrap_master_key(private_ssh_file, password_private_ssh_file, encrypted_master_key)
 
         self._base.check_master_key_signature(container, master_key)
 
         return master_key
     
     
-    def get_master_data_key_ssh(self, container:dict, auth_id:str, private_ssh_file:str, password_private_ssh_file:bytes)->str:
+    def unwrap_master_key(self, private_ssh_file:str, password_private_ssh_file:bytes, encrypted_master_key:bytes)->bytes:
+        """
+        It decrypts the master key with the agent if one is running, else with the private key
+        loaded from the disk.
+
+        :param private_ssh_file: The path to the private key file
+        :type private_ssh_file: str
+        :param password_private_ssh_file: The password to decrypt the private ssh key
+        :type password_private_ssh_file: bytes
+        :param encrypted_master_key: The master key encrypted for this private key
+        :type encrypted_master_key: bytes
+        :return: The master key.
+        """
+        if self._agent is not None:
+            try:
+                return self._agent.get_master_key(private_ssh_file, password_private_ssh_file, encrypted_master_key)
+            except OSError as e:
+                # A stale socket or a stopped agent, the key is loaded locally
+                self._log.debug(f"Agent not available : {e}")
+
+        private_key = self.load_ssh_private_key(private_ssh_file, password_private_ssh_file)
+
+        return unwrap_master_key(private_key, encrypted_master_key)
+
+
+    def get_master_data_key_ssh(self, container:dict, auth_id:str, private_ssh_file:str, password_private_ssh_file:bytes, session:KeySession=None)->str:
         """
         It decrypts the master data key.
         
@@ -236,18 +327,49 @@ class ContainerSSH():
         :type private_ssh_file: str
         :param password_private_ssh_file: The password for the private ssh file
         :type password_private_ssh_file: bytes
+        :param session: If provided and unlocked with the same private key, its keys are used instead of the private key. Otherwise it is unlocked.
+        :type session: KeySession
         :return: The master data key is being returned.
         """
+        credential = None
+        if session is not None:
+            credential = self.get_credential(private_ssh_file, password_private_ssh_file)
+            master_data_key = self._base.get_master_data_key_from_session(container, session, credential)
+            if master_data_key is not None:
+                return master_data_key
+
         master_key = self.get_master_key_ssh(container, auth_id, private_ssh_file, password_private_ssh_file)
 
         encrypted_master_data_key = container["auth"]["encrypted_master_data_key"]
         fernet_master_data_key = Fernet(master_key)
-        master_data_key = fernet_master_data_key.decrypt(encrypted_master_data_key)
+        master_data_key = self._base.b64encode(fernet_master_data_key.decrypt(encrypted_master_data_key))
 
-        return self._base.b64encode(master_data_key)
+        if session is not None:
+            session.unlock(master_key, master_data_key, encrypted_master_data_key, credential)
 
+        return master_data_key
 
-    def read(self, auth_id:str, private_ssh_file:str, password_private_ssh_file:bytes=None)->bytes:
+    def get_credential(self, private_ssh_file:str, password_private_ssh_file:bytes)->bytes:
+        """
+        It returns the credential of a session unlocked with a private key: the digest of the key
+        file and its password. The path is not enough, another key can be written at the same path.
+
+        :param private_ssh_file: The path to the private key file
+        :type private_ssh_file: str
+        :param password_private_ssh_file: The password of the private key file
+        :type password_private_ssh_file: bytes
+        :return: The credential.
+        """
+        with open(private_ssh_file, "rb") as f:
+            digest = sha256(f.read()).digest()
+
+        if isinstance(password_private_ssh_file, str):
+            password_private_ssh_file = bytes(password_private_ssh_file, "utf8")
+
+        return digest + (password_private_ssh_file or b"")
+
+
+    def read(self, auth_id:str, private_ssh_file:str, password_private_ssh_file:bytes=None, session:KeySession=None, tracker:ChunkTracker=None)->bytes:
         """
         The function reads the encrypted data from the file using SSH KEY and returns the decrypted data
         
@@ -257,17 +379,82 @@ class ContainerSSH():
         :type private_ssh_file: str
         :param password_private_ssh_file: The password for the private ssh file
         :type password_private_ssh_file: bytes
+        :param session: Optional session used to cache the keys between calls
+        :type session: KeySession
+        :param tracker: Optional tracker, updated with the data read so the next write can be incremental
+        :type tracker: ChunkTracker
         :return: The plain data.
         """
+        fingerprint = self._base.get_fingerprint()
+        container = self._base.load_stream()
+
+        try:
+            master_data_key = self.get_master_data_key_ssh(container, auth_id, private_ssh_file, password_private_ssh_file, session)
+
+            data = self._base.get_plain_data(container, master_data_key)
+        finally:
+            self._base.close_stream(container)
+
+        self._base.track(tracker, container, data, fingerprint)
+
+        return data
+    
+    
+    def read_stream(self, stream, auth_id:str, private_ssh_file:str, password_private_ssh_file:bytes=None, session:KeySession=None)->None:
+        """
+        The function decrypts the data using SSH KEY and writes it to a stream, chunk by chunk
         
-        container = self._base.load()
+        :param stream: A file object opened in binary mode
+        :param auth_id: The ID of the authentication you want to use
+        :type auth_id: str
+        :param private_ssh_file: The path to the private key file
+        :type private_ssh_file: str
+        :param password_private_ssh_file: The password for the private ssh file
+        :type password_private_ssh_file: bytes
+        :param session: Optional session used to cache the keys between calls
+        :type session: KeySession
+        """
+        
+        container = self._base.load_stream()
 
-        master_data_key = self.get_master_data_key_ssh(container, auth_id, private_ssh_file, password_private_ssh_file)
+        try:
+            master_data_key = self.get_master_data_key_ssh(container, auth_id, private_ssh_file, password_private_ssh_file, session)
 
-        return self._base.get_plain_data(container, master_data_key)
+            self._base.get_plain_stream(container, master_data_key, stream)
+        finally:
+            self._base.close_stream(container)
     
     
-    def write(self, data:bytes, auth_id:str, private_ssh_file:str, password_private_ssh_file:bytes=None)->None:
+    def read_range(self, offset:int, length:int, auth_id:str, private_ssh_file:str, password_private_ssh_file:bytes=None, session:KeySession=None)->bytes:
+        """
+        The function returns a range of the data using SSH KEY, only the chunks overlapping the range are decrypted
+        
+        :param offset: The position of the first byte to read
+        :type offset: int
+        :param length: The maximum number of bytes to read
+        :type length: int
+        :param auth_id: The ID of the authentication you want to use
+        :type auth_id: str
+        :param private_ssh_file: The path to the private key file
+        :type private_ssh_file: str
+        :param password_private_ssh_file: The password for the private ssh file
+        :type password_private_ssh_file: bytes
+        :param session: Optional session used to cache the keys between calls
+        :type session: KeySession
+        :return: The plain data of the range.
+        """
+        
+        container = self._base.load_stream()
+
+        try:
+            master_data_key = self.get_master_data_key_ssh(container, auth_id, private_ssh_file, password_private_ssh_file, session)
+
+            return self._base.get_plain_range(container, master_data_key, offset, length)
+        finally:
+            self._base.close_stream(container)
+    
+    
+    def write(self, data:bytes, auth_id:str, private_ssh_file:str, password_private_ssh_file:bytes=None, session:KeySession=None, tracker:ChunkTracker=None)->None:
         """
         It writes data to the container.
         
@@ -279,11 +466,17 @@ class ContainerSSH():
         :type private_ssh_file: str
         :param password_private_ssh_file: The password for the private ssh key file
         :type password_private_ssh_file: bytes
+        :param session: Optional session used to cache the keys between calls
+        :type session: KeySession
+        :param tracker: Optional tracker of the data last read or written, only changed chunks are written
+        :type tracker: ChunkTracker
         """
+        fingerprint = self._base.get_fingerprint()
+        container = self._base.load_stream()
 
-        container = self._base.load()
-
-        master_data_key = self.get_master_data_key_ssh(container, auth_id, private_ssh_file, password_private_ssh_file)
-        self._base.set_plain_data(container, data, master_data_key)
+        try:
+            master_data_key = self.get_master_data_key_ssh(container, auth_id, private_ssh_file, password_private_ssh_file, session)
+        finally:
+            self._base.close_stream(container)
 
-        self._base.dump(container)
\ No newline at end of file
+        self._base.write_plain_data(container, data, master_data_key, tracker, fingerprint)
\ No newline at end of file
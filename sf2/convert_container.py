@@ -19,5 +19,4 @@ def convert_container(infilename:str, outfilename:str, password:str, support_for
         raise Exception("Support format is invalid")
     
     base = ContainerBase(support)
-    base.create(password, force, _iterations)
-    base.write(plain, password, _iterations)
\ No newline at end of file
+    base.create(password, force, _iterations, plain)
\ No newline at end of file
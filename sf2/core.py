@@ -1,8 +1,10 @@
 import logging
+from contextlib import contextmanager
+from contextlib import closing
+from contextlib import ExitStack
 import os.path
 import re
 
-from sf2.openinram import OpenInRAM
 from sf2.file_object import FileObject
 from sf2.ssh_file_object import SSHFileObject
 
@@ -10,54 +12,110 @@ from sf2.container_ssh import ContainerSSH
 from sf2.container_base import ContainerBase
 from sf2.json_support import JsonSupport
 from sf2.msgpack_support import MsgpackSupport
+from sf2.key_session import KeySession
+from sf2.wrap_pool import WrapPool
+from sf2.agent import AgentClient
+from sf2.atomic_file import atomic_open
 
 
 
 class Core:
-    def __init__(self, _iterations:int=None) -> None:
+    def __init__(self, _iterations:int=None, session_ttl:float=None, workers:int=None, atomic:bool=False, wrap_executor:str="threads", agent_socket:str=None, mapped:bool=False) -> None:
         self._iterations = _iterations
+        # Message pack containers are read through a memory mapping, chunks are not copied
+        self._mapped = mapped
+        # SSH private keys are unlocked by the agent listening on this socket, when it exists
+        self._agent_socket = agent_socket
+        self._agent = AgentClient(agent_socket)
+        # Workers encrypting the master key for SSH users, shared by all the calls
+        self._wrap_pool = WrapPool(wrap_executor)
+        # Containers are replaced by an fsync'd rename, readers never see a partial file
+        self._atomic = atomic
+        # Number of threads encrypting and decrypting chunks, one by default
+        self._workers = workers
+        # When a ttl is set, unlocked keys are kept per file and reused by the next calls
+        self._session_ttl = session_ttl
+        self._sessions = dict()
         self._log = logging.getLogger(self.__class__.__name__)
 
+    def get_session(self, filename:str)->KeySession:
+        if self._session_ttl is None:
+            return None
+
+        filename = os.path.abspath(filename)
+        if filename not in self._sessions:
+            self._sessions[filename] = KeySession(self._session_ttl)
+
+        return self._sessions[filename]
+
+    @contextmanager
+    def open_session(self, filename:str):
+        # Without cached sessions, a session only lives for the duration of the block
+        session = self.get_session(filename)
+
+        if session is not None:
+            yield session
+        else:
+            with KeySession() as session:
+                yield session
+
+    def open_output(self, outfilename:str):
+        # Plain data is streamed to a temporary file, renamed over the output once the last chunk
+        # is authenticated. On failure, only the temporary file is removed.
+        return atomic_open(outfilename, "wb")
+
+    def get_agent(self)->AgentClient:
+        if self._agent.is_available():
+            return self._agent
+
+        return None
+
+    def lock(self)->None:
+        for session in self._sessions.values():
+            session.lock()
+        self._sessions.clear()
+
+    def close(self)->None:
+        self.lock()
+        self._wrap_pool.shutdown()
+
     def encrypt(self, infilename:str, outfilename:str, password:str, support_format:str="msgpack", force:bool=False):
         support = self.get_support(outfilename, support_format)
-        container = ContainerBase(support)
+        container = ContainerBase(support, self._workers)
         
+        # The file is encrypted chunk by chunk, it is never fully loaded in memory
         with open(infilename, "rb") as f:
-            data = f.read()
-
-        container.create(password, force, self._iterations)
-        container.write(data, password, self._iterations)
+            size = os.fstat(f.fileno()).st_size
+            container.create_stream(f, size, password, force, self._iterations)
 
     def decrypt(self, infilename:str, outfilename:str, password:str, support_format:str="msgpack", force:bool=False):
         if not force and os.path.exists(outfilename):
             raise Exception(f"file {outfilename} already exist")
         
         support = self.get_support(infilename, support_format)
-        container = ContainerBase(support)
-        data = container.read(password,self._iterations)
+        container = ContainerBase(support, self._workers)
 
-
-        with open(outfilename, "wb") as f:
-            f.write(data)
+        with self.open_output(outfilename) as f:
+            container.read_stream(f, password, self._iterations, self.get_session(infilename))
 
     def decrypt_ssh(self, infilename:str, outfilename:str, private_key_file:str=None, private_key_password:str=None, auth_id:str=None, support_format:str="msgpack", force:bool=False):
         if not force and os.path.exists(outfilename):
             raise Exception(f"file {outfilename} already exist")
         
         support = self.get_support(infilename, support_format)
-        base = ContainerBase(support)
-        container = ContainerSSH(base)
-        auth_id = self.get_auth_id(auth_id)
-        data = container.read(auth_id, private_key_file, private_key_password)
+        base = ContainerBase(support, self._workers)
+        # Without auth_id, the user is found by the fingerprint of the key
+        container = ContainerSSH(base, self._wrap_pool, self.get_agent())
 
-        with open(outfilename, "wb") as f:
-            f.write(data)
+        with self.open_output(outfilename) as f:
+            container.read_stream(f, auth_id, private_key_file, private_key_password, self.get_session(infilename))
 
     def verify(self, filename:str, password:str=None, support_format:str="msgpack")->bool:
         support = self.get_support(filename, support_format)
         try:
-            container = ContainerBase(support)
-            container.read(password, self._iterations)
+            container = ContainerBase(support, self._workers)
+            with open(os.devnull, "wb") as f:
+                container.read_stream(f, password, self._iterations)
             return True
         except Exception as e:
             return False
@@ -65,55 +123,119 @@ class Core:
     def verify_ssh(self, filename:str, private_key_file:str=None, private_key_password:str=None, auth_id:str=None, support_format:str="msgpack")->bool:
         support = self.get_support(filename, support_format)
         try:
-            base = ContainerBase(support)
-            container = ContainerSSH(base)
-            auth_id = self.get_auth_id(auth_id)
-            container.read(auth_id, private_key_file, private_key_password)
+            base = ContainerBase(support, self._workers)
+            container = ContainerSSH(base, self._wrap_pool, self.get_agent())
+            with open(os.devnull, "wb") as f:
+                container.read_stream(f, auth_id, private_key_file, private_key_password)
             return True
         except Exception as e:
             self._log.debug(f"Error during verify_ssh : {e}")
             return False
 
+    def verify_many(self, filenames:list, password:str=None, support_format:str="msgpack", jobs:int=None):
+        # Yield (filename, status) as soon as each file is verified
+        arguments = [(filename, password, support_format) for filename in filenames]
+        yield from self.run_jobs(verify_job, arguments, jobs)
+
+    def verify_ssh_many(self, secrets:list, private_key_password:str=None, support_format:str="msgpack", jobs:int=None):
+        # secrets holds the (filename, private_key_file, auth_id) of each file
+        arguments = [(filename, private_key_file, private_key_password, auth_id, support_format) for filename, private_key_file, auth_id in secrets]
+        yield from self.run_jobs(verify_ssh_job, arguments, jobs)
+
+    def run_jobs(self, function, arguments:list, jobs:int=None):
+        # The KDF and the decryption are CPU bound, files are verified by a process each
+        settings = (self._iterations, None, self._workers, self._atomic, "threads", self._agent_socket, self._mapped)
+
+        if jobs is None or jobs <= 1 or len(arguments) <= 1:
+            for args in arguments:
+                yield function(settings, *args)
+            return
 
-    def open(self, filename:str, program:str, password:str=None, support_format:str="msgpack"):
+        from concurrent.futures import ProcessPoolExecutor
+        from concurrent.futures import as_completed
+
+        with ProcessPoolExecutor(min(jobs, len(arguments))) as executor:
+            futures = [executor.submit(function, settings, *args) for args in arguments]
+            for future in as_completed(futures):
+                yield future.result()
+
+    def open(self, filename:str, program:str, password:str=None, support_format:str="msgpack", debounce:float=None, memfd:bool=False):
         support = self.get_support(filename, support_format)
 
-        file_object = FileObject(support, password, self._iterations)
+        # Each sync would run the KDF again, the session keeps the keys during the whole opening
+        with self.open_session(filename) as session:
+            file_object = FileObject(support, password, self._iterations, session, self._workers)
 
-        open_in_ram = OpenInRAM(file_object, program)
-        open_in_ram.run()
+            # inotify and flufl.lock are only needed to open a container
+            from sf2.openinram import OpenInRAM
 
-    def open_ssh(self, filename:str, program:str, private_key_file:str=None, private_key_password:str=None, auth_id:str=None, support_format:str="msgpack" ):
+            open_in_ram = OpenInRAM(file_object, program, debounce, memfd)
+            open_in_ram.run()
+
+    def open_ssh(self, filename:str, program:str, private_key_file:str=None, private_key_password:str=None, auth_id:str=None, support_format:str="msgpack", debounce:float=None, memfd:bool=False):
 
         support = self.get_support(filename, support_format)
-        file_object = SSHFileObject(support, auth_id, private_key_file, private_key_password)
+        with self.open_session(filename) as session:
+            file_object = SSHFileObject(support, auth_id, private_key_file, private_key_password, session, self._workers, self.get_agent())
+
+            from sf2.openinram import OpenInRAM
+
+            open_in_ram = OpenInRAM(file_object, program, debounce, memfd)
+            open_in_ram.run()
+
+    def open_many(self, filenames:list, program:str, password:str=None, support_format:str="msgpack", debounce:float=None, memfd:bool=False):
+        with ExitStack() as stack:
+            file_objects = list()
+            for filename in filenames:
+                support = self.get_support(filename, support_format)
+                session = stack.enter_context(self.open_session(filename))
+                file_objects.append(FileObject(support, password, self._iterations, session, self._workers))
+
+            from sf2.openinram import OpenManyInRAM
+
+            OpenManyInRAM(file_objects, program, debounce, memfd).run()
 
-        open_in_ram = OpenInRAM(file_object, program)
-        open_in_ram.run()
+    def open_ssh_many(self, secrets:list, program:str, private_key_password:str=None, support_format:str="msgpack", debounce:float=None, memfd:bool=False):
+        # secrets holds the (filename, private_key_file, auth_id) of each file
+        agent = self.get_agent()
+        with ExitStack() as stack:
+            file_objects = list()
+            for filename, private_key_file, auth_id in secrets:
+                support = self.get_support(filename, support_format)
+                session = stack.enter_context(self.open_session(filename))
+                file_objects.append(SSHFileObject(support, auth_id, private_key_file, private_key_password, session, self._workers, agent))
+
+            from sf2.openinram import OpenManyInRAM
+
+            OpenManyInRAM(file_objects, program, debounce, memfd).run()
 
     def ssh_add(self, filename:str, password:str, public_key_file:str=None, auth_id:str=None, support_format:str="msgpack"):
         auth_id = self.get_auth_id(auth_id, public_key_file)
 
         support = self.get_support(filename, support_format)
-        base = ContainerBase(support)
-        container = ContainerSSH(base)
+        base = ContainerBase(support, self._workers)
+        container = ContainerSSH(base, self._wrap_pool)
         container.add_ssh_key(password, public_key_file, auth_id, self._iterations)
 
-    def ssh_rm(self, filename:str, password:str, auth_id_pattern:str=None, support_format:str="msgpack"):
+    def ssh_rm(self, filename:str, password:str, auth_id_pattern:str=None, support_format:str="msgpack", deep:bool=False):
         support = self.get_support(filename, support_format)
-        base = ContainerBase(support)
-        container = ContainerSSH(base)
-        container.remove_ssh_key(password, auth_id_pattern, self._iterations)
+        base = ContainerBase(support, self._workers)
+        container = ContainerSSH(base, self._wrap_pool)
 
-        # Once remove at least one ssh key, we need to change all keys to prevent leaked keys to be reused
-        base.change_password(password, password, self._iterations)
-        container.update_master_key(password, self._iterations)
+        # The container is loaded, verified, signed and written once
+        with base.transaction(password, self._iterations) as transaction:
+            container.remove_users(transaction.get_container(), auth_id_pattern)
+
+            # Once remove at least one ssh key, we need to change all keys to prevent leaked keys to be reused.
+            # Only a deep change protects the data from a removed user who kept the master data key
+            transaction.change_password(password, deep)
+            container.wrap_master_key(transaction.get_container(), transaction.get_master_key())
 
     def ssh_ls(self, filename:str, auth_id_pattern:str=None, support_format:str="msgpack"):
         output = list()
         support = self.get_support(filename, support_format)
-        base = ContainerBase(support)
-        container = ContainerSSH(base)
+        base = ContainerBase(support, self._workers)
+        container = ContainerSSH(base, self._wrap_pool)
         for user, pk in container.list_ssh_key(auth_id_pattern).items():
             output.append((user, pk))
 
@@ -124,23 +246,24 @@ class Core:
             raise Exception(f"file {filename} already exist")
         
         support = self.get_support(filename, support_format)
-        container = ContainerBase(support)
-        container.create(password, force)
-        container.write(b"", password)
+        container = ContainerBase(support, self._workers)
+        container.create(password, force, self._iterations)
 
-    def change_password(self, filename:str, old_password:str, new_password:str, support_format:str="msgpack"):
+    def change_password(self, filename:str, old_password:str, new_password:str, support_format:str="msgpack", deep:bool=False):
 
         support = self.get_support(filename, support_format)
-        base = ContainerBase(support)
-        container = ContainerSSH(base)
-        base.change_password(old_password, new_password, self._iterations)
-        container.update_master_key(new_password, self._iterations)
+        base = ContainerBase(support, self._workers)
+        container = ContainerSSH(base, self._wrap_pool)
+
+        with base.transaction(old_password, self._iterations) as transaction:
+            transaction.change_password(new_password, deep)
+            container.wrap_master_key(transaction.get_container(), transaction.get_master_key())
 
     def get_support(self, filename:str, support_format:str):
         if support_format == "json":
-            return JsonSupport(filename)
+            return JsonSupport(filename, self._atomic)
         elif support_format == "msgpack":
-            return MsgpackSupport(filename)
+            return MsgpackSupport(filename, self._atomic, self._mapped)
         else:
             raise Exception(f"Format {support_format} is not supported")
         
@@ -159,7 +282,17 @@ class Core:
                 key = f.read()
                 key = key.strip()
 
-            re_result = re.search(r"ssh-rsa AAAA[0-9A-Za-z+/]+[=]{0,3} ([^@]+@[^@\r\n]+)", key)
+            re_result = re.search(r"(?:ssh-rsa|ssh-ed25519) AAAA[0-9A-Za-z+/]+[=]{0,3} ([^@]+@[^@\r\n]+)", key)
             return re_result.group(1)
         
         raise Exception("No auth_id defined nor availaible in public key")
+
+
+def verify_job(settings:tuple, filename:str, *args)->tuple:
+    # Run by the workers of Core.verify_many, the Core is created in the worker process
+    with closing(Core(*settings)) as core:
+        return filename, core.verify(filename, *args)
+
+def verify_ssh_job(settings:tuple, filename:str, *args)->tuple:
+    with closing(Core(*settings)) as core:
+        return filename, core.verify_ssh(filename, *args)
@@ -1,6 +1,5 @@
 import os.path
 from pathlib import Path
-import yaml
 import socket
 from getpass import getuser
 import re
@@ -8,8 +7,8 @@ import re
 from sf2.core import Core
 
 class CoreWithEnvironment:
-    def __init__(self, _iterations:int=None, default_public_key:str=None, default_private_key:str=None, default_auth_id:str=None, default_config_file:str=None) -> None:
-        self._core = Core(_iterations)
+    def __init__(self, _iterations:int=None, default_public_key:str=None, default_private_key:str=None, default_auth_id:str=None, default_config_file:str=None, session_ttl:float=None, workers:int=None, atomic:bool=False, wrap_executor:str="threads", agent_socket:str=None, mapped:bool=False) -> None:
+        self._core = Core(_iterations, session_ttl, workers, atomic, wrap_executor, agent_socket, mapped)
 
         self._default_public_key = default_public_key
         self._default_private_key = default_private_key
@@ -23,6 +22,9 @@ class CoreWithEnvironment:
         if not os.path.exists(config_file):
             return {}
 
+        # Only needed when a configuration exists
+        import yaml
+
         with open(config_file, "r") as f:
             conf =  yaml.safe_load(f)
 
@@ -52,14 +54,34 @@ class CoreWithEnvironment:
         private_key_file, auth_id = self.get_secrets(filename, config_file, private_key_file, auth_id)
         return self._core.verify_ssh(filename, private_key_file, private_key_password, auth_id, support_format)
 
-    def open(self, filename:str, program:str, password:str=None, support_format:str="msgpack"):
-        return self._core.open(filename, program, password, support_format)
+    def verify_many(self, filenames:list, password:str=None, support_format:str="msgpack", jobs:int=None):
+        return self._core.verify_many(filenames, password, support_format, jobs)
 
-    def open_ssh(self, filename:str, program:str=None, private_key_file:str=None, private_key_password:str=None, auth_id:str=None, support_format:str="msgpack", config_file:str=None):
+    def verify_ssh_many(self, filenames:list, private_key_file:str=None, private_key_password:str=None, auth_id:str=None, support_format:str="msgpack", config_file:str=None, jobs:int=None):
+        config_file = self.get_config_file(config_file)
+        conf = self.load_configuration(config_file)
+        secrets = [(filename, *self.get_secrets(filename, config_file, private_key_file, auth_id, conf)) for filename in filenames]
+        return self._core.verify_ssh_many(secrets, private_key_password, support_format, jobs)
+
+    def open(self, filename:str, program:str, password:str=None, support_format:str="msgpack", debounce:float=None, memfd:bool=False):
+        return self._core.open(filename, program, password, support_format, debounce, memfd)
+
+    def open_ssh(self, filename:str, program:str=None, private_key_file:str=None, private_key_password:str=None, auth_id:str=None, support_format:str="msgpack", config_file:str=None, debounce:float=None, memfd:bool=False):
         config_file = self.get_config_file(config_file)
         private_key_file, auth_id = self.get_secrets(filename, config_file, private_key_file, auth_id)
         program = self.get_program(filename, config_file, program)
-        return self._core.open_ssh(filename, program, private_key_file, private_key_password, auth_id, support_format)
+        return self._core.open_ssh(filename, program, private_key_file, private_key_password, auth_id, support_format, debounce, memfd)
+
+    def open_many(self, filenames:list, program:str, password:str=None, support_format:str="msgpack", debounce:float=None, memfd:bool=False):
+        return self._core.open_many(filenames, program, password, support_format, debounce, memfd)
+
+    def open_ssh_many(self, filenames:list, program:str=None, private_key_file:str=None, private_key_password:str=None, auth_id:str=None, support_format:str="msgpack", config_file:str=None, debounce:float=None, memfd:bool=False):
+        config_file = self.get_config_file(config_file)
+        conf = self.load_configuration(config_file)
+        secrets = [(filename, *self.get_secrets(filename, config_file, private_key_file, auth_id, conf)) for filename in filenames]
+        # The program of the first file is used for all of them
+        program = self.get_program(filenames[0], config_file, program)
+        return self._core.open_ssh_many(secrets, program, private_key_password, support_format, debounce, memfd)
 
     def ssh_add(self, filename:str, password:str, public_key_file:str=None, auth_id:str=None, support_format:str="msgpack"):
         public_key_file = self.get_public_key(public_key_file)
@@ -67,10 +89,10 @@ class CoreWithEnvironment:
         
         return self._core.ssh_add(filename, password, public_key_file, auth_id, support_format)
 
-    def ssh_rm(self, filename:str, password:str, auth_id_pattern:str=None, support_format:str="msgpack", config_file:str=None):
+    def ssh_rm(self, filename:str, password:str, auth_id_pattern:str=None, support_format:str="msgpack", config_file:str=None, deep:bool=False):
         config_file = self.get_config_file(config_file)
         _, auth_id = self.get_secrets(filename, config_file, "no_key", auth_id_pattern)
-        return self._core.ssh_rm(filename, password, auth_id, support_format)
+        return self._core.ssh_rm(filename, password, auth_id, support_format, deep)
 
     def ssh_ls(self, filename:str, auth_id_pattern:str="^.*$", support_format:str="msgpack"):
         return self._core.ssh_ls(filename, auth_id_pattern, support_format)
@@ -78,9 +100,15 @@ class CoreWithEnvironment:
     def new(self, filename:str, password:str, force:bool=False, support_format:str="msgpack"):
         return self._core.new(filename, password, force, support_format)
     
-    def change_password(self, filename:str, old_password:str, new_password:str, support_format:str="msgpack"):
-        return self._core.change_password(filename, old_password, new_password, support_format)
+    def change_password(self, filename:str, old_password:str, new_password:str, support_format:str="msgpack", deep:bool=False):
+        return self._core.change_password(filename, old_password, new_password, support_format, deep)
     
+    def lock(self)->None:
+        return self._core.lock()
+
+    def close(self)->None:
+        return self._core.close()
+
     def get_default_private_key(self)->str:
         if self._default_private_key is None:
             return os.path.join(str(Path.home()), ".ssh", "id_rsa")
@@ -127,7 +155,7 @@ class CoreWithEnvironment:
             key = f.read()
             key = key.strip()
 
-        re_result = re.search(r"ssh-rsa AAAA[0-9A-Za-z+/]+[=]{0,3} ([^@]+@[^@\r\n]+)", key)
+        re_result = re.search(r"(?:ssh-rsa|ssh-ed25519) AAAA[0-9A-Za-z+/]+[=]{0,3} ([^@]+@[^@\r\n]+)", key)
         return re_result.group(1)
         
     def get_public_key(self, public_key_file:str):
@@ -138,8 +166,12 @@ class CoreWithEnvironment:
         else:
             raise Exception("Public key is not available")
     
-    def get_secrets(self, filename:str, config_file:str, private_key_file:str, auth_id:str):
-        sub_conf = self.load_specific_configuration(filename, config_file)
+    def get_secrets(self, filename:str, config_file:str, private_key_file:str, auth_id:str, conf:dict=None):
+        # conf is the configuration already loaded, when many files are handled
+        if conf is None:
+            sub_conf = self.load_specific_configuration(filename, config_file)
+        else:
+            sub_conf = conf.get(os.path.abspath(filename), {})
 
         output_private_key_file = ""
         output_auth_id = ""
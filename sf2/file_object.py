@@ -1,20 +1,31 @@
 from sf2.container_base import ContainerBase
+from sf2.key_session import KeySession
+from sf2.chunk_tracker import ChunkTracker
 
 class FileObject:
-    def __init__(self, support, password:str, _iterations:int=None) -> None:
-        self._container = ContainerBase(support)
+    def __init__(self, support, password:str, _iterations:int=None, session:KeySession=None, workers:int=None) -> None:
+        self._container = ContainerBase(support, workers)
         self._password = password
         self._iterations = _iterations
+        self._session = session
+        # Keep track of the synchronized data, so a write back only encrypts the modified chunks
+        self._tracker = ChunkTracker()
         self._info = support.get_filename()
 
     def decrypt(self)->bytes:
-        return self._container.read(self._password, self._iterations)
+        return self._container.read(self._password, self._iterations, self._session, self._tracker)
     
     def encrypt(self, path:str)->None:
         with open(path, "rb") as f:
             data = f.read()
         
-        self._container.write(data, self._password, self._iterations)
+        self._container.write(data, self._password, self._iterations, self._session, self._tracker)
+
+    def get_fingerprint(self)->tuple:
+        return self._container.get_fingerprint()
+
+    def get_data_digest(self)->bytes:
+        return self._container.get_data_digest()
 
     def __str__(self) -> str:
         return self._info
\ No newline at end of file
@@ -0,0 +1,139 @@
+import os
+import struct
+import logging
+import selectors
+from threading import Thread
+
+import inotify.calls
+import inotify.constants
+
+# struct inotify_event, followed by a name of "len" bytes
+EVENT_HEADER = "iIII"
+EVENT_HEADER_SIZE = struct.calcsize(EVENT_HEADER)
+READ_SIZE = 65536
+
+
+class InotifyWatcher:
+    """
+    Call a callback each time a file is closed after being written. The inotify descriptor is
+    watched with a selector in a thread, stopping the watcher wakes the thread up through a
+    pipe, so it is joined at once instead of waiting for the next event.
+    The watch is added by start, the writes done after it returns are never missed.
+    A file replaced by a rename is a new inode, a watch on the file would not see it. To follow
+    such files, the directory is watched instead and its events are filtered on the file name.
+    """
+
+    def __init__(self, path:str, callback:callable, mask:int=inotify.constants.IN_CLOSE_WRITE, drain:bool=True, follow_rename:bool=False) -> None:
+        """
+        :param path: The path of the watched file
+        :type path: str
+        :param callback: Called without argument for each event
+        :type callback: callable
+        :param mask: The inotify events watched
+        :type mask: int
+        :param drain: Call the callback for the events still queued when the watcher stops
+        :type drain: bool
+        :param follow_rename: Watch the directory, so a file renamed over the path is seen too
+        :type follow_rename: bool
+        """
+        self._path = path
+        self._callback = callback
+        self._mask = mask
+        self._drain = drain
+
+        # Name of the file in the watched directory, None when the file itself is watched
+        self._name = None
+        self._watched_path = path
+        if follow_rename:
+            self._mask |= inotify.constants.IN_MOVED_TO
+            self._watched_path = os.path.dirname(os.path.abspath(path))
+            self._name = bytes(os.path.basename(path), "utf8")
+
+        self._fd = None
+        self._wake_read = None
+        self._wake_write = None
+        self._buffer = b""
+        self._thread = None
+
+        self._log = logging.getLogger(self.__class__.__name__)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.stop()
+
+    def start(self)->None:
+        self._fd = inotify.calls.inotify_init()
+        os.set_blocking(self._fd, False)
+        try:
+            if self._name is not None and not os.path.exists(self._path):
+                raise FileNotFoundError(self._path)
+            inotify.calls.inotify_add_watch(self._fd, bytes(self._watched_path, "utf8"), self._mask)
+        except Exception:
+            os.close(self._fd)
+            self._fd = None
+            raise
+
+        self._wake_read, self._wake_write = os.pipe()
+
+        self._thread = Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self)->None:
+        """
+        It stops and joins the thread. The events received before are handled before it returns.
+        """
+        if self._thread is None:
+            return
+
+        os.write(self._wake_write, b"\x00")
+        self._thread.join()
+        self._thread = None
+
+        # Events queued while the thread was stopping
+        if self._drain:
+            self._read_events()
+
+        for fd in (self._fd, self._wake_read, self._wake_write):
+            os.close(fd)
+        self._fd = None
+
+    def _run(self)->None:
+        with selectors.DefaultSelector() as selector:
+            selector.register(self._fd, selectors.EVENT_READ)
+            selector.register(self._wake_read, selectors.EVENT_READ)
+
+            while True:
+                for key, _ in selector.select():
+                    if key.fd == self._wake_read:
+                        return
+                    self._read_events()
+
+    def _read_events(self)->None:
+        while True:
+            try:
+                data = os.read(self._fd, READ_SIZE)
+            except BlockingIOError:
+                return
+
+            if not data:
+                return
+
+            self._buffer += data
+            while len(self._buffer) >= EVENT_HEADER_SIZE:
+                _, mask, _, length = struct.unpack_from(EVENT_HEADER, self._buffer)
+                if len(self._buffer) < EVENT_HEADER_SIZE + length:
+                    break
+                name = self._buffer[EVENT_HEADER_SIZE:EVENT_HEADER_SIZE + length].rstrip(b"\x00")
+                self._buffer = self._buffer[EVENT_HEADER_SIZE + length:]
+
+                if mask & self._mask and (self._name is None or name == self._name):
+                    self._notify()
+
+    def _notify(self)->None:
+        try:
+            self._callback()
+        except Exception as e:
+            self._log.error(f"Callback failed for {self._path} : {e}")
@@ -0,0 +1,143 @@
+import binascii
+
+# Binary fields of a container and how they are written in JSON. Raw bytes are written in
+# base64, Fernet tokens are already base64 text and are written as they are.
+BINARY = "binary"
+TOKEN = "token"
+# A container field whose encoding depends on the version and the cipher
+DATA = "data"
+# Key matching any key of a dict, like the auth ids of the users
+ANY = "*"
+
+SCHEMA = {
+    "auth" : {
+        "master_iv" : BINARY,
+        "encrypted_master_data_key" : TOKEN,
+        "challenge" : BINARY,
+        "signature" : BINARY,
+        "users" : {
+            ANY : {
+                "ssh" : {
+                    "encrypted_master_key" : BINARY
+                }
+            }
+        },
+        "sign" : {
+            "public_key" : BINARY,
+            "encrypted_private_key" : TOKEN,
+            "auth_iv" : BINARY
+        }
+    },
+    "auth_signature" : BINARY,
+    "data" : DATA
+}
+
+# Bytes outside of the schema are written in a dict with this single key
+BYTES_KEY = "$base64"
+
+
+class JsonCodec:
+    """
+    Convert a container to and from the JSON format revision 2. Only the fields of the schema
+    are decoded from base64, text fields are never tried. The number of chunks is written
+    before the chunks, so they can be read lazily.
+    """
+    FORMAT_KEY = "json_format"
+    FORMAT = 2
+    COUNT_KEY = "count"
+
+    def is_encoded(self, container:dict)->bool:
+        # Files written before this revision don't have the format key
+        return container.get(JsonCodec.FORMAT_KEY) == JsonCodec.FORMAT
+
+    def encode(self, container:dict)->dict:
+        output = {JsonCodec.FORMAT_KEY : JsonCodec.FORMAT}
+        output.update(self._encode(container, SCHEMA))
+
+        return output
+
+    def decode(self, container:dict)->dict:
+        container = {k:v for k, v in container.items() if k != JsonCodec.FORMAT_KEY}
+
+        return self._decode(container, SCHEMA)
+
+    def encode_data(self, data):
+        if isinstance(data, bytes):
+            # Version 2, a Fernet token
+            return self.encode_value(TOKEN, data)
+
+        output = {k:v for k, v in data.items() if k != "chunks"}
+        if "chunks" in data:
+            output[JsonCodec.COUNT_KEY] = len(data["chunks"])
+            output["chunks"] = [self.encode_chunk(data, chunk) for chunk in data["chunks"]]
+
+        return output
+
+    def decode_data(self, data):
+        if isinstance(data, str):
+            return self.decode_value(TOKEN, data)
+
+        output = {k:v for k, v in data.items() if k not in ("chunks", JsonCodec.COUNT_KEY)}
+        if "chunks" in data:
+            output["chunks"] = [self.decode_chunk(data, chunk) for chunk in data["chunks"]]
+
+        return output
+
+    def encode_chunk(self, data:dict, chunk:bytes)->str:
+        return self.encode_value(self.get_chunk_kind(data), chunk)
+
+    def decode_chunk(self, data:dict, chunk:str)->bytes:
+        return self.decode_value(self.get_chunk_kind(data), chunk)
+
+    def get_chunk_kind(self, data:dict)->str:
+        return TOKEN if data.get("cipher") == "fernet" else BINARY
+
+    def encode_value(self, kind:str, value):
+        if value is None:
+            return None
+        if kind == TOKEN:
+            return str(value, "ascii")
+        return str(binascii.b2a_base64(value, newline=False), "ascii")
+
+    def decode_value(self, kind:str, value):
+        if value is None:
+            return None
+        if kind == TOKEN:
+            return bytes(value, "ascii")
+        return binascii.a2b_base64(value)
+
+    def _encode(self, value, schema):
+        if schema == DATA:
+            return self.encode_data(value)
+        if schema in (BINARY, TOKEN):
+            return self.encode_value(schema, value)
+
+        if isinstance(value, dict):
+            return {k:self._encode(v, self._get_schema(schema, k)) for k, v in value.items()}
+        if isinstance(value, list):
+            return [self._encode(v, None) for v in value]
+        if isinstance(value, bytes):
+            return {BYTES_KEY : self.encode_value(BINARY, value)}
+
+        return value
+
+    def _decode(self, value, schema):
+        if schema == DATA:
+            return self.decode_data(value)
+        if schema in (BINARY, TOKEN):
+            return self.decode_value(schema, value)
+
+        if isinstance(value, dict):
+            if len(value) == 1 and BYTES_KEY in value:
+                return self.decode_value(BINARY, value[BYTES_KEY])
+            return {k:self._decode(v, self._get_schema(schema, k)) for k, v in value.items()}
+        if isinstance(value, list):
+            return [self._decode(v, None) for v in value]
+
+        return value
+
+    def _get_schema(self, schema, key:str):
+        if not isinstance(schema, dict):
+            return None
+
+        return schema.get(key, schema.get(ANY))
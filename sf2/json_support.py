@@ -1,18 +1,33 @@
+import re
 import json
+import codecs
 import base64
 import logging
 import os.path
 
+from sf2.atomic_file import atomic_open
+from sf2.atomic_file import replace_head
+from sf2.json_codec import JsonCodec
+
 
 
 
 class JsonSupport:
     """
-    Json formated file
+    Json formated file. Binary fields are encoded following the schema of JsonCodec, files
+    written before it are still read.
     """
+    READ_SIZE = 64 * 1024
+    # Keys expected in the header of the files written before JsonCodec, a file missing one
+    # was written before the data section was last
+    HEADER_KEYS = ("auth", "auth_signature")
+    WHITESPACE = re.compile(r"\s*")
 
-    def __init__(self, filename:str) -> None:
+    def __init__(self, filename:str, atomic:bool=False) -> None:
         self._filename = filename
+        # Replace the file with an fsync'd rename instead of writing it in place
+        self._atomic = atomic
+        self._codec = JsonCodec()
 
         self._log = logging.getLogger(f"{self.__class__.__name__}({filename})")
 
@@ -38,15 +53,13 @@ class JsonSupport:
 
     def load(self)->dict:
         """
-        The function loads a JSON file and returns a dictionary. Only work with V2
+        The function loads a JSON file and returns a dictionary.
         :return: A dictionary
         """
         with open(self._filename, "r") as f:
             container = json.load(f)
 
-        bin_container = self.decode(container)
-        
-        return bin_container
+        return self.decode_container(container)
         
     def dump(self, bin_container:dict)->None:
         """
@@ -55,11 +68,203 @@ class JsonSupport:
         :param container: The container to dump to the file
         :type container: dict
         """
-        with open(self._filename, "w") as f:
-            container = self.encode(bin_container)
+        with self.open_write() as f:
+            container = self._codec.encode(self.data_last(bin_container))
             json_container = json.dumps(container, indent=4)
             f.write(json_container)
 
+    def decode_container(self, container:dict)->dict:
+        if self._codec.is_encoded(container):
+            return self._codec.decode(container)
+
+        return self.decode(container)
+
+    def load_header(self)->dict:
+        """
+        The function loads everything but the data section. The data section being written
+        last, the file is parsed up to it and the data bytes are never read.
+        :return: A dictionary, without the data section
+        """
+        with open(self._filename, "rb") as f:
+            layout = self._read_header(f)
+
+        if layout is None:
+            return {k:v for k, v in self.load().items() if k != "data"}
+
+        return self.decode_container(layout[0])
+
+    def dump_header(self, bin_container:dict)->None:
+        """
+        The function writes everything but the data section, which is kept as it is in the file.
+
+        :param container: The container to dump, its data section is ignored
+        :type container: dict
+        """
+        bin_container = {k:v for k, v in bin_container.items() if k != "data"}
+
+        with open(self._filename, "rb") as f:
+            layout = self._read_header(f)
+
+        # The data of older files is encoded differently, they are written again entirely
+        if layout is not None and layout[2] is not None and self._codec.is_encoded(layout[0]):
+            # The same text dump writes, up to the value of the data section
+            json_container = json.dumps(self._codec.encode(bin_container), indent=4)
+            head = json_container[:-2] + ',\n    "data": '
+
+            replace_head(self._filename, layout[2], bytes(head, "utf8"), self._atomic)
+            return
+
+        bin_container["data"] = self.load()["data"]
+        self.dump(bin_container)
+
+    def _read_header(self, f)->tuple:
+        # The encoded container without data, the reader and the position in bytes of the data
+        # section, None if the file was written before the data section was last
+        reader = HeaderReader(f)
+        container = dict()
+
+        reader.expect("{")
+        while reader.peek() != "}":
+            if len(container) > 0:
+                reader.expect(",")
+
+            key = reader.value()
+            reader.expect(":")
+
+            if key == "data":
+                reader.skip_whitespace()
+                if not self._codec.is_encoded(container) and not all(k in container for k in JsonSupport.HEADER_KEYS):
+                    return None
+
+                return container, reader, reader.tell()
+
+            container[key] = reader.value()
+
+        return container, reader, None
+
+    def load_stream(self)->dict:
+        """
+        The function loads a JSON file, but the chunks of the data section (v3) are read
+        lazily, one by one, while they are iterated.
+        :return: A dictionary
+        """
+        f = open(self._filename, "rb")
+        try:
+            layout = self._read_header(f)
+            if layout is None or layout[2] is None or not self._codec.is_encoded(layout[0]):
+                f.close()
+                return self.load()
+
+            encoded, reader, _ = layout
+            container = self._codec.decode(encoded)
+
+            if reader.peek() != "{":
+                # Version 2, a single token
+                container["data"] = self._codec.decode_data(reader.value())
+                f.close()
+                return container
+
+            data = dict()
+            reader.expect("{")
+            while reader.peek() != "}":
+                if len(data) > 0:
+                    reader.expect(",")
+
+                key = reader.value()
+                reader.expect(":")
+
+                if key == "chunks" and JsonCodec.COUNT_KEY in data:
+                    count = data.pop(JsonCodec.COUNT_KEY)
+                    data["chunks"] = JsonChunkReader(f, reader, count, lambda chunk : self._codec.decode_chunk(data, chunk))
+                    container["data"] = data
+                    return container
+
+                data[key] = reader.value()
+
+            f.close()
+            container["data"] = self._codec.decode_data(data)
+            return container
+        except:
+            f.close()
+            raise
+
+    def dump_stream(self, container:dict, chunks, count:int)->None:
+        """
+        The function writes a container whose data chunks are provided by an iterable,
+        so they don't need to be all in memory.
+        
+        :param container: The container to dump, its data section without chunks
+        :type container: dict
+        :param chunks: An iterable of encrypted chunks
+        :param count: The number of chunks
+        :type count: int
+        """
+        data = {k:v for k, v in container["data"].items() if k != "chunks"}
+        container = {k:v for k, v in container.items() if k != "data"}
+        container["data"] = data
+
+        # The chunks are written in place of a marker, so the rest is formatted as usual
+        marker = "__sf2_chunks__"
+        encoded = self._codec.encode(container)
+        encoded["data"][JsonCodec.COUNT_KEY] = count
+        encoded["data"]["chunks"] = marker
+
+        with self.open_write() as f:
+            json_container = json.dumps(encoded, indent=4)
+            prefix, suffix = json_container.split(json.dumps(marker))
+
+            f.write(prefix + "[")
+            written = 0
+            for chunk in chunks:
+                if written > 0:
+                    f.write(",")
+                f.write("\n" + " " * 12 + json.dumps(self._codec.encode_chunk(data, chunk)))
+                written += 1
+            f.write("\n" + " " * 8 + "]" + suffix)
+
+        if written != count:
+            raise Exception(f"{written} chunks written instead of {count}")
+
+    def patch_chunks(self, container:dict, chunks:dict, count:int)->bool:
+        """
+        JSON chunks don't have a fixed size, they can't be written in place.
+        :return: False, the container must be dumped entirely.
+        """
+        return False
+
+    def open_write(self):
+        if self._atomic:
+            return atomic_open(self._filename, "w")
+
+        return open(self._filename, "w")
+
+    def get_fingerprint(self)->tuple:
+        """
+        It returns a cheap fingerprint of the file, which changes when the file is written.
+        :return: A tuple (inode, size, modification time).
+        """
+        stat = os.stat(self._filename)
+        return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+    def data_last(self, container:dict)->dict:
+        """
+        It returns the container with the data section at the end, so the header can be read
+        without reading the data.
+
+        :param container: The container
+        :type container: dict
+        :return: The reordered container.
+        """
+        if "data" not in container:
+            return container
+
+        output = {k:v for k, v in container.items() if k != "data"}
+        output["data"] = container["data"]
+
+        return output
+
+    # Encoding of the files written before JsonCodec, every string is tried as base64
+
     def encode(self, container:dict)->dict:
         return self._walk(container, self._callback_encode)
     
@@ -100,3 +305,115 @@ class JsonSupport:
     
     def is_exist(self)->bool:
         return os.path.exists(self._filename)
+
+
+class HeaderReader:
+    """
+    Minimal JSON tokenizer reading a file block by block, so the top level values can be
+    parsed one by one without reading the following ones.
+    """
+    def __init__(self, f) -> None:
+        self._f = f
+        self._decoder = codecs.getincrementaldecoder("utf8")()
+        self._json_decoder = json.JSONDecoder()
+        self._text = ""
+        self._position = 0
+        # Bytes of the text dropped from the buffer
+        self._offset = 0
+        self._eof = False
+
+    def _read(self, size:int=None)->bool:
+        if self._eof:
+            return False
+
+        block = self._f.read(size or JsonSupport.READ_SIZE)
+        self._eof = len(block) == 0
+        self._text += self._decoder.decode(block, self._eof)
+
+        return not self._eof
+
+    def skip_whitespace(self)->None:
+        while True:
+            self._position = JsonSupport.WHITESPACE.match(self._text, self._position).end()
+            if self._position < len(self._text) or not self._read():
+                return
+
+    def peek(self)->str:
+        self.skip_whitespace()
+        if self._position >= len(self._text):
+            raise ValueError("Unexpected end of JSON file")
+
+        return self._text[self._position]
+
+    def expect(self, token:str)->None:
+        if self.peek() != token:
+            raise ValueError(f"Expected {token} at {self.tell()}")
+
+        self._position += 1
+
+    def value(self):
+        self.skip_whitespace()
+        while True:
+            try:
+                value, end = self._json_decoder.raw_decode(self._text, self._position)
+                # A number may continue in the next block
+                if end < len(self._text) or self._eof:
+                    break
+            except json.JSONDecodeError:
+                if self._eof:
+                    raise
+
+            # The buffer size is doubled, so a big value is not parsed again for each block
+            self._read(max(JsonSupport.READ_SIZE, len(self._text)))
+
+        self._position = end
+
+        # Parsed text is not needed anymore
+        self._offset += len(bytes(self._text[:self._position], "utf8"))
+        self._text = self._text[self._position:]
+        self._position = 0
+
+        return value
+
+    def tell(self)->int:
+        return self._offset + len(bytes(self._text[:self._position], "utf8"))
+
+
+class JsonChunkReader:
+    """
+    Sized iterable over the chunks of a JSON file, parsed one by one. The file is closed once
+    iterated. Reading a chunk by index loads all of them.
+    """
+    def __init__(self, f, reader:HeaderReader, count:int, decode) -> None:
+        self._f = f
+        self._reader = reader
+        self._count = count
+        self._decode = decode
+        self._chunks = None
+
+    def __len__(self)->int:
+        return self._count
+
+    def __iter__(self):
+        if self._chunks is not None:
+            yield from self._chunks
+            return
+
+        try:
+            self._reader.expect("[")
+            for index in range(self._count):
+                if index > 0:
+                    self._reader.expect(",")
+                yield self._decode(self._reader.value())
+            self._reader.expect("]")
+        finally:
+            self.close()
+
+    def __getitem__(self, index:int)->bytes:
+        if self._chunks is None:
+            self._chunks = list(self)
+
+        return self._chunks[index]
+
+    def close(self)->None:
+        self._f.close()
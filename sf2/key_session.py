@@ -0,0 +1,150 @@
+import time
+import hmac
+import secrets
+import logging
+from hashlib import sha256
+from threading import Lock
+
+
+class KeySession:
+    """
+    Keep the keys of an unlocked container in memory.
+    Once unlocked, reads and writes reuse the master key and the master data key
+    instead of running the KDF (or the RSA decryption) again. Keys expire after
+    a time-to-live and are wiped when the session is locked.
+    The keys are only given back to the credential that unlocked the session, the password or
+    the private key. Only a keyed digest of the credential is kept.
+    """
+    DEFAULT_TTL = 300
+
+    def __init__(self, ttl:float=None, _clock:callable=time.monotonic) -> None:
+        if ttl is None:
+            ttl = KeySession.DEFAULT_TTL
+
+        self._ttl = ttl
+        self._clock = _clock
+        self._lock = Lock()
+        # Key of the credential digests, it never leaves the session
+        self._digest_key = secrets.token_bytes(32)
+
+        self._master_key = None
+        self._master_data_key = None
+        self._encrypted_master_data_key = None
+        self._credential = None
+        self._expire_at = None
+
+        self._log = logging.getLogger(self.__class__.__name__)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.lock()
+
+    def unlock(self, master_key:bytes, master_data_key:bytes, encrypted_master_data_key:bytes, credential:bytes=None)->None:
+        """
+        It stores the keys of a container and starts the time-to-live
+
+        :param master_key: The master key, derived from the password or decrypted with a SSH key
+        :type master_key: bytes
+        :param master_data_key: The master data key, used to encrypt the data
+        :type master_data_key: bytes
+        :param encrypted_master_data_key: The master data key as stored in the container
+        :type encrypted_master_data_key: bytes
+        :param credential: The password or the private key which unlocked the keys
+        :type credential: bytes
+        """
+        if isinstance(master_data_key, str):
+            master_data_key = bytes(master_data_key, "utf8")
+
+        with self._lock:
+            self._wipe()
+            self._master_key = bytearray(master_key)
+            self._master_data_key = bytearray(master_data_key)
+            self._encrypted_master_data_key = bytes(encrypted_master_data_key)
+            self._credential = self._digest(credential)
+            self._expire_at = self._clock() + self._ttl
+
+    def is_unlocked(self)->bool:
+        """
+        It returns True if the session holds keys that are not expired. Expired keys are wiped.
+        :return: a boolean value.
+        """
+        with self._lock:
+            return self._check()
+
+    def get_master_key(self, credential:bytes=None)->bytes:
+        """
+        It returns a copy of the master key, or None if the session is locked, expired or was
+        unlocked by another credential
+
+        :param credential: The password or the private key given by the caller
+        :type credential: bytes
+        :return: The master key.
+        """
+        with self._lock:
+            if not self._check() or not self._match(credential):
+                return None
+            return bytes(self._master_key)
+
+    def get_master_data_key(self, encrypted_master_data_key:bytes, credential:bytes=None)->bytes:
+        """
+        It returns a copy of the master data key if it was unlocked from the given encrypted master data key.
+
+        :param encrypted_master_data_key: The encrypted master data key of the container
+        :type encrypted_master_data_key: bytes
+        :param credential: The password or the private key given by the caller
+        :type credential: bytes
+        :return: The master data key, or None if the session is locked, expired or doesn't match.
+        """
+        with self._lock:
+            if not self._check() or not self._match(credential):
+                return None
+            if self._encrypted_master_data_key != encrypted_master_data_key:
+                return None
+            return bytes(self._master_data_key)
+
+    def lock(self)->None:
+        """
+        It wipes the keys from memory. The session must be unlocked again to be used.
+        """
+        with self._lock:
+            self._wipe()
+
+    def _check(self)->bool:
+        if self._master_key is None:
+            return False
+
+        if self._clock() >= self._expire_at:
+            self._log.debug("Session expired")
+            self._wipe()
+            return False
+
+        return True
+
+    def _match(self, credential:bytes)->bool:
+        if not hmac.compare_digest(self._digest(credential) or b"", self._credential or b""):
+            self._log.debug("Session unlocked by another credential")
+            return False
+
+        return True
+
+    def _digest(self, credential:bytes)->bytes:
+        if credential is None:
+            return None
+        if isinstance(credential, str):
+            credential = bytes(credential, "utf8")
+
+        return hmac.new(self._digest_key, credential, sha256).digest()
+
+    def _wipe(self)->None:
+        # Python can't guarantee that no copy remains, but the session's own buffers are zeroized
+        for key in (self._master_key, self._master_data_key):
+            if key is not None:
+                key[:] = bytes(len(key))
+
+        self._master_key = None
+        self._master_data_key = None
+        self._encrypted_master_data_key = None
+        self._credential = None
+        self._expire_at = None
@@ -0,0 +1,62 @@
+import os
+import fcntl
+
+# A sealed file can't be written, resized or unsealed
+SEALS = fcntl.F_SEAL_SEAL | fcntl.F_SEAL_SHRINK | fcntl.F_SEAL_GROW | fcntl.F_SEAL_WRITE
+
+
+class Memfd:
+    """
+    A plain text file in anonymous memory, with no entry in any directory. Programs open it
+    through the path of the descriptor in /proc. A sealed file can't be modified by anyone,
+    writing new data creates a new sealed file and replaces the descriptor, so the next opening
+    of the path reads the new data while the programs having it open keep the old one.
+    """
+
+    def __init__(self, name:str, sealed:bool=False) -> None:
+        self._name = name
+        self._sealed = sealed
+        self._fd = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.close()
+
+    @property
+    def path(self)->str:
+        # The descriptor of this process, so children don't need to inherit it
+        return f"/proc/{os.getpid()}/fd/{self._fd}"
+
+    def write(self, data:bytes)->None:
+        """
+        It replaces the content of the file.
+
+        :param data: The plain data
+        :type data: bytes
+        """
+        flags = os.MFD_CLOEXEC
+        if self._sealed:
+            flags |= os.MFD_ALLOW_SEALING
+
+        fd = os.memfd_create(self._name, flags)
+        try:
+            with open(fd, "wb", closefd=False) as f:
+                f.write(data)
+            if self._sealed:
+                fcntl.fcntl(fd, fcntl.F_ADD_SEALS, SEALS)
+        except Exception:
+            os.close(fd)
+            raise
+
+        if self._fd is None:
+            self._fd = fd
+        else:
+            os.dup2(fd, self._fd, inheritable=False)
+            os.close(fd)
+
+    def close(self)->None:
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
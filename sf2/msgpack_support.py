@@ -1,7 +1,11 @@
+import mmap
 import msgpack
 import logging
 import os.path
 
+from sf2.atomic_file import atomic_open
+from sf2.atomic_file import replace_head
+
 
 
 
@@ -9,12 +13,21 @@ class MsgpackSupport:
     """
     Message pack formated file
     """
+    READ_SIZE = 64 * 1024
 
-    def __init__(self, filename:str) -> None:
+    def __init__(self, filename:str, atomic:bool=False, mapped:bool=False) -> None:
         self._filename = filename
-
+        # Replace the file with an fsync'd rename instead of writing it in place
+        self._atomic = atomic
         self._log = logging.getLogger(f"{self.__class__.__name__}({filename})")
 
+        # Chunks loaded by load_stream are memoryviews of a read only mapping of the file. A file
+        # truncated while it is mapped kills the reader with a SIGBUS, it is only mapped when
+        # every writer replaces it by a rename instead of writing it in place.
+        self._mapped = mapped and atomic
+        if mapped and not atomic:
+            self._log.warning("Not mapped, the file can be written in place, atomic mode is needed")
+
    
     def load(self)->dict:
         """
@@ -35,14 +48,399 @@ class MsgpackSupport:
         :param container: The container to dump to the file
         :type container: dict
         """
-        with open(self._filename, "wb") as f:
-            msgpack_container = msgpack.packb(container)
+        with self.open_write() as f:
+            msgpack_container = msgpack.packb(self.data_last(container))
             f.write(msgpack_container)
 
-        
+
+    def load_header(self)->dict:
+        """
+        The function loads everything but the data section. The data section being written
+        last, the data bytes are never read.
+        :return: A dictionary, without the data section
+        """
+        with open(self._filename, "rb") as f:
+            layout = self._read_header(f)
+
+        if layout is None:
+            # Written before the data section was last
+            return {k:v for k, v in self.load().items() if k != "data"}
+
+        return layout[0]
+
+    def dump_header(self, container:dict)->None:
+        """
+        The function writes everything but the data section, which is kept as it is in the file.
+
+        :param container: The container to dump, its data section is ignored
+        :type container: dict
+        """
+        container = {k:v for k, v in container.items() if k != "data"}
+
+        with open(self._filename, "rb") as f:
+            layout = self._read_header(f)
+
+        if layout is not None and layout[1] is not None:
+            packer = msgpack.Packer()
+            head = [packer.pack_map_header(len(container) + 1)]
+            for key, value in container.items():
+                head.append(packer.pack(key))
+                head.append(packer.pack(value))
+            head.append(packer.pack("data"))
+
+            replace_head(self._filename, layout[1], b"".join(head), self._atomic)
+            return
+
+        container["data"] = self.load()["data"]
+        self.dump(container)
+
+    def _read_header(self, f)->tuple:
+        # The container without data and the position of the data section, None if it is not last
+        unpacker = msgpack.Unpacker(f, read_size=MsgpackSupport.READ_SIZE)
+        container = dict()
+
+        size = unpacker.read_map_header()
+        for i in range(size):
+            key = unpacker.unpack()
+
+            if key == "data":
+                if i != size - 1:
+                    return None
+                return container, unpacker.tell()
+
+            container[key] = unpacker.unpack()
+
+        return container, None
+
+    def load_stream(self)->dict:
+        """
+        The function loads a Message pack file, but the chunks of the data section (v3) are
+        read lazily, one by one, while they are iterated. In mapped mode, chunks are not
+        copied, they are slices of a mapping of the file.
+        :return: A dictionary
+        """
+        f = open(self._filename, "rb")
+        try:
+            unpacker = msgpack.Unpacker(f, read_size=MsgpackSupport.READ_SIZE)
+            container = dict()
+
+            size = unpacker.read_map_header()
+            for i in range(size):
+                key = unpacker.unpack()
+
+                if key == "data" and i == size - 1:
+                    data = self._load_stream_data(f, unpacker)
+                    if data is not None:
+                        container[key] = data
+                        return container
+
+                container[key] = unpacker.unpack()
+
+            f.close()
+            return container
+        except:
+            f.close()
+            raise
+
+    def _load_stream_data(self, f, unpacker)->dict:
+        try:
+            size = unpacker.read_map_header()
+        except ValueError:
+            # Not a chunked data section
+            return None
+
+        data = dict()
+        for i in range(size):
+            key = unpacker.unpack()
+
+            if key == "chunks" and i == size - 1:
+                data[key] = ChunkReader(f, unpacker, unpacker.read_array_header(), self._mapped)
+                return data
+
+            data[key] = unpacker.unpack()
+
+        f.close()
+        return data
+
+    def dump_stream(self, container:dict, chunks, count:int)->None:
+        """
+        The function writes a container whose data chunks are provided by an iterable,
+        so they don't need to be all in memory.
+
+        :param container: The container to dump, its data section without chunks
+        :type container: dict
+        :param chunks: An iterable of encrypted chunks
+        :param count: The number of chunks
+        :type count: int
+        """
+        packer = msgpack.Packer()
+
+        with self.open_write() as f:
+            header, data_header = self._pack_header(container, count)
+            f.write(header + data_header)
+
+            written = 0
+            for chunk in chunks:
+                f.write(packer.pack(chunk))
+                written += 1
+
+        if written != count:
+            raise Exception(f"{written} chunks written instead of {count}")
+
+    def _pack_header(self, container:dict, count:int)->tuple:
+        # Everything before the chunks, split before the value of the data section
+        packer = msgpack.Packer()
+        container = self.data_last(container)
+        data = {k:v for k, v in container["data"].items() if k != "chunks"}
+
+        header = [packer.pack_map_header(len(container))]
+        for key, value in container.items():
+            header.append(packer.pack(key))
+            if key != "data":
+                header.append(packer.pack(value))
+
+        data_header = [packer.pack_map_header(len(data) + 1)]
+        for key, value in data.items():
+            data_header.append(packer.pack(key))
+            data_header.append(packer.pack(value))
+
+        data_header.append(packer.pack("chunks"))
+        data_header.append(packer.pack_array_header(count))
+
+        return b"".join(header), b"".join(data_header)
+
+    def patch_chunks(self, container:dict, chunks:dict, count:int)->bool:
+        """
+        The function writes in place the given chunks and the data section header of a file
+        written by dump or dump_stream, then truncates the file after the last chunk. The other
+        chunks are left untouched. The chunks from the first one whose last chunk flag changed
+        up to the end must be provided.
+        It is only used in non atomic mode: the file is changed in place, so a crash in the middle
+        of a patch leaves a broken container, and readers can see it partially written. In atomic
+        mode, the container is always dumped entirely to a new file.
+
+        :param container: The container, its data section without chunks
+        :type container: dict
+        :param chunks: The encrypted chunks to write, by index
+        :type chunks: dict
+        :param count: The new number of chunks
+        :type count: int
+        :return: False if the layout of the file changed and the container must be dumped entirely.
+        """
+        if self._atomic:
+            return False
+
+        packer = msgpack.Packer()
+        header, data_header = self._pack_header(container, count)
+        records = {index:packer.pack(chunk) for index, chunk in chunks.items()}
+
+        with open(self._filename, "r+b") as f:
+            layout = self._read_layout(f)
+            if layout is None:
+                return False
+
+            offset, old_count, record_size = layout
+
+            # Header values can be encoded on more bytes, then every chunk would move
+            if offset != len(header) + len(data_header):
+                return False
+
+            f.seek(0)
+            if f.read(len(header)) != header:
+                return False
+
+            for index in range(min(count, old_count) - 1, count):
+                if count != old_count and index not in records:
+                    return False
+
+            for index, record in records.items():
+                if index < count - 1:
+                    if record_size is None:
+                        record_size = len(record)
+                    elif len(record) != record_size:
+                        return False
+
+            f.seek(len(header))
+            f.write(data_header)
+
+            for index in sorted(records):
+                f.seek(offset + index * (record_size or 0))
+                f.write(records[index])
+
+            if count - 1 in records:
+                f.truncate(f.tell())
+
+            f.flush()
+            os.fsync(f.fileno())
+
+        return True
+
+    def _read_layout(self, f)->tuple:
+        # Position of the first chunk, number of chunks and size of a full chunk record
+        f.seek(0)
+        unpacker = msgpack.Unpacker(f, read_size=MsgpackSupport.READ_SIZE)
+
+        size = unpacker.read_map_header()
+        for _ in range(size - 1):
+            unpacker.skip()
+            unpacker.skip()
+
+        if unpacker.unpack() != "data":
+            return None
+
+        try:
+            size = unpacker.read_map_header()
+        except ValueError:
+            return None
+
+        for _ in range(size - 1):
+            unpacker.skip()
+            unpacker.skip()
+
+        if unpacker.unpack() != "chunks":
+            return None
+
+        count = unpacker.read_array_header()
+        offset = unpacker.tell()
+
+        record_size = None
+        if count > 1:
+            unpacker.skip()
+            record_size = unpacker.tell() - offset
+
+        return offset, count, record_size
+
+    def open_write(self):
+        if self._atomic:
+            return atomic_open(self._filename, "wb")
+
+        return open(self._filename, "wb")
+
+    def get_fingerprint(self)->tuple:
+        """
+        It returns a cheap fingerprint of the file, which changes when the file is written.
+        :return: A tuple (inode, size, modification time).
+        """
+        stat = os.stat(self._filename)
+        return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+    def data_last(self, container:dict)->dict:
+        """
+        It returns the container with the data section at the end, so the header can be read
+        without reading the data.
+
+        :param container: The container
+        :type container: dict
+        :return: The reordered container.
+        """
+        if "data" not in container:
+            return container
+
+        output = {k:v for k, v in container.items() if k != "data"}
+        output["data"] = container["data"]
+
+        return output
+
     def get_filename(self)->str:
         return self._filename
     
     
     def is_exist(self)->bool:
         return os.path.exists(self._filename)
+
+
+class ChunkReader:
+    """
+    Sized iterable over the chunks of a Message pack file. The file is closed once iterated.
+    Chunks can also be read by index: all chunks but the last one have the same size, so
+    their position is computed and only the requested chunk is read.
+    When mapped, the file is mapped in memory and chunks are memoryviews of the mapping, so
+    they are decrypted without being copied. The file must not be truncated while they are
+    used, the process would get a SIGBUS: MsgpackSupport only maps files written atomically.
+    """
+    def __init__(self, f, unpacker, count:int, mapped:bool=False) -> None:
+        self._f = f
+        self._unpacker = unpacker
+        self._count = count
+        self._offset = unpacker.tell()
+        self._record_size = None
+
+        self._mapping = None
+        self._view = None
+        self._dropped = 0
+        if mapped and count > 0:
+            self._mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._view = memoryview(self._mapping)
+
+    def __len__(self)->int:
+        return self._count
+
+    def __iter__(self):
+        try:
+            position = self._offset
+            for _ in range(self._count):
+                if self._view is not None:
+                    self._drop_pages(position)
+                    start, position = self._bin_bounds(position)
+                    yield self._view[start:position]
+                else:
+                    yield self._unpacker.unpack()
+        finally:
+            self.close()
+
+    def _drop_pages(self, position:int)->None:
+        # Pages of the chunks already read leave the process memory. A chunk still being
+        # decrypted is read again from the file, the mapping being read only.
+        end = position - position % mmap.PAGESIZE
+        if end > self._dropped:
+            self._mapping.madvise(mmap.MADV_DONTNEED, self._dropped, end - self._dropped)
+            self._dropped = end
+
+    def __getitem__(self, index:int)->bytes:
+        if index < 0 or index >= self._count:
+            raise IndexError(f"Chunk {index} is out of range")
+
+        if self._record_size is None:
+            self._record_size = self._read_at(self._offset)[1] - self._offset
+
+        return self._read_at(self._offset + index * self._record_size)[0]
+
+    def _read_at(self, position:int)->tuple:
+        if self._view is not None:
+            start, end = self._bin_bounds(position)
+            return self._view[start:end], end
+
+        self._f.seek(position)
+        unpacker = msgpack.Unpacker(self._f, read_size=MsgpackSupport.READ_SIZE)
+        chunk = unpacker.unpack()
+
+        return chunk, position + unpacker.tell()
+
+    def _bin_bounds(self, position:int)->tuple:
+        # Position of the payload of a bin record and position of the next record
+        tag = self._view[position]
+        if tag == 0xc4:
+            start = position + 2
+        elif tag == 0xc5:
+            start = position + 3
+        elif tag == 0xc6:
+            start = position + 5
+        else:
+            raise ValueError(f"Chunk at {position} is not a binary")
+
+        size = int.from_bytes(self._view[position + 1:start], "big")
+        if start + size > len(self._view):
+            raise ValueError(f"Chunk at {position} is truncated")
+
+        return start, start + size
+
+    def close(self)->None:
+        self._f.close()
+
+        if self._mapping is not None:
+            try:
+                self._view.release()
+                self._mapping.close()
+            except BufferError:
+                # Chunks are still used, the mapping is closed once they are released
+                pass
@@ -1,19 +1,34 @@
 from tempfile import mkstemp
+from tempfile import mkdtemp
 import os
-from threading import Thread
+import shutil
+from functools import partial
+from contextlib import contextmanager
+from contextlib import ExitStack
+from concurrent.futures import ThreadPoolExecutor
 import logging
 import re
 
-import inotify.adapters
 from flufl.lock import Lock
 from flufl.lock import TimeOutError
 
+from sf2.write_back_queue import WriteBackQueue
+from sf2.inotify_watcher import InotifyWatcher
+from sf2.memfd import Memfd
+
 RAMFS = "/dev/shm"
+# Placeholders of the plain text files and of their directory in a command
+PLACEHOLDER = r"[\{\[]\s*(filename\d*|dir)\s*[\}\]]"
+
+
+def use_memfd(memfd:bool)->bool:
+    # Without the RAMFS, the plain text files can only be kept in memory files
+    return memfd or not os.path.isdir(RAMFS)
 
 # The `OpenInRAM` class is a Python class that provides methods for encrypting and decrypting files,
 # running commands on them, and monitoring changes to the files.
 class OpenInRAM:
-    def __init__(self, file_object, command:str):
+    def __init__(self, file_object, command:str, debounce:float=None, memfd:bool=False):
         """
         This is the constructor for a class that takes a file object and a command string as arguments,
         initializes some instance variables, and logs some debug information.
@@ -24,11 +39,22 @@ class OpenInRAM:
         is passed to the `interpole_command` method to replace any placeholders with actual values
         before being executed
         :type command: str
+        :param debounce: Seconds without writes before the plain text file is encrypted again, so a
+        burst of writes is encrypted once
+        :type debounce: float
+        :param memfd: Keep the plain text file in an anonymous memory file instead of the RAMFS
+        :type memfd: bool
         """
         
         self._file_object = file_object
+        self._debounce = debounce
+        self._memfd_mode = use_memfd(memfd)
+        # The memory file of the opened container, in memfd mode
+        self._memfd = None
+        # Fingerprint of the container file and digest of its data, when the plain text file
+        # was last read back
+        self._read_state = None
         self._log = logging.getLogger(f"{self.__class__.__name__}({file_object})")
-        self._running = False
 
         self._command = self.interpole_command(command)
         self._log.debug(f"Command : {self._command}")
@@ -51,39 +77,25 @@ class OpenInRAM:
             command = re.sub(r"[\[]\s*filename\s*[\]]", "{filename}", command)
             return command
         
-    def on_write_inotify_thread(self, source_path:str, destination_path:str, callback:callable):
+    def watch(self, source_path:str, destination_path:str, callback:callable, drain:bool=True, follow_rename:bool=False)->InotifyWatcher:
         """
-        This function uses inotify to monitor a source directory for changes and calls a callback
-        function when a file is written to the destination directory.
-        
-        :param source_path: The path of the directory being watched for changes
+        This function returns a watcher calling the callback with the destination path each time
+        the source file is written. It is used as a context manager: the watch is added on enter,
+        and on exit the watcher thread is joined once the last events are handled.
+
+        :param source_path: The path of the file being watched for changes
         :type source_path: str
-        :param destination_path: The `destination_path` parameter is a string that represents the path
-        of the destination file or directory where the contents of the source file or directory will be
-        copied to
+        :param destination_path: The path given to the callback
         :type destination_path: str
-        :param callback: The `callback` parameter is a callable function that will be executed when a
-        file is written to the `source_path` directory. The `destination_path` parameter is passed as an
-        argument to the `callback` function
+        :param callback: The function called when the source file is written
         :type callback: callable
-        :return: nothing explicitly, but it will return implicitly if the condition `if not
-        self._running` is met. In that case, the function will exit and return control to the calling
-        function.
+        :param drain: Handle the events still queued when the watcher stops
+        :type drain: bool
+        :param follow_rename: Also handle a file renamed over the source path
+        :type follow_rename: bool
+        :return: The watcher, not started.
         """
-        i = inotify.adapters.Inotify()
-
-        i.add_watch(source_path)
-
-        for event in i.event_gen():
-
-            if not self._running:
-                return
-
-            if event is not None:
-                (_, type_names, _, _) = event
-
-                if "IN_CLOSE_WRITE" in type_names:
-                    callback(destination_path)
+        return InotifyWatcher(source_path, partial(callback, destination_path), drain=drain, follow_rename=follow_rename)
 
     def write_back_callback(self, file_to_encrypt:str):
         """
@@ -100,6 +112,38 @@ class OpenInRAM:
         except FileNotFoundError as e:
             self._log.debug(f"No Sync plain ({file_to_encrypt}) : {e}")
 
+    def get_read_state(self)->tuple:
+        """
+        This function returns the fingerprint of the container file (inode, size, modification
+        time) and the digest of its encrypted data. They are read before the data is decrypted,
+        so a write done in between is seen as a change by the next check.
+
+        :return: a tuple (fingerprint, digest).
+        """
+        return self._file_object.get_fingerprint(), self._file_object.get_data_digest()
+
+    def is_changed(self)->bool:
+        """
+        This function checks if the data of the container changed since the last read back. The
+        digest is only computed when the fingerprint changed, the container is never decrypted.
+
+        :return: a boolean value.
+        """
+        if self._read_state is None:
+            return True
+
+        fingerprint = self._file_object.get_fingerprint()
+        if fingerprint == self._read_state[0]:
+            return False
+
+        digest = self._file_object.get_data_digest()
+        if digest == self._read_state[1]:
+            # Only the header changed, like a new SSH key
+            self._read_state = (fingerprint, digest)
+            return False
+
+        return True
+
     def read_back_callback(self, plain_text_path:str):
         """
         This function reads a decrypted file and writes it to a plain text file with restricted
@@ -109,7 +153,19 @@ class OpenInRAM:
         path where the decrypted data will be written to
         :type plain_text_path: str
         """
+        if not self.is_changed():
+            self._log.debug(f"No sync plain ({plain_text_path}), the encrypted data did not change")
+            return
+
+        read_state = self.get_read_state()
         decrypted = self._file_object.decrypt()
+        self._read_state = read_state
+        if self._memfd is not None:
+            # A new sealed memory file replaces the old one
+            self._memfd.write(decrypted)
+            self._log.debug(f"Sync plain ({plain_text_path}) from encrypted")
+            return
+
         try:
             os.chmod(plain_text_path, 0o600)
             with open(plain_text_path, 'wb') as f:
@@ -120,94 +176,311 @@ class OpenInRAM:
         except Exception as e:
             self._log.warning(f"Failed to sync : {e}")
 
-    def run_write(self):
+    def decrypt(self, writable:bool)->bytes:
         """
-        This function decrypts a file, creates a temporary file, writes the decrypted content to the
-        temporary file, monitors changes to the temporary file, runs a command using the temporary file
-        as input, and then removes the temporary file.
+        This function decrypts the container. In read only mode, the state of the container is
+        kept first, so the next changes are detected.
+
+        :param writable: True if the container is opened in R/W
+        :type writable: bool
+        :return: the plain data.
         """
-        decrypted = self._file_object.decrypt()
+        if not writable:
+            self._read_state = self.get_read_state()
+
+        return self._file_object.decrypt()
+
+    @contextmanager
+    def write_back(self, path:str):
+        """
+        This function writes the modifications of the plain text file back to the encrypted file
+        until the end of the block.
+
+        :param path: The path of the plain text file
+        :type path: str
+        """
+        # Run a thread that monitor file change.
+        # This way, modification are automatically write back to the encrypted file.
+        # The watcher is stopped first, then the queue syncs the last write, so the
+        # file is always written back before being removed
+        with WriteBackQueue(self.write_back_callback, self._debounce) as write_back:
+            with self.watch(path, path, write_back.push):
+                yield path
 
+        self._log.info(f"{write_back.syncs} sync(s) for {write_back.requests} write(s), {write_back.coalesced} coalesced")
+
+    @contextmanager
+    def read_back(self, path:str):
+        """
+        This function reads the encrypted file back to the plain text file each time it changes,
+        until the end of the block.
+
+        :param path: The path of the plain text file
+        :type path: str
+        """
+        # Run a thread that monitor file change.
+        # This way, modification of the encrypted file are automatically read back.
+        # The plain text file is removed after, the last changes are not read.
+        # An atomic writer renames a new file over the container, the directory is watched.
+        with self.watch(str(self._file_object), path, self.read_back_callback, drain=False, follow_rename=True):
+            yield path
+
+    @contextmanager
+    def open_write(self, path:str, decrypted:bytes):
+        """
+        This function writes the plain data to a file and writes its modifications back to the
+        encrypted file until the end of the block. The file is then removed.
+
+        :param path: The path of the plain text file, created with restricted permissions
+        :type path: str
+        :param decrypted: The plain data
+        :type decrypted: bytes
+        """
         try:
-            fd, path = mkstemp(dir=RAMFS, suffix=".plain")
-            self._log.debug(f"Create tmp file {path} (fd={fd})")
-            with os.fdopen(fd, 'wb') as f:
+            with open(path, "wb") as f:
                 f.write(decrypted)
                 f.flush()
+            self._log.debug(f"Create tmp file {path}")
 
-                # Run a thread that monitor file change.
-                # This way, modification are automatically write back to the encrypted file
-                self._running = True
-                write_back_thread = Thread(target=self.on_write_inotify_thread, args=(path,path, self.write_back_callback))
-                write_back_thread.start()
-
-                command = self._command.format(filename=path)
-                self._log.debug(f"Run command : {command}")
-                os.system(command)
-            
-        except Exception as e:
-            self._log.error(f"Something failed : {e}")
+            with self.write_back(path):
+                yield path
         finally:
             self._log.debug(f"Tmp file {path} safely remove")
             os.unlink(path)
-            # stopping the thread
-            self._running = False
 
-    def run_read(self):
-        """
-        This function reads a decrypted file, creates a temporary file, runs a command on the temporary
-        file, and monitors changes to the temporary file.
+    @contextmanager
+    def open_read(self, path:str, decrypted:bytes):
         """
-        decrypted = self._file_object.decrypt()
+        This function writes the plain data to a read only file, which is read back each time the
+        encrypted file changes, until the end of the block. The file is then removed.
 
+        :param path: The path of the plain text file, created with restricted permissions
+        :type path: str
+        :param decrypted: The plain data
+        :type decrypted: bytes
+        """
         try:
-            # This code is creating a temporary file in the RAMFS directory with a ".plain" suffix.
-            # The `mkstemp()` function returns a tuple containing a file descriptor and the path to
-            # the created file. The file descriptor is then used to open the file using `os.fdopen()`,
-            # and the decrypted content is written to the file. The `flush()` method is called to
-            # ensure that all data is written to the file. The file is then made read-only using
-            # `os.chmod()` with a permission of 0o400.
-            fd, path = mkstemp(dir=RAMFS, suffix=".plain")
-            self._log.debug(f"Create tmp file {path} (fd={fd})")
-            with os.fdopen(fd, 'wb') as f:
+            with open(path, "wb") as f:
                 f.write(decrypted)
                 f.flush()
             self._log.debug(f"Tmp file {path} is now read only")
             os.chmod(path, 0o400)
 
-            # Run a thread that monitor file change.
-            # This way, modification are automatically write back to the encrypted file
-            self._running = True
-            read_back_thread = Thread(target=self.on_write_inotify_thread, args=(str(self._file_object), path, self.read_back_callback))
-            read_back_thread.start()
-
-            command = self._command.format(filename=path)
-            self._log.debug(f"Run command : {command}")
-            os.system(command)
-            
-        except Exception as e:
-            self._log.error(f"Something failed : {e}")
+            with self.read_back(path):
+                yield path
         finally:
             self._log.debug(f"Tmp file {path} safely remove")
             os.unlink(path)
-            # stopping the thread
-            self._running = False
 
+    @contextmanager
+    def open_memfd(self, decrypted:bytes, writable:bool):
+        """
+        This function writes the plain data to an anonymous memory file, sealed in read only
+        mode, and yields its path in /proc. The file is closed at the end of the block.
 
-    def run(self):
+        :param decrypted: The plain data
+        :type decrypted: bytes
+        :param writable: True if the container is opened in R/W
+        :type writable: bool
         """
-        This function runs a file in read or write mode depending on whether it is locked or not.
+        with Memfd(os.path.basename(str(self._file_object)), sealed=not writable) as memfd:
+            memfd.write(decrypted)
+            self._log.debug(f"Create memory file {memfd.path}")
+
+            self._memfd = memfd
+            try:
+                with (self.write_back if writable else self.read_back)(memfd.path):
+                    yield memfd.path
+            finally:
+                self._memfd = None
+
+    def open_plain(self, decrypted:bytes, writable:bool, path:str=None):
+        """
+        This function returns the context manager of the plain text file, a memory file in memfd
+        mode, else a file of the RAMFS.
+
+        :param decrypted: The plain data
+        :type decrypted: bytes
+        :param writable: True if the container is opened in R/W
+        :type writable: bool
+        :param path: The path of the plain text file, a temporary file of the RAMFS by default
+        :type path: str
+        :return: a context manager yielding the path of the plain text file.
         """
-        # Remove logs from inotify
-        logging.getLogger('inotify.adapters').setLevel(logging.WARNING)
+        if self._memfd_mode:
+            return self.open_memfd(decrypted, writable)
+
+        if path is None:
+            # The temporary file is created in the RAMFS directory with a ".plain" suffix, only
+            # readable by the user
+            fd, path = mkstemp(dir=RAMFS, suffix=".plain")
+            os.close(fd)
 
-        filename = str(self._file_object)
-        lock_file = filename + ".lock"
+        if writable:
+            return self.open_write(path, decrypted)
+        return self.open_read(path, decrypted)
+
+    def acquire_lock(self)->Lock:
+        """
+        This function locks the container for writing, without waiting.
+
+        :return: the lock, or None if the container is already locked by someone else.
+        """
+        lock = Lock(str(self._file_object) + ".lock", default_timeout=0)
+        try:
+            lock.lock()
+        except TimeOutError:
+            return None
+
+        return lock
+
+    def run_command(self, path:str):
+        command = self._command.format(filename=path)
+        self._log.debug(f"Run command : {command}")
+        os.system(command)
+
+    def run_write(self):
+        """
+        This function decrypts a file, creates a temporary file, writes the decrypted content to the
+        temporary file, monitors changes to the temporary file, runs a command using the temporary file
+        as input, and then removes the temporary file.
+        """
+        decrypted = self.decrypt(True)
+
+        try:
+            with self.open_plain(decrypted, True) as path:
+                self.run_command(path)
+        except Exception as e:
+            self._log.error(f"Something failed : {e}")
+
+    def run_read(self):
+        """
+        This function reads a decrypted file, creates a temporary file, runs a command on the temporary
+        file, and monitors changes to the temporary file.
+        """
+        decrypted = self.decrypt(False)
 
         try:
-            with Lock(lock_file, default_timeout=0):
+            with self.open_plain(decrypted, False) as path:
+                self.run_command(path)
+        except Exception as e:
+            self._log.error(f"Something failed : {e}")
+
+    def run(self):
+        """
+        This function runs a file in read or write mode depending on whether it is locked or not.
+        """
+        lock = self.acquire_lock()
+
+        if lock is not None:
+            try:
                 self._log.debug(f"File opened in R/W")
                 self.run_write()
-        except TimeOutError:
+            finally:
+                lock.unlock()
+        else:
             self._log.debug(f"File opened in RO")
             self.run_read()
+
+
+# Containers opened together, in a private directory of the RAMFS
+class OpenManyInRAM:
+    def __init__(self, file_objects:list, command:str, debounce:float=None, memfd:bool=False):
+        """
+        This is the constructor of a class opening several file objects at once. The placeholders
+        of the command are {filename0}, {filename1}, ... for each plain text file, {filename} for
+        the first one and {dir} for the directory holding them.
+
+        :param file_objects: The file objects of the containers
+        :type file_objects: list
+        :param command: The command to execute, see `interpole_command`
+        :type command: str
+        :param debounce: Seconds without writes before a plain text file is encrypted again
+        :type debounce: float
+        :param memfd: Keep the plain text files in anonymous memory files, {dir} is not available
+        :type memfd: bool
+        """
+        # Each container has its own lock, write back queue and watcher
+        self._openers = [OpenInRAM(file_object, "", debounce, memfd) for file_object in file_objects]
+        self._memfd_mode = use_memfd(memfd)
+        self._log = logging.getLogger(self.__class__.__name__)
+
+        self._command = self.interpole_command(command)
+        self._log.debug(f"Command : {self._command}")
+
+    def interpole_command(self, command:str)->str:
+        """
+        This function adds the placeholder of every plain text file to the command if it has no
+        placeholder, and replaces the bracket placeholders ([filename0], [dir], ...) with braces.
+
+        :param command: The input command string
+        :type command: str
+        :return: the command with its placeholders between braces.
+        """
+        command = command.strip()
+        if re.search(PLACEHOLDER, command) is None:
+            return " ".join([command] + [f"{{filename{i}}}" for i in range(len(self._openers))])
+        else:
+            return re.sub(r"\[\s*(filename\d*|dir)\s*\]", r"{\1}", command)
+
+    def get_paths(self, directory:str)->list:
+        """
+        This function returns the path of the plain text file of each container in the directory.
+        Files are named after their container, prefixed by their index when names collide.
+
+        :param directory: The directory of the plain text files
+        :type directory: str
+        :return: the list of paths.
+        """
+        names = [os.path.basename(str(opener._file_object)) for opener in self._openers]
+        paths = list()
+        for index, name in enumerate(names):
+            if names.count(name) > 1:
+                name = f"{index}-{name}"
+            paths.append(os.path.join(directory, name))
+
+        return paths
+
+    def run(self):
+        """
+        This function locks the containers that are not opened by someone else, decrypts them
+        concurrently, runs the command and removes the plain text files. Each container is opened
+        in R/W or RO depending on its own lock.
+        """
+        if self._memfd_mode and re.search(r"\{dir\}", self._command):
+            raise Exception("The {dir} placeholder is not available with memory files")
+
+        with ExitStack() as stack:
+            writables = list()
+            for opener in self._openers:
+                lock = opener.acquire_lock()
+                if lock is not None:
+                    stack.callback(lock.unlock)
+                writables.append(lock is not None)
+
+            # The KDF or the SSH unwrap of each container runs at the same time. Like a single
+            # container, a container that can't be decrypted stops the opening
+            with ThreadPoolExecutor(len(self._openers)) as executor:
+                decrypted = list(executor.map(OpenInRAM.decrypt, self._openers, writables))
+
+            # Only the user can access the directory. Memory files are in no directory.
+            # It is removed once the plain text files are
+            directory = None
+            if not self._memfd_mode:
+                directory = mkdtemp(dir=RAMFS, prefix="sf2-")
+                self._log.debug(f"Create tmp directory {directory}")
+                stack.callback(shutil.rmtree, directory, ignore_errors=True)
+
+            try:
+                paths = self.get_paths(directory) if directory else [None] * len(self._openers)
+                for index, (opener, data, writable) in enumerate(zip(self._openers, decrypted, writables)):
+                    self._log.debug(f"{opener._file_object} opened in {'R/W' if writable else 'RO'}")
+                    paths[index] = stack.enter_context(opener.open_plain(data, writable, paths[index]))
+
+                filenames = {f"filename{i}" : path for i, path in enumerate(paths)}
+                command = self._command.format(filename=paths[0], dir=directory, **filenames)
+                self._log.debug(f"Run command : {command}")
+                os.system(command)
+
+            except Exception as e:
+                self._log.error(f"Something failed : {e}")
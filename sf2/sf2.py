@@ -5,11 +5,9 @@ import os.path
 
 from sf2.args import get_args
 from sf2.core_with_environment import CoreWithEnvironment
-from sf2.convert_container import convert_container
 
-from sf2.gui.gui import run_app
-
-from password_validator import PasswordValidator
+# The GUI, the v1 converter and the password validator are imported by the commands
+# using them, so the other commands start faster
 
 
 
@@ -24,7 +22,11 @@ LOG_LEVELS = {
 class SF2:
     def __init__(self, args=None, _iterations:int=None) -> None:
         self._args = get_args(args)
-        self._core = CoreWithEnvironment(_iterations)
+        # Only the data commands have a worker count. The writing commands and the mapped reads can be atomic
+        workers = getattr(self._args, "workers", None)
+        atomic = getattr(self._args, "atomic", False)
+        mapped = getattr(self._args, "mapped", False)
+        self._core = CoreWithEnvironment(_iterations, workers=workers, atomic=atomic, mapped=mapped)
         self._log = logging.getLogger(self.__class__.__name__)
 
     def main(self):
@@ -37,6 +39,7 @@ class SF2:
             "ssh": self.ssh,
             "new": self.new,
             "app": self.app,
+            "agent": self.agent,
             "password": self.change_password
         }
 
@@ -67,44 +70,56 @@ class SF2:
                                    self._args.force, self._args.config_file)
     def convert(self):
         password = self.get_password()
+        from sf2.convert_container import convert_container
+
         convert_container(self._args.infilename, self._args.outfilename, password, self._args.format, self._args.force)
 
     def verify(self):
-        output = 0
-        for filename in self._args.infilenames:
+        # The password is asked once for all the files
+        if self._args.password_method:
+            password = self.get_password()
+            results = self._core.verify_many(self._args.infilenames, password, self._args.format, self._args.jobs)
+        else:
+            results = self._core.verify_ssh_many(self._args.infilenames, self._args.private_key_file, self._args.private_key_password,
+                                                 self._args.auth_id, self._args.format, self._args.config_file, self._args.jobs)
 
-            if self._args.password_method:
-                password = self.get_password()
-                status = self._core.verify(filename, password, self._args.format)
-                   
-            else:
-                status = self._core.verify_ssh(filename, self._args.private_key_file, self._args.private_key_password, 
-                                               self._args.auth_id, self._args.format, self._args.config_file)
-            
+        # Results are printed as files are verified, the exit code doesn't depend on their order
+        output = 0
+        for filename, status in results:
             if status :
-                print(f"{filename} : OK")
+                print(f"{filename} : OK", flush=True)
             else:
-                print(f"{filename} : KO")
+                print(f"{filename} : KO", flush=True)
                 output = -1
 
-
         sys.exit(output)
 
     def open(self):
-        if len(self._args.infilenames) > 1:
-            raise Exception(f"Only one file can be open, not {len(self._args.infilenames)}")
         if len(self._args.infilenames) == 0:
             raise Exception(f"One file must be provided")
+        if len(self._args.infilenames) > 1:
+            return self.open_many()
         filename = os.path.abspath(self._args.infilenames[0])
            
 
         if self._args.password_method:
             password = self.get_password()
-            self._core.open(filename, self._args.program, password, self._args.format)
+            self._core.open(filename, self._args.program, password, self._args.format, self._args.debounce, self._args.memfd)
         else:
             self._core.open_ssh(filename, self._args.program, self._args.private_key_file, self._args.private_key_password, 
-                                self._args.auth_id, self._args.format, self._args.config_file)
+                                self._args.auth_id, self._args.format, self._args.config_file, self._args.debounce, self._args.memfd)
+
 
+    def open_many(self):
+        filenames = [os.path.abspath(filename) for filename in self._args.infilenames]
+
+        # The password is asked once for all the containers
+        if self._args.password_method:
+            password = self.get_password()
+            self._core.open_many(filenames, self._args.program, password, self._args.format, self._args.debounce, self._args.memfd)
+        else:
+            self._core.open_ssh_many(filenames, self._args.program, self._args.private_key_file, self._args.private_key_password,
+                                     self._args.auth_id, self._args.format, self._args.config_file, self._args.debounce, self._args.memfd)
 
     def ssh(self):
         commands = {
@@ -123,7 +138,7 @@ class SF2:
     def ssh_rm(self):
         password = self.get_password()
         for filename in self._args.infilenames:
-            self._core.ssh_rm(filename, password, self._args.auth_id_pattern, self._args.format, self._args.config_file)
+            self._core.ssh_rm(filename, password, self._args.auth_id_pattern, self._args.format, self._args.config_file, self._args.deep)
 
     def ssh_ls(self):
         for filename in self._args.infilenames:
@@ -160,9 +175,25 @@ class SF2:
             new_password = self._args.new_password
      
         for filename in self._args.infilenames:
-            self._core.change_password(filename, old_password, new_password, self._args.format)
+            self._core.change_password(filename, old_password, new_password, self._args.format, self._args.deep)
+
+    def agent(self):
+        from sf2.agent import Agent
+        from sf2.agent import AgentClient
+
+        if self._args.lock:
+            AgentClient(self._args.socket).lock()
+            return
+
+        agent = Agent(self._args.socket, self._args.ttl, self._args.idle)
+        try:
+            agent.serve_forever()
+        except KeyboardInterrupt:
+            pass
 
     def app(self):
+        from sf2.gui.gui import run_app
+
         run_app(config_file=self._args.config_file)
             
     def get_password(self)->str:
@@ -191,6 +222,8 @@ class SF2:
     
     def check_password_strength(self, password:str)->None:
         # raise an exception if the password is too weak
+        from password_validator import PasswordValidator
+
         schema = PasswordValidator()
 
         # Add properties to it
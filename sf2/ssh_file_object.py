@@ -1,23 +1,35 @@
 from sf2.container_base import ContainerBase
 from sf2.container_ssh import ContainerSSH
+from sf2.key_session import KeySession
+from sf2.chunk_tracker import ChunkTracker
+from sf2.agent import AgentClient
 
 class SSHFileObject:
-    def __init__(self, support, auth_id:str, private_ssh_file:str, password_private_ssh_file:bytes=None) -> None:
-        self._base = ContainerBase(support)
-        self._container = ContainerSSH(self._base)
+    def __init__(self, support, auth_id:str, private_ssh_file:str, password_private_ssh_file:bytes=None, session:KeySession=None, workers:int=None, agent:AgentClient=None) -> None:
+        self._base = ContainerBase(support, workers)
+        self._container = ContainerSSH(self._base, agent=agent)
         self._auth_id = auth_id
         self._private_ssh_file = private_ssh_file
         self._password_private_ssh_file = password_private_ssh_file
+        self._session = session
+        # Keep track of the synchronized data, so a write back only encrypts the modified chunks
+        self._tracker = ChunkTracker()
         self._info = support.get_filename()
 
     def decrypt(self)->bytes:
-        return self._container.read(self._auth_id, self._private_ssh_file, self._password_private_ssh_file)
+        return self._container.read(self._auth_id, self._private_ssh_file, self._password_private_ssh_file, self._session, self._tracker)
     
     def encrypt(self, path:str)->None:
         with open(path, "rb") as f:
             data = f.read()
         
-        self._container.write(data, self._auth_id, self._private_ssh_file, self._password_private_ssh_file)
+        self._container.write(data, self._auth_id, self._private_ssh_file, self._password_private_ssh_file, self._session, self._tracker)
+
+    def get_fingerprint(self)->tuple:
+        return self._base.get_fingerprint()
+
+    def get_data_digest(self)->bytes:
+        return self._base.get_data_digest()
 
     def __str__(self) -> str:
         return self._info
\ No newline at end of file
@@ -0,0 +1,90 @@
+from sf2.auth_sign import AuthSign
+from sf2 import key_index
+
+
+class Transaction:
+    """
+    Several changes of a container, applied in memory. The container is loaded and verified
+    once, keys are derived once and reused by the following changes, then commit signs and
+    dumps the container once. Only the header is loaded, the data section is read and
+    written only by a deep password change. Use ContainerBase.transaction to get one.
+    """
+
+    def __init__(self, base, password:str, _iterations:int) -> None:
+        self._base = base
+        self._password = password
+        self._iterations = _iterations
+
+        self._container = base.load_header()
+
+        # Check if the auth section was not modifier
+        AuthSign(self._container).verify()
+
+        self._master_key = None
+        self._master_data_key = None
+        self._auth_sign = None
+
+    def get_container(self)->dict:
+        return self._container
+
+    def get_master_key(self)->bytes:
+        if self._master_key is None:
+            self._master_key = self._base.get_master_key(self._container, self._password, self._iterations)
+
+        return self._master_key
+
+    def get_master_data_key(self)->bytes:
+        if self._master_data_key is None:
+            self._master_data_key = self._base.get_master_data_key_from_master_key(self._container, self.get_master_key())
+
+        return self._master_data_key
+
+    def change_password(self, new_password:str, deep:bool=False)->None:
+        """
+        It replaces the auth section with new keys protected by the new password. Users are
+        kept, their master key must be updated. By default, the master data key is only wrapped
+        again, so the data is left untouched. A deep change also creates a new master data key
+        and encrypts the data again, for when the old master data key may have leaked.
+
+        :param new_password: The new password
+        :type new_password: str
+        :param deep: If True, the data is encrypted again with a new master data key
+        :type deep: bool
+        """
+        users = self._container["auth"]["users"]
+
+        if deep:
+            container = self._base.load()
+            container.update(self._container)
+            data = self._base.get_plain_data(container, self.get_master_data_key())
+
+            container, master_key, master_data_key, auth_sign = self._base._create_auth(new_password, users, self._iterations)
+            self._base.set_plain_data(container, data, master_data_key)
+        else:
+            raw_master_data_key = self._base.b64decode(self.get_master_data_key())
+
+            container, master_key, master_data_key, auth_sign = self._base._create_auth(new_password, users, self._iterations, raw_master_data_key)
+            container["version"] = self._container["version"]
+
+        # The users are kept, so is their index. Containers written before the index get it
+        container["auth"]["fingerprints"] = self._container["auth"].get("fingerprints") or key_index.build_index(users)
+
+        self._container = container
+        self._master_key = master_key
+        self._master_data_key = master_data_key
+        self._auth_sign = auth_sign
+        self._password = new_password
+
+    def commit(self)->None:
+        """
+        It signs the auth section and dumps the container.
+        """
+        if self._auth_sign is None:
+            self._auth_sign = AuthSign(self._container, self._iterations)
+
+        container = self._auth_sign.sign(self._password)
+
+        if "data" in container:
+            self._base.dump(container)
+        else:
+            self._base.dump_header(container)
@@ -0,0 +1,130 @@
+import os
+import logging
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.serialization import load_ssh_public_key
+from cryptography.hazmat.primitives.asymmetric import padding
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PublicKey
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
+
+from sf2 import x25519_wrap
+
+
+@lru_cache(maxsize=65536)
+def parse_public_key(public_key:str):
+    # Each process parses a public key once, then reuses it for every wrap
+    return load_ssh_public_key(bytes(public_key, "utf8"))
+
+def wrap_master_key(public_key:str, master_key:bytes)->bytes:
+    # ssh-ed25519 recipients use an X25519 key agreement, ssh-rsa ones RSA-OAEP
+    key = parse_public_key(public_key)
+
+    if isinstance(key, Ed25519PublicKey):
+        return x25519_wrap.wrap(key, master_key)
+
+    return key.encrypt(
+        master_key,
+        padding.OAEP(
+            mgf=padding.MGF1(algorithm=hashes.SHA256()),
+            algorithm=hashes.SHA256(),
+            label=None
+        )
+    )
+
+def unwrap_master_key(private_key, encrypted_master_key:bytes)->bytes:
+    if isinstance(private_key, Ed25519PrivateKey):
+        return x25519_wrap.unwrap(private_key, encrypted_master_key)
+
+    return private_key.decrypt(
+        encrypted_master_key,
+        padding.OAEP(
+            mgf=padding.MGF1(algorithm=hashes.SHA256()),
+            algorithm=hashes.SHA256(),
+            label=None
+        )
+    )
+
+def wrap_batch(batch:list, master_key:bytes)->list:
+    return [(user, wrap_master_key(public_key, master_key)) for user, public_key in batch]
+
+
+class WrapPool:
+    """
+    Encrypt a master key with the SSH public keys of many users. The executor is created on
+    first use and kept, so it can be shared by every container of a Core. Small user counts
+    are wrapped in the calling thread, larger ones are split in one batch per worker.
+    """
+    KINDS = ("threads", "processes")
+    # Below this number of users per worker, starting a worker costs more than it saves
+    BATCH_SIZE = 32
+
+    def __init__(self, kind:str="threads", max_workers:int=None) -> None:
+        if kind not in WrapPool.KINDS:
+            raise Exception(f"Executor {kind} is not supported, use one of {WrapPool.KINDS}")
+
+        self._kind = kind
+        self._max_workers = max_workers or os.cpu_count() or 1
+        self._executor = None
+
+        self._log = logging.getLogger(self.__class__.__name__)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.shutdown()
+
+    def get_workers(self, count:int)->int:
+        """
+        It returns the number of workers used for count users.
+
+        :param count: The number of users
+        :type count: int
+        :return: The number of workers, 1 means the calling thread.
+        """
+        return max(1, min(self._max_workers, count // WrapPool.BATCH_SIZE))
+
+    def wrap(self, public_keys:dict, master_key:bytes)->dict:
+        """
+        It encrypts the master key with the public key of each user.
+
+        :param public_keys: The public key (OpenSSH format) of each user
+        :type public_keys: dict
+        :param master_key: The master key
+        :type master_key: bytes
+        :return: The encrypted master key of each user.
+        """
+        items = list(public_keys.items())
+        workers = self.get_workers(len(items))
+
+        if workers == 1:
+            return dict(wrap_batch(items, master_key))
+
+        self._log.debug(f"Wrap {len(items)} keys with {workers} {self._kind}")
+        executor = self.get_executor()
+        futures = [executor.submit(wrap_batch, items[i::workers], master_key) for i in range(workers)]
+
+        output = dict()
+        for future in futures:
+            output.update(future.result())
+
+        return output
+
+    def get_executor(self):
+        if self._executor is None:
+            if self._kind == "processes":
+                # Only the administration commands need a process pool
+                from concurrent.futures import ProcessPoolExecutor
+
+                self._executor = ProcessPoolExecutor(self._max_workers)
+            else:
+                self._executor = ThreadPoolExecutor(self._max_workers)
+
+        return self._executor
+
+    def shutdown(self)->None:
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
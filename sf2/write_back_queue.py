@@ -0,0 +1,103 @@
+import time
+import logging
+from threading import Thread
+from threading import Condition
+
+
+class WriteBackQueue:
+    """
+    Run the write back of a plain text file in a worker thread. The sync only starts once the
+    file was not written during the debounce window, so a burst of writes is encrypted once.
+    Pending writes are always synced when the queue is closed.
+    """
+    DEFAULT_DEBOUNCE = 0.2
+
+    def __init__(self, callback:callable, debounce:float=None, _clock:callable=time.monotonic) -> None:
+        if debounce is None:
+            debounce = WriteBackQueue.DEFAULT_DEBOUNCE
+
+        self._callback = callback
+        self._debounce = debounce
+        self._clock = _clock
+
+        self._condition = Condition()
+        self._pending = None
+        self._last_push = None
+        self._closed = False
+        self._thread = Thread(target=self._run, daemon=True)
+
+        # Number of writes notified and number of syncs really done
+        self.requests = 0
+        self.syncs = 0
+
+        self._log = logging.getLogger(self.__class__.__name__)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.close()
+
+    @property
+    def coalesced(self)->int:
+        return self.requests - self.syncs
+
+    def start(self)->None:
+        self._thread.start()
+
+    def push(self, path:str)->None:
+        """
+        It notifies a write of the file, the sync is delayed until the end of the debounce window.
+
+        :param path: The path of the written file, given to the callback
+        :type path: str
+        """
+        with self._condition:
+            self._pending = path
+            self._last_push = self._clock()
+            self.requests += 1
+            self._condition.notify()
+
+    def close(self)->None:
+        """
+        It syncs the pending write without waiting for the debounce window and stops the worker.
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+
+        if self._thread.is_alive():
+            self._thread.join()
+        elif self._pending is not None:
+            # The worker was never started
+            self._sync(self._pending)
+            self._pending = None
+
+    def _run(self)->None:
+        while True:
+            with self._condition:
+                while self._pending is None and not self._closed:
+                    self._condition.wait()
+
+                if self._pending is None:
+                    return
+
+                # Each new write restarts the window
+                while not self._closed:
+                    remaining = self._last_push + self._debounce - self._clock()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+
+                path = self._pending
+                self._pending = None
+
+            self._sync(path)
+
+    def _sync(self, path:str)->None:
+        self.syncs += 1
+        try:
+            self._callback(path)
+        except Exception as e:
+            self._log.error(f"Failed to sync {path} : {e}")
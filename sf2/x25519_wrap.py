@@ -0,0 +1,63 @@
+from hashlib import sha512
+
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from cryptography.hazmat.primitives.ciphers.aead import ChaCha20Poly1305
+from cryptography.hazmat.primitives.asymmetric.x25519 import X25519PrivateKey
+from cryptography.hazmat.primitives.asymmetric.x25519 import X25519PublicKey
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PublicKey
+from cryptography.hazmat.primitives.serialization import Encoding
+from cryptography.hazmat.primitives.serialization import PrivateFormat
+from cryptography.hazmat.primitives.serialization import PublicFormat
+from cryptography.hazmat.primitives.serialization import NoEncryption
+
+# Wrap a master key for an ssh-ed25519 recipient, like age does: the Ed25519 key is converted
+# to its X25519 form, an ephemeral X25519 key agrees a shared secret with it, and the master
+# key is encrypted with ChaCha20-Poly1305 under a key derived from this secret.
+# The wrapped key is the ephemeral public key followed by the ciphertext.
+
+FIELD_PRIME = 2**255 - 19
+KEY_SIZE = 32
+# Each wrap key is used once, a constant nonce is safe
+NONCE = bytes(12)
+INFO = b"sf2 ssh-ed25519 master key"
+
+def to_x25519_public_key(public_key:Ed25519PublicKey)->X25519PublicKey:
+    # Birational map from the Edwards y coordinate to the Montgomery u coordinate: u = (1 + y) / (1 - y)
+    y = int.from_bytes(public_key.public_bytes(Encoding.Raw, PublicFormat.Raw), "little") & ((1 << 255) - 1)
+    u = (1 + y) * pow(1 - y, FIELD_PRIME - 2, FIELD_PRIME) % FIELD_PRIME
+
+    return X25519PublicKey.from_public_bytes(u.to_bytes(KEY_SIZE, "little"))
+
+def to_x25519_private_key(private_key:Ed25519PrivateKey)->X25519PrivateKey:
+    # The Ed25519 scalar is the first half of the SHA-512 of the seed, X25519 clamps it the same way
+    seed = private_key.private_bytes(Encoding.Raw, PrivateFormat.Raw, NoEncryption())
+
+    return X25519PrivateKey.from_private_bytes(sha512(seed).digest()[:KEY_SIZE])
+
+def derive_wrap_key(shared_key:bytes, ephemeral_public:bytes, recipient_public:bytes)->bytes:
+    hkdf = HKDF(algorithm=hashes.SHA256(), length=KEY_SIZE, salt=ephemeral_public + recipient_public, info=INFO)
+
+    return hkdf.derive(shared_key)
+
+def wrap(public_key:Ed25519PublicKey, master_key:bytes)->bytes:
+    recipient = to_x25519_public_key(public_key)
+    recipient_public = recipient.public_bytes(Encoding.Raw, PublicFormat.Raw)
+
+    ephemeral = X25519PrivateKey.generate()
+    ephemeral_public = ephemeral.public_key().public_bytes(Encoding.Raw, PublicFormat.Raw)
+
+    wrap_key = derive_wrap_key(ephemeral.exchange(recipient), ephemeral_public, recipient_public)
+
+    return ephemeral_public + ChaCha20Poly1305(wrap_key).encrypt(NONCE, master_key, None)
+
+def unwrap(private_key:Ed25519PrivateKey, encrypted_master_key:bytes)->bytes:
+    identity = to_x25519_private_key(private_key)
+    recipient_public = identity.public_key().public_bytes(Encoding.Raw, PublicFormat.Raw)
+
+    ephemeral_public = encrypted_master_key[:KEY_SIZE]
+    shared_key = identity.exchange(X25519PublicKey.from_public_bytes(ephemeral_public))
+    wrap_key = derive_wrap_key(shared_key, ephemeral_public, recipient_public)
+
+    return ChaCha20Poly1305(wrap_key).decrypt(NONCE, encrypted_master_key[KEY_SIZE:], None)
@@ -0,0 +1,74 @@
+import unittest
+import os
+import time
+from hashlib import sha256
+
+from sf2.auth_sign import AuthSign
+
+PASSWORD = "0123456789abcdef0123456789abcdef"
+ITERATIONS = 100
+
+def quadratic_dict_to_bytes(data)->bytes:
+    # The former implementation, kept as reference
+    if isinstance(data, dict):
+        tmp = b""
+        for k in sorted(data.keys()) :
+            tmp = tmp + bytes(k, "utf8") + quadratic_dict_to_bytes(data[k])
+
+        return tmp
+    elif isinstance(data, bytes):
+        return data
+    elif isinstance(data, str):
+        return bytes(data, "utf8")
+    else:
+        raise Exception(f"Type {type(data)} is not supported")
+
+def create_container(users_count:int)->dict:
+    users = dict()
+    for i in range(users_count):
+        users[f"user{i}@test"] = {
+            "ssh" : {
+                "public-key" : "ssh-rsa AAAA" + os.urandom(270).hex() + f" user{i}@test",
+                "encrypted_master_key" : os.urandom(256)
+            }
+        }
+
+    return {
+        "auth" : {
+            "master_iv" : os.urandom(32),
+            "encrypted_master_data_key" : os.urandom(120),
+            "users" : users,
+            "challenge" : os.urandom(32),
+            "signature" : os.urandom(32)
+        }
+    }
+
+class TestAuthSignPerformance(unittest.TestCase):
+
+    def benchmark(self, users_count:int)->None:
+        container = create_container(users_count)
+        auth_sign = AuthSign(container, ITERATIONS)
+        auth_sign.add_keys(PASSWORD)
+
+        start = time.perf_counter()
+        expected = sha256(quadratic_dict_to_bytes(container["auth"])).digest()
+        quadratic_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        result = auth_sign.sha256_dict(container["auth"])
+        streaming_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        auth_sign.sign(PASSWORD)
+        auth_sign.verify()
+        sign_verify_time = time.perf_counter() - start
+
+        print(f"{users_count} users : quadratic {quadratic_time:.4f}s, streaming {streaming_time:.4f}s, sign + verify {sign_verify_time:.4f}s")
+
+        self.assertEqual(result, expected)
+
+    def test_1k_users(self):
+        self.benchmark(1000)
+
+    def test_10k_users(self):
+        self.benchmark(10000)
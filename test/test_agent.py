@@ -0,0 +1,186 @@
+import unittest
+import os
+import time
+import shutil
+from threading import Thread
+from unittest.mock import patch
+
+from sf2.agent import Agent
+from sf2.agent import AgentClient
+from sf2.agent import AgentError
+from sf2.core import Core
+from sf2.container_ssh import ContainerSSH
+from sf2.container_base import ContainerBase
+from sf2.msgpack_support import MsgpackSupport
+from sf2.wrap_pool import unwrap_master_key
+from sf2 import key_index
+
+TEST_DIR = "/tmp/test_agent"
+SOCKET = os.path.join(TEST_DIR, "agent.sock")
+ENCRYPTED_FILE = os.path.join(TEST_DIR, "encrypted.x")
+DECRYPTED_FILE = os.path.join(TEST_DIR, "decrypted.txt")
+PRIVATE_SSH_KEY = "./test/.ssh/id_rsa"
+PUBLIC_SSH_KEY = "./test/.ssh/id_rsa.pub"
+AUTH_ID = "test@test"
+SECRET = "secret"
+ITERATIONS = 100
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class TestAgent(unittest.TestCase):
+    def setUp(self) -> None:
+        shutil.rmtree(TEST_DIR, ignore_errors=True)
+        os.makedirs(TEST_DIR)
+
+        base = ContainerBase(MsgpackSupport(ENCRYPTED_FILE))
+        base.create(SECRET, _iterations=ITERATIONS)
+        base.write(b"hello", SECRET, _iterations=ITERATIONS)
+        ContainerSSH(base).add_ssh_key(SECRET, PUBLIC_SSH_KEY, AUTH_ID, ITERATIONS)
+
+        container = base.load()
+        self.encrypted_master_key = container["auth"]["users"][AUTH_ID]["ssh"]["encrypted_master_key"]
+
+        self.agent = None
+
+    def tearDown(self) -> None:
+        if self.agent is not None:
+            self.agent.shutdown()
+            self.thread.join()
+        shutil.rmtree(TEST_DIR, ignore_errors=True)
+
+    def start_agent(self, **kwargs)->AgentClient:
+        self.agent = Agent(SOCKET, **kwargs)
+        self.thread = Thread(target=self.agent.serve_forever)
+        self.thread.start()
+
+        client = AgentClient(SOCKET)
+        while not client.is_available():
+            time.sleep(0.01)
+
+        return client
+
+    def test_unwrap_locked(self):
+        agent = Agent(SOCKET)
+
+        with self.assertRaises(AgentError):
+            agent.unwrap(PRIVATE_SSH_KEY, self.encrypted_master_key)
+
+    def test_add_unwrap(self):
+        agent = Agent(SOCKET)
+        agent.add(PRIVATE_SSH_KEY)
+
+        master_key = agent.unwrap(PRIVATE_SSH_KEY, self.encrypted_master_key)
+
+        private_key = ContainerSSH(None).load_ssh_private_key(PRIVATE_SSH_KEY, None)
+        self.assertEqual(master_key, unwrap_master_key(private_key, self.encrypted_master_key))
+        self.assertEqual(agent.list(), [os.path.abspath(PRIVATE_SSH_KEY)])
+
+    def test_ttl(self):
+        clock = FakeClock()
+        agent = Agent(SOCKET, ttl=10, idle=100, _clock=clock)
+        agent.add(PRIVATE_SSH_KEY)
+
+        clock.now = 5
+        agent.expire()
+        self.assertEqual(len(agent.list()), 1)
+
+        clock.now = 10
+        agent.expire()
+        self.assertEqual(agent.list(), [])
+
+    def test_idle(self):
+        clock = FakeClock()
+        agent = Agent(SOCKET, ttl=100, idle=10, _clock=clock)
+        agent.handle({"command" : "add", "private_key_file" : PRIVATE_SSH_KEY})
+
+        clock.now = 8
+        response = agent.handle({"command" : "list"})
+        self.assertEqual(len(response["keys"]), 1)
+
+        # The request at 8 reset the idle timer
+        clock.now = 16
+        agent.expire()
+        self.assertEqual(len(agent.list()), 1)
+
+        clock.now = 18
+        agent.expire()
+        self.assertEqual(agent.list(), [])
+
+    def test_client(self):
+        client = self.start_agent()
+
+        with self.assertRaises(AgentError):
+            client.unwrap(PRIVATE_SSH_KEY, self.encrypted_master_key)
+
+        master_key = client.get_master_key(PRIVATE_SSH_KEY, None, self.encrypted_master_key)
+        self.assertEqual(master_key, client.unwrap(PRIVATE_SSH_KEY, self.encrypted_master_key))
+
+        client.lock()
+        self.assertEqual(client.list(), [])
+
+    def test_fingerprint(self):
+        client = self.start_agent()
+
+        with self.assertRaises(AgentError):
+            client.fingerprint(PRIVATE_SSH_KEY)
+
+        with open(PUBLIC_SSH_KEY) as f:
+            expected = key_index.get_public_key_fingerprint(f.read())
+
+        self.assertEqual(client.get_fingerprint(PRIVATE_SSH_KEY, None), expected)
+        self.assertEqual(client.list(), [os.path.abspath(PRIVATE_SSH_KEY)])
+
+    def test_core_decrypt_ssh_without_auth_id(self):
+        client = self.start_agent()
+        core = Core(ITERATIONS, agent_socket=SOCKET)
+
+        # A key whose public key can't be read without unlocking it, only the agent unlocks it
+        with patch.object(key_index, "read_public_key_fingerprint", return_value=None), \
+                patch.object(key_index, "load_ssh_private_key", side_effect=AssertionError("Unlocked out of the agent")):
+            core.decrypt_ssh(ENCRYPTED_FILE, DECRYPTED_FILE, PRIVATE_SSH_KEY)
+
+        with open(DECRYPTED_FILE, "rb") as f:
+            self.assertEqual(f.read(), b"hello")
+        self.assertEqual(client.list(), [os.path.abspath(PRIVATE_SSH_KEY)])
+
+    def test_socket_permissions(self):
+        self.start_agent()
+
+        self.assertEqual(os.stat(SOCKET).st_mode & 0o777, 0o600)
+
+    def test_core_decrypt_ssh(self):
+        client = self.start_agent()
+        core = Core(ITERATIONS, agent_socket=SOCKET)
+
+        core.decrypt_ssh(ENCRYPTED_FILE, DECRYPTED_FILE, PRIVATE_SSH_KEY, auth_id=AUTH_ID)
+
+        with open(DECRYPTED_FILE, "rb") as f:
+            self.assertEqual(f.read(), b"hello")
+        self.assertEqual(client.list(), [os.path.abspath(PRIVATE_SSH_KEY)])
+
+        self.assertTrue(core.verify_ssh(ENCRYPTED_FILE, PRIVATE_SSH_KEY, auth_id=AUTH_ID))
+
+    def test_core_without_agent(self):
+        core = Core(ITERATIONS, agent_socket=SOCKET)
+
+        self.assertIsNone(core.get_agent())
+        self.assertTrue(core.verify_ssh(ENCRYPTED_FILE, PRIVATE_SSH_KEY, auth_id=AUTH_ID))
+
+    def test_core_stale_socket(self):
+        # The socket of a stopped agent, the key is loaded locally
+        self.start_agent()
+        self.agent.shutdown()
+        self.thread.join()
+        self.agent = None
+        open(SOCKET, "w").close()
+
+        core = Core(ITERATIONS, agent_socket=SOCKET)
+
+        self.assertTrue(core.verify_ssh(ENCRYPTED_FILE, PRIVATE_SSH_KEY, auth_id=AUTH_ID))
@@ -27,6 +27,13 @@ class TestArgs(unittest.TestCase):
 
         self.assertEqual(results, expected)
 
+    def test_encrypt_workers(self):
+        args = get_args(["encrypt", "--workers", "8", "-i", "in.txt", "-o", "out.x"])
+        results = [args.workers, get_args(["encrypt", "-i", "in.txt", "-o", "out.x"]).workers]
+        expected = [8, None]
+
+        self.assertEqual(results, expected)
+
     # decrypt
 
     def test_decrypt_mk(self):
@@ -86,6 +93,20 @@ class TestArgs(unittest.TestCase):
 
         self.assertEqual(results, expected)
 
+    def test_open_debounce(self):
+        args = get_args(["open", "--debounce", "0.5", "out.x"])
+        results = [args.debounce, get_args(["open", "out.x"]).debounce]
+        expected = [0.5, None]
+
+        self.assertEqual(results, expected)
+
+    def test_open_memfd(self):
+        args = get_args(["open", "--memfd", "out.x"])
+        results = [args.memfd, get_args(["open", "out.x"]).memfd]
+        expected = [True, False]
+
+        self.assertEqual(results, expected)
+
     # # Currently disable, need to implement configuration
     # # def test_open_without_args(self):
     # #     args = get_args(["open", "out.x"]) 
@@ -102,6 +123,13 @@ class TestArgs(unittest.TestCase):
 
         self.assertEqual(results, expected)
 
+    def test_verify_jobs(self):
+        args = get_args(["verify", "--password", "-j", "4", "out.x", "out2.x"])
+        results = [args.commands, args.infilenames, args.jobs]
+        expected = ['verify', ['out.x', 'out2.x'], 4]
+
+        self.assertEqual(results, expected)
+
     def test_verify_ssh_key_no_file(self):
         args = get_args(["verify", "--ssh", "out.x"]) 
         results = [args.commands, args.infilenames, args.ssh_method]
@@ -139,6 +167,13 @@ class TestArgs(unittest.TestCase):
 
         self.assertEqual(results, expected)
 
+    def test_ssh_rm_deep(self):
+        args = get_args(["ssh", "rm", "--deep", "-p", "foo@bar", "out.x"]) 
+        results = [args.deep, get_args(["ssh", "rm", "out.x"]).deep]
+        expected = [True, False]
+
+        self.assertEqual(results, expected)
+
     # ssh ls
     def test_ssh_ls(self):
         args = get_args(["ssh", "ls", "out.x"]) 
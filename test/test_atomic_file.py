@@ -0,0 +1,64 @@
+import unittest
+import os
+import stat
+from contextlib import suppress
+
+from sf2.atomic_file import atomic_open
+from sf2.atomic_file import replace_head
+
+WORKING_FILE = "/tmp/test_atomic_file.x"
+
+class TestAtomicFile(unittest.TestCase):
+
+    def tearDown(self) -> None:
+        with suppress(FileNotFoundError):
+            os.remove(WORKING_FILE)
+
+    def test_write(self):
+        with atomic_open(WORKING_FILE, "wb") as f:
+            f.write(b"hello")
+
+        with open(WORKING_FILE, "rb") as f:
+            result = f.read()
+
+        self.assertEqual(result, b"hello")
+
+    def test_replace_keep_mode(self):
+        with open(WORKING_FILE, "wb") as f:
+            f.write(b"old")
+        os.chmod(WORKING_FILE, 0o640)
+
+        with atomic_open(WORKING_FILE, "wb") as f:
+            f.write(b"new")
+
+        self.assertEqual(stat.S_IMODE(os.stat(WORKING_FILE).st_mode), 0o640)
+
+    def test_failure_keep_old_file(self):
+        with open(WORKING_FILE, "w") as f:
+            f.write("old")
+
+        def write():
+            with atomic_open(WORKING_FILE, "w") as f:
+                f.write("partial")
+                raise Exception("crash")
+
+        self.assertRaises(Exception, write)
+
+        with open(WORKING_FILE) as f:
+            result = f.read()
+
+        self.assertEqual(result, "old")
+        self.assertEqual([f for f in os.listdir("/tmp") if f.startswith(".test_atomic_file.x.")], [])
+
+    def test_replace_head(self):
+        tail = bytes(range(256)) * 10
+
+        for head in [b"x" * 5, b"x" * 10, b"x" * 20]:
+            for atomic in [False, True]:
+                with open(WORKING_FILE, "wb") as f:
+                    f.write(b"y" * 10 + tail)
+
+                replace_head(WORKING_FILE, 10, head, atomic, block_size=7)
+
+                with open(WORKING_FILE, "rb") as f:
+                    self.assertEqual(f.read(), head + tail)
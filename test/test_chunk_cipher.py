@@ -0,0 +1,146 @@
+import unittest
+import io
+
+from cryptography.fernet import Fernet
+from cryptography.fernet import InvalidToken
+
+from sf2.chunk_cipher import ChunkCipher, AesGcmChunkCipher
+
+KEY = Fernet.generate_key()
+
+class TestChunkCipher(unittest.TestCase):
+
+    def test_count(self):
+        cipher = ChunkCipher(KEY, 4)
+
+        results = [cipher.count(0), cipher.count(1), cipher.count(4), cipher.count(5)]
+        expected = [1, 1, 1, 2]
+
+        self.assertEqual(results, expected)
+
+    def test_split(self):
+        cipher = ChunkCipher(KEY, 4)
+
+        results = [bytes(c) for c in cipher.split(b"0123456789")]
+        expected = [b"0123", b"4567", b"89"]
+
+        self.assertEqual(results, expected)
+
+    def test_split_stream(self):
+        cipher = ChunkCipher(KEY, 4)
+
+        results = list(cipher.split_stream(io.BytesIO(b"01234567")))
+        expected = [b"0123", b"4567"]
+
+        self.assertEqual(results, expected)
+
+    def test_split_stream_empty(self):
+        cipher = ChunkCipher(KEY, 4)
+
+        results = list(cipher.split_stream(io.BytesIO(b"")))
+        expected = [b""]
+
+        self.assertEqual(results, expected)
+
+    def test_encrypt_decrypt(self):
+        cipher = ChunkCipher(KEY, 4)
+        data = b"0123456789"
+
+        chunks = list(cipher.encrypt(cipher.split(data), cipher.count(len(data))))
+        results = b"".join(cipher.decrypt(chunks))
+
+        self.assertEqual(len(chunks), 3)
+        self.assertEqual(results, data)
+
+    def test_reorder(self):
+        cipher = ChunkCipher(KEY, 4)
+        data = b"0123456789"
+
+        chunks = list(cipher.encrypt(cipher.split(data), cipher.count(len(data))))
+        chunks[0], chunks[1] = chunks[1], chunks[0]
+
+        self.assertRaises(InvalidToken, lambda: list(cipher.decrypt(chunks)))
+
+    def test_truncate(self):
+        cipher = ChunkCipher(KEY, 4)
+        data = b"0123456789"
+
+        chunks = list(cipher.encrypt(cipher.split(data), cipher.count(len(data))))
+
+        self.assertRaises(InvalidToken, lambda: list(cipher.decrypt(chunks[:2])))
+
+    def test_wrong_chunk_size(self):
+        cipher = ChunkCipher(KEY, 4)
+        data = b"0123456789"
+
+        chunks = list(cipher.encrypt(cipher.split(data), cipher.count(len(data))))
+
+        self.assertRaises(InvalidToken, lambda: list(ChunkCipher(KEY, 8).decrypt(chunks)))
+
+    def test_encrypt_count_mismatch(self):
+        cipher = ChunkCipher(KEY, 4)
+
+        self.assertRaises(Exception, lambda: list(cipher.encrypt(cipher.split(b"0123456789"), 2)))
+
+    def test_encrypt_decrypt_workers(self):
+        cipher = ChunkCipher(KEY, 4, workers=4)
+        data = bytes(range(256))
+
+        chunks = list(cipher.encrypt(cipher.split(data), cipher.count(len(data))))
+        results = b"".join(ChunkCipher(KEY, 4).decrypt(chunks))
+
+        self.assertEqual(len(chunks), 64)
+        self.assertEqual(results, data)
+        self.assertEqual(b"".join(cipher.decrypt(chunks)), data)
+
+    def test_decrypt_workers_reorder(self):
+        cipher = ChunkCipher(KEY, 4, workers=4)
+        data = bytes(range(256))
+
+        chunks = list(cipher.encrypt(cipher.split(data), cipher.count(len(data))))
+        chunks[30], chunks[31] = chunks[31], chunks[30]
+
+        self.assertRaises(InvalidToken, lambda: list(cipher.decrypt(chunks)))
+
+    def test_encrypt_workers_count_mismatch(self):
+        cipher = ChunkCipher(KEY, 4, workers=4)
+
+        self.assertRaises(Exception, lambda: list(cipher.encrypt(cipher.split(b"0123456789"), 2)))
+
+
+
+class TestAesGcmChunkCipher(unittest.TestCase):
+
+    def test_encrypt_decrypt(self):
+        cipher = AesGcmChunkCipher(KEY, 4)
+        data = b"0123456789"
+
+        chunks = list(cipher.encrypt(cipher.split(data), cipher.count(len(data))))
+        results = b"".join(cipher.decrypt(chunks))
+
+        self.assertEqual(len(chunks), 3)
+        self.assertEqual(len(chunks[0]), AesGcmChunkCipher.NONCE_SIZE + 4 + 16)
+        self.assertEqual(results, data)
+
+    def test_reorder(self):
+        cipher = AesGcmChunkCipher(KEY, 4)
+        data = b"0123456789"
+
+        chunks = list(cipher.encrypt(cipher.split(data), cipher.count(len(data))))
+        chunks[0], chunks[1] = chunks[1], chunks[0]
+
+        self.assertRaises(InvalidToken, lambda: list(cipher.decrypt(chunks)))
+
+    def test_truncate(self):
+        cipher = AesGcmChunkCipher(KEY, 4)
+        data = b"0123456789"
+
+        chunks = list(cipher.encrypt(cipher.split(data), cipher.count(len(data))))
+
+        self.assertRaises(InvalidToken, lambda: list(cipher.decrypt(chunks[:2])))
+
+    def test_wrong_key(self):
+        cipher = AesGcmChunkCipher(KEY, 4)
+        chunks = list(cipher.encrypt(cipher.split(b"0123"), 1))
+
+        self.assertRaises(InvalidToken, lambda: list(AesGcmChunkCipher(Fernet.generate_key(), 4).decrypt(chunks)))
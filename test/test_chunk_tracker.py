@@ -0,0 +1,53 @@
+import unittest
+
+from sf2.chunk_tracker import ChunkTracker
+
+FINGERPRINT = (1, 2, 3)
+
+class TestChunkTracker(unittest.TestCase):
+
+    def test_digests(self):
+        tracker = ChunkTracker()
+
+        results = [len(tracker.digests(b"", 4)), len(tracker.digests(b"0123", 4)), len(tracker.digests(b"01234", 4))]
+        expected = [1, 1, 2]
+
+        self.assertEqual(results, expected)
+
+    def test_is_synchronized(self):
+        tracker = ChunkTracker()
+        self.assertFalse(tracker.is_synchronized(4, FINGERPRINT))
+
+        tracker.update(tracker.digests(b"0123", 4), 4, FINGERPRINT)
+
+        self.assertTrue(tracker.is_synchronized(4, FINGERPRINT))
+        self.assertFalse(tracker.is_synchronized(8, FINGERPRINT))
+        self.assertFalse(tracker.is_synchronized(4, (1, 2, 4)))
+
+        tracker.reset()
+        self.assertFalse(tracker.is_synchronized(4, FINGERPRINT))
+
+    def test_get_dirty_modified(self):
+        tracker = ChunkTracker()
+        tracker.update(tracker.digests(b"0123456789", 4), 4, FINGERPRINT)
+
+        result = tracker.get_dirty(tracker.digests(b"0123xxxx89", 4))
+
+        self.assertEqual(result, [1])
+
+    def test_get_dirty_append(self):
+        tracker = ChunkTracker()
+        tracker.update(tracker.digests(b"01234567", 4), 4, FINGERPRINT)
+
+        result = tracker.get_dirty(tracker.digests(b"0123456789", 4))
+
+        # The former last chunk is not the last one anymore
+        self.assertEqual(result, [1, 2])
+
+    def test_get_dirty_shrink(self):
+        tracker = ChunkTracker()
+        tracker.update(tracker.digests(b"0123456789", 4), 4, FINGERPRINT)
+
+        result = tracker.get_dirty(tracker.digests(b"01234567", 4))
+
+        self.assertEqual(result, [1])
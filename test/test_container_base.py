@@ -1,12 +1,20 @@
 import unittest
+from unittest.mock import patch
 import os
+import io
+import tracemalloc
 from contextlib import suppress
 
 from cryptography.exceptions import InvalidSignature
+from cryptography.fernet import Fernet
+from cryptography.fernet import InvalidToken
 
 from sf2.json_support import JsonSupport
 from sf2.msgpack_support import MsgpackSupport
 from sf2.container_base import ContainerBase
+from sf2.auth_sign import AuthSign
+from sf2.chunk_cipher import ChunkCipher, AesGcmChunkCipher
+from sf2.chunk_tracker import ChunkTracker
 
 WORKING_FILE = "/tmp/test_container.x"
 SECRET = "secret"
@@ -53,6 +61,22 @@ class TestContainer(unittest.TestCase):
 
         self.assertEqual(results, expected)
 
+    def test_create_with_data(self):
+        self.c.create(SECRET, False, ITERATIONS, b"hello")
+        results = self.c.read(SECRET, ITERATIONS)
+
+        expected = b"hello"
+
+        self.assertEqual(results, expected)
+
+    def test_create_with_data_derives_keys_once(self):
+        with patch.object(ContainerBase, "kdf", autospec=True, side_effect=ContainerBase.kdf) as base_kdf, \
+             patch.object(AuthSign, "kdf", autospec=True, side_effect=AuthSign.kdf) as auth_kdf:
+            self.c.create(SECRET, False, ITERATIONS, b"hello")
+
+        self.assertEqual(base_kdf.call_count, 1)
+        self.assertEqual(auth_kdf.call_count, 1)
+
     def test_signature_ok(self):
         container = {"auth":{}}
         
@@ -94,4 +118,336 @@ class TestContainer(unittest.TestCase):
         expected = b"hello"
 
         self.assertEqual(results, expected)
-        
\ No newline at end of file
+
+    def test_create_v3(self):
+        self.c.create(SECRET, False, ITERATIONS, b"hello")
+        container = self.c.load()
+
+        self.assertEqual(container["version"], "3")
+        self.assertEqual(len(container["data"]["chunks"]), 1)
+
+    def test_read_v2(self):
+        self.c.create(SECRET, False, ITERATIONS)
+        container = self.c.load()
+        master_data_key = self.c.get_master_data_key(container, SECRET, ITERATIONS)
+
+        container["version"] = "2"
+        container["data"] = Fernet(master_data_key).encrypt(b"hello")
+        self.c.dump(container)
+
+        self.c.write(b"hello world", SECRET, ITERATIONS)
+        results = self.c.read(SECRET, ITERATIONS)
+
+        self.assertEqual(results, b"hello world")
+        self.assertEqual(self.c.load()["version"], "2")
+
+    def test_read_v3_fernet(self):
+        with patch("sf2.container_base.DEFAULT_CHUNK_CIPHER", ChunkCipher):
+            self.c.create(SECRET, False, ITERATIONS, b"hello")
+
+        self.assertEqual(self.c.load()["data"]["cipher"], "fernet")
+        self.assertEqual(self.c.read(SECRET, ITERATIONS), b"hello")
+
+    def test_read_mapped_fernet_chunks(self):
+        self.c = ContainerBase(MsgpackSupport(WORKING_FILE, atomic=True, mapped=True))
+
+        with patch("sf2.container_base.DEFAULT_CHUNK_CIPHER", ChunkCipher):
+            self.c.create(SECRET, False, ITERATIONS, b"hello")
+
+        self.assertEqual(self.c.read(SECRET, ITERATIONS), b"hello")
+
+    def test_read_peak_memory(self):
+        data = os.urandom(16 * ChunkCipher.CHUNK_SIZE)
+        self.c = ContainerBase(MsgpackSupport(WORKING_FILE))
+        self.c.create(SECRET, True, ITERATIONS, data)
+        del data
+
+        # The plain chunks are not all kept until they are joined, only a few chunks are in
+        # memory besides the plain data
+        tracemalloc.start()
+        try:
+            results = self.c.read(SECRET, ITERATIONS)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+        self.assertEqual(len(results), 16 * ChunkCipher.CHUNK_SIZE)
+        self.assertLess(peak, len(results) + 8 * ChunkCipher.CHUNK_SIZE)
+
+    def test_raw_chunks_are_smaller(self):
+        data = bytes(range(256)) * 100
+        self.c = ContainerBase(MsgpackSupport(WORKING_FILE))
+
+        with patch("sf2.container_base.DEFAULT_CHUNK_CIPHER", ChunkCipher):
+            self.c.create(SECRET, True, ITERATIONS, data)
+        fernet_size = os.path.getsize(WORKING_FILE)
+
+        self.c.create(SECRET, True, ITERATIONS, data)
+        raw_size = os.path.getsize(WORKING_FILE)
+
+        self.assertEqual(self.c.load()["data"]["cipher"], "aes-256-gcm")
+        self.assertLess(raw_size, len(data) + 1000)
+        self.assertLess(raw_size, fernet_size)
+
+    def test_unsupported_version(self):
+        self.c.create(SECRET, False, ITERATIONS)
+        container = self.c.load()
+        container["version"] = "42"
+        self.c.dump(container)
+
+        self.assertRaises(Exception, self.c.read, SECRET, ITERATIONS)
+
+    def test_create_and_read_stream(self):
+        data = bytes(range(256)) * 10
+
+        for support in (JsonSupport(WORKING_FILE), MsgpackSupport(WORKING_FILE), MsgpackSupport(WORKING_FILE, atomic=True, mapped=True)):
+            self.c = ContainerBase(support)
+
+            with patch.object(ChunkCipher, "CHUNK_SIZE", 100):
+                self.c.create_stream(io.BytesIO(data), len(data), SECRET, True, ITERATIONS)
+
+            output = io.BytesIO()
+            self.c.read_stream(output, SECRET, ITERATIONS)
+
+            self.assertEqual(len(self.c.load()["data"]["chunks"]), 26)
+            self.assertEqual(output.getvalue(), data)
+            self.assertEqual(self.c.read(SECRET, ITERATIONS), data)
+
+    def test_read_range(self):
+        data = bytes(range(256)) * 10
+
+        for support in (JsonSupport(WORKING_FILE), MsgpackSupport(WORKING_FILE), MsgpackSupport(WORKING_FILE, atomic=True, mapped=True)):
+            self.c = ContainerBase(support)
+
+            with patch.object(ChunkCipher, "CHUNK_SIZE", 100):
+                self.c.create(SECRET, True, ITERATIONS, data)
+
+            for offset, length in ((0, 10), (95, 10), (250, 500), (2550, 100), (3000, 10), (0, 0)):
+                results = self.c.read_range(offset, length, SECRET, ITERATIONS)
+                self.assertEqual(results, data[offset:offset+length])
+
+    def test_read_range_decrypt_only_needed_chunks(self):
+        data = bytes(range(256)) * 10
+        support = MsgpackSupport(WORKING_FILE)
+        self.c = ContainerBase(support)
+
+        with patch.object(ChunkCipher, "CHUNK_SIZE", 100):
+            self.c.create(SECRET, True, ITERATIONS, data)
+
+        with patch.object(AesGcmChunkCipher, "decrypt_chunk", autospec=True, side_effect=AesGcmChunkCipher.decrypt_chunk) as decrypt_chunk:
+            results = self.c.read_range(1050, 100, SECRET, ITERATIONS)
+
+        self.assertEqual(results, data[1050:1150])
+        self.assertEqual(decrypt_chunk.call_count, 2)
+
+    def test_read_range_wrong_size(self):
+        data = bytes(range(256)) * 10
+
+        with patch.object(ChunkCipher, "CHUNK_SIZE", 100):
+            self.c.create(SECRET, False, ITERATIONS, data)
+
+        container = self.c.load()
+        container["data"]["size"] = 2599
+        self.c.dump(container)
+
+        self.assertRaises(InvalidToken, self.c.read_range, 2500, 100, SECRET, ITERATIONS)
+        self.assertRaises(InvalidToken, self.c.read, SECRET, ITERATIONS)
+
+    def test_read_range_v2(self):
+        self.c.create(SECRET, False, ITERATIONS)
+        container = self.c.load()
+        master_data_key = self.c.get_master_data_key(container, SECRET, ITERATIONS)
+
+        container["version"] = "2"
+        container["data"] = Fernet(master_data_key).encrypt(b"hello world")
+        self.c.dump(container)
+
+        results = self.c.read_range(6, 100, SECRET, ITERATIONS)
+
+        self.assertEqual(results, b"world")
+
+
+class TestContainerIncremental(unittest.TestCase):
+
+    def setUp(self) -> None:
+        support = MsgpackSupport(WORKING_FILE)
+        self.c = ContainerBase(support)
+
+    def tearDown(self) -> None:
+        with suppress(FileNotFoundError):
+            os.remove(WORKING_FILE)
+
+    def test_write_only_dirty_chunks(self):
+        data = bytearray(bytes(range(256)) * 10)
+        tracker = ChunkTracker()
+
+        with patch.object(ChunkCipher, "CHUNK_SIZE", 100):
+            self.c.create(SECRET, False, ITERATIONS, bytes(data))
+
+        self.c.read(SECRET, ITERATIONS, tracker=tracker)
+        data[1050:1060] = b"x" * 10
+
+        with patch.object(AesGcmChunkCipher, "encrypt_chunk", autospec=True, side_effect=AesGcmChunkCipher.encrypt_chunk) as encrypt_chunk:
+            self.c.write(bytes(data), SECRET, ITERATIONS, tracker=tracker)
+
+        self.assertEqual(encrypt_chunk.call_count, 1)
+        self.assertEqual(self.c.read(SECRET, ITERATIONS), data)
+
+    def test_write_append_and_shrink(self):
+        data = bytes(range(256)) * 10
+        tracker = ChunkTracker()
+
+        with patch.object(ChunkCipher, "CHUNK_SIZE", 100):
+            self.c.create(SECRET, False, ITERATIONS, data)
+
+        self.c.read(SECRET, ITERATIONS, tracker=tracker)
+
+        self.c.write(data + b"appended" * 30, SECRET, ITERATIONS, tracker=tracker)
+        self.assertEqual(self.c.read(SECRET, ITERATIONS), data + b"appended" * 30)
+
+        with patch.object(AesGcmChunkCipher, "encrypt_chunk", autospec=True, side_effect=AesGcmChunkCipher.encrypt_chunk) as encrypt_chunk:
+            self.c.write(data[:1950], SECRET, ITERATIONS, tracker=tracker)
+
+        self.assertEqual(encrypt_chunk.call_count, 1)
+        self.assertEqual(self.c.read(SECRET, ITERATIONS), data[:1950])
+        self.assertEqual(len(self.c.load()["data"]["chunks"]), 20)
+
+    def test_write_file_changed(self):
+        data = bytes(range(256)) * 10
+        tracker = ChunkTracker()
+
+        with patch.object(ChunkCipher, "CHUNK_SIZE", 100):
+            self.c.create(SECRET, False, ITERATIONS, data)
+
+        self.c.read(SECRET, ITERATIONS, tracker=tracker)
+
+        # Another writer changed the file, the tracker is out of date
+        with patch.object(ChunkCipher, "CHUNK_SIZE", 100):
+            self.c.write(b"other" * 100, SECRET, ITERATIONS)
+
+        with patch.object(ChunkCipher, "CHUNK_SIZE", 100), \
+                patch.object(AesGcmChunkCipher, "encrypt_chunk", autospec=True, side_effect=AesGcmChunkCipher.encrypt_chunk) as encrypt_chunk:
+            self.c.write(data, SECRET, ITERATIONS, tracker=tracker)
+
+        self.assertEqual(encrypt_chunk.call_count, 26)
+        self.assertEqual(self.c.read(SECRET, ITERATIONS), data)
+
+    def test_data_digest(self):
+        for support in (JsonSupport(WORKING_FILE), MsgpackSupport(WORKING_FILE)):
+            self.c = ContainerBase(support)
+            self.c.create(SECRET, True, ITERATIONS, b"hello")
+            digest = self.c.get_data_digest()
+
+            # The header changed, not the data
+            self.c.change_password(SECRET, "new_pwd", ITERATIONS)
+            self.assertEqual(self.c.get_data_digest(), digest)
+
+            self.c.write(b"hello", "new_pwd", ITERATIONS)
+            self.assertNotEqual(self.c.get_data_digest(), digest)
+
+    def test_data_digest_chunks(self):
+        data = bytes(range(256)) * 10
+
+        for support in (JsonSupport(WORKING_FILE), MsgpackSupport(WORKING_FILE), MsgpackSupport(WORKING_FILE, atomic=True, mapped=True)):
+            self.c = ContainerBase(support)
+            with patch.object(ChunkCipher, "CHUNK_SIZE", 100):
+                self.c.create(SECRET, True, ITERATIONS, data)
+
+            # Stable across loads of the same file, whatever the type of the loaded chunks
+            digest = self.c.get_data_digest()
+            self.assertEqual(self.c.get_data_digest(), digest)
+
+            # The same data section, written with its fields in another order
+            container = self.c.load()
+            container["data"] = dict(reversed(list(container["data"].items())))
+            self.c.dump(container)
+            self.assertEqual(self.c.get_data_digest(), digest)
+
+            container = self.c.load()
+            chunk = bytearray(container["data"]["chunks"][3])
+            chunk[-1] ^= 1
+            container["data"]["chunks"][3] = bytes(chunk)
+            self.c.dump(container)
+
+            self.assertNotEqual(self.c.get_data_digest(), digest)
+
+
+class TestContainerTransaction(unittest.TestCase):
+
+    def setUp(self) -> None:
+        support = MsgpackSupport(WORKING_FILE)
+        self.c = ContainerBase(support)
+        self.c.create(SECRET, False, ITERATIONS, b"hello")
+
+    def tearDown(self) -> None:
+        with suppress(FileNotFoundError):
+            os.remove(WORKING_FILE)
+
+    def test_change_password(self):
+        # Only the header is read and written, the data is left as it is
+        with patch.object(MsgpackSupport, "load", autospec=True, side_effect=MsgpackSupport.load) as load, \
+                patch.object(MsgpackSupport, "dump", autospec=True, side_effect=MsgpackSupport.dump) as dump, \
+                patch.object(MsgpackSupport, "load_header", autospec=True, side_effect=MsgpackSupport.load_header) as load_header, \
+                patch.object(MsgpackSupport, "dump_header", autospec=True, side_effect=MsgpackSupport.dump_header) as dump_header, \
+                patch.object(ContainerBase, "kdf", autospec=True, side_effect=ContainerBase.kdf) as kdf:
+            with self.c.transaction(SECRET, ITERATIONS) as transaction:
+                transaction.change_password("new secret")
+                transaction.get_container()["auth"]["users"]["foo@bar"] = {}
+
+        self.assertEqual([load.call_count, dump.call_count, load_header.call_count, dump_header.call_count, kdf.call_count], [0, 0, 1, 1, 2])
+        self.assertEqual(self.c.read("new secret", ITERATIONS), b"hello")
+        self.assertIn("foo@bar", self.c.load()["auth"]["users"])
+
+    def test_change_password_deep(self):
+        with patch.object(MsgpackSupport, "load", autospec=True, side_effect=MsgpackSupport.load) as load, \
+                patch.object(MsgpackSupport, "dump", autospec=True, side_effect=MsgpackSupport.dump) as dump:
+            with self.c.transaction(SECRET, ITERATIONS) as transaction:
+                transaction.change_password("new secret", deep=True)
+
+        self.assertEqual([load.call_count, dump.call_count], [1, 1])
+        self.assertEqual(self.c.read("new secret", ITERATIONS), b"hello")
+
+    def test_change_password_keep_data(self):
+        data = self.c.load()["data"]
+
+        self.c.change_password(SECRET, "new secret", ITERATIONS)
+
+        self.assertEqual(self.c.load()["data"], data)
+        self.assertEqual(self.c.read("new secret", ITERATIONS), b"hello")
+        self.assertRaises(Exception, self.c.read, SECRET, ITERATIONS)
+
+    def test_change_password_deep(self):
+        data = self.c.load()["data"]
+
+        self.c.change_password(SECRET, "new secret", ITERATIONS, deep=True)
+
+        self.assertNotEqual(self.c.load()["data"], data)
+        self.assertEqual(self.c.read("new secret", ITERATIONS), b"hello")
+
+    def test_change_password_keep_version(self):
+        container = self.c.load()
+        master_data_key = self.c.get_master_data_key(container, SECRET, ITERATIONS)
+        container["version"] = "2"
+        container["data"] = Fernet(master_data_key).encrypt(b"hello world")
+        self.c.sign_and_dump(container, SECRET, ITERATIONS)
+
+        self.c.change_password(SECRET, "new secret", ITERATIONS)
+
+        self.assertEqual(self.c.load()["version"], "2")
+        self.assertEqual(self.c.read("new secret", ITERATIONS), b"hello world")
+
+    def test_failed(self):
+        def run():
+            with self.c.transaction(SECRET, ITERATIONS) as transaction:
+                transaction.change_password("new secret")
+                raise Exception("failed")
+
+        self.assertRaises(Exception, run)
+        self.assertEqual(self.c.read(SECRET, ITERATIONS), b"hello")
+
+    def test_wrong_password(self):
+        def run():
+            with self.c.transaction("wrong", ITERATIONS) as transaction:
+                transaction.get_master_key()
+
+        self.assertRaises(Exception, run)
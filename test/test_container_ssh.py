@@ -5,6 +5,13 @@ from contextlib import suppress
 from sf2.container_ssh import ContainerSSH
 from sf2.json_support import JsonSupport
 from sf2.container_base import ContainerBase
+from sf2.key_index import get_public_key_fingerprint
+
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
+from cryptography.hazmat.primitives.serialization import Encoding
+from cryptography.hazmat.primitives.serialization import PrivateFormat
+from cryptography.hazmat.primitives.serialization import PublicFormat
+from cryptography.hazmat.primitives.serialization import NoEncryption
 
 
 WORKING_FILE = "/tmp/test.x"
@@ -12,6 +19,8 @@ SECRET = "secret"
 ITERATIONS = 100
 PRIVATE_SSH_KEY = "./test/.ssh/id_rsa"
 PUBLIC_SSH_KEY = "./test/.ssh/id_rsa.pub"
+PRIVATE_ED25519_KEY = "/tmp/test_id_ed25519"
+PUBLIC_ED25519_KEY = "/tmp/test_id_ed25519.pub"
 
 
 class TestContainerSSH(unittest.TestCase):
@@ -120,4 +129,80 @@ class TestContainerSSH(unittest.TestCase):
         results = self.c.list_ssh_key("tesu.*")
 
         self.assertEqual([], list(results))
-        
\ No newline at end of file
+        
+    def test_ed25519_ssh_key(self):
+        private_key = Ed25519PrivateKey.generate()
+        with open(PRIVATE_ED25519_KEY, "wb") as f:
+            f.write(private_key.private_bytes(Encoding.PEM, PrivateFormat.OpenSSH, NoEncryption()))
+        with open(PUBLIC_ED25519_KEY, "wb") as f:
+            f.write(private_key.public_key().public_bytes(Encoding.OpenSSH, PublicFormat.OpenSSH) + b" ed@test")
+
+        self.base.create(SECRET, False, _iterations=ITERATIONS)
+        self.c.add_ssh_key(SECRET, PUBLIC_ED25519_KEY, _iterations=ITERATIONS)
+        self.c.add_ssh_key(SECRET, PUBLIC_SSH_KEY, _iterations=ITERATIONS)
+
+        self.c.write(b"hello", "ed@test", PRIVATE_ED25519_KEY, None)
+        self.c.update_master_key(SECRET, _iterations=ITERATIONS)
+
+        results = [self.c.read("ed@test", PRIVATE_ED25519_KEY, None), self.c.read("test@test", PRIVATE_SSH_KEY, None)]
+        expected = [b"hello", b"hello"]
+
+        self.assertEqual(results, expected)
+        self.assertRaises(Exception, self.c.read, "test@test", PRIVATE_ED25519_KEY, None)
+
+    def test_find_auth_id_by_fingerprint(self):
+        self.base.create(SECRET, False, _iterations=ITERATIONS)
+        self.c.add_ssh_key(SECRET, PUBLIC_SSH_KEY, "runner@ci", _iterations=ITERATIONS)
+        self.c.write(b"hello", "runner@ci", PRIVATE_SSH_KEY, None)
+
+        fingerprint = get_public_key_fingerprint(open(PUBLIC_SSH_KEY).read())
+
+        self.assertEqual(self.base.load()["auth"]["fingerprints"], {fingerprint : "runner@ci"})
+        self.assertEqual(self.c.read(None, PRIVATE_SSH_KEY, None), b"hello")
+        self.assertEqual(self.c.read("unknown@test", PRIVATE_SSH_KEY, None), b"hello")
+        self.assertEqual(list(self.c.list_ssh_key(fingerprint)), ["runner@ci"])
+
+    def test_index_without_fingerprints(self):
+        # Containers written before the index
+        self.base.create(SECRET, False, _iterations=ITERATIONS)
+        self.c.add_ssh_key(SECRET, PUBLIC_SSH_KEY, _iterations=ITERATIONS)
+        container = self.base.load()
+        del container["auth"]["fingerprints"]
+        self.base.sign_and_dump(container, SECRET, ITERATIONS)
+
+        self.assertEqual(self.c.read(None, PRIVATE_SSH_KEY, None), b"")
+
+    def test_write_without_fingerprints(self):
+        # The index built for the lookup is not written, the auth section stays signed
+        self.base.create(SECRET, False, _iterations=ITERATIONS)
+        self.c.add_ssh_key(SECRET, PUBLIC_SSH_KEY, _iterations=ITERATIONS)
+        container = self.base.load()
+        del container["auth"]["fingerprints"]
+        self.base.sign_and_dump(container, SECRET, ITERATIONS)
+
+        self.c.write(b"world", None, PRIVATE_SSH_KEY)
+
+        self.assertEqual(self.base.read(SECRET, ITERATIONS), b"world")
+        self.assertNotIn("fingerprints", self.base.load()["auth"])
+
+    def test_add_ssh_key_without_fingerprints(self):
+        # The index is saved by the signed operations
+        self.base.create(SECRET, False, _iterations=ITERATIONS)
+        container = self.base.load()
+        container["auth"].pop("fingerprints", None)
+        self.base.sign_and_dump(container, SECRET, ITERATIONS)
+
+        self.c.add_ssh_key(SECRET, PUBLIC_SSH_KEY, _iterations=ITERATIONS)
+
+        with open(PUBLIC_SSH_KEY) as f:
+            fingerprint = get_public_key_fingerprint(f.read())
+        self.assertEqual(self.base.load()["auth"]["fingerprints"], {fingerprint : "test@test"})
+        self.assertEqual(self.base.read(SECRET, ITERATIONS), b"")
+
+    def test_remove_ssh_key_update_index(self):
+        self.base.create(SECRET, False, _iterations=ITERATIONS)
+        self.c.add_ssh_key(SECRET, PUBLIC_SSH_KEY, _iterations=ITERATIONS)
+        self.c.remove_ssh_key(SECRET, "test@test", _iterations=ITERATIONS)
+
+        self.assertEqual(self.base.load()["auth"]["fingerprints"], {})
+        self.assertRaises(Exception, self.c.read, None, PRIVATE_SSH_KEY, None)
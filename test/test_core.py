@@ -2,6 +2,7 @@ import unittest
 import os
 import os.path
 import shutil
+from unittest.mock import patch
 
 from sf2.core import Core
 
@@ -64,6 +65,28 @@ class TestCore(unittest.TestCase):
 
         self.assertFalse(result)
 
+    def test_verify_many(self):
+        core = Core(_iterations=100)
+        filenames = [os.path.join(TEST_DIR, f"encrypted_{i}.x") for i in range(4)]
+        for filename in filenames:
+            core.encrypt(SOURCE, filename, PASSWORD)
+
+        results = dict(core.verify_many(filenames + [SOURCE], PASSWORD, jobs=2))
+
+        expected = {filename : True for filename in filenames}
+        expected[SOURCE] = False
+        self.assertEqual(results, expected)
+
+    def test_verify_ssh_many(self):
+        core = Core(_iterations=100)
+        core.encrypt(SOURCE, ENCRYPTED_FILE, PASSWORD)
+        core.ssh_add(ENCRYPTED_FILE, PASSWORD, PUBLIC_KEY, AUTH_ID)
+
+        secrets = [(ENCRYPTED_FILE, PRIVATE_KEY, AUTH_ID), (ENCRYPTED_FILE, SOURCE, "other@test")]
+        results = list(core.verify_ssh_many(secrets, jobs=2))
+
+        self.assertEqual(sorted(results), [(ENCRYPTED_FILE, False), (ENCRYPTED_FILE, True)])
+
     def test_open(self):
         core = Core(_iterations=100)
         core.encrypt(SOURCE, ENCRYPTED_FILE, PASSWORD)
@@ -164,4 +187,106 @@ class TestCore(unittest.TestCase):
         core.change_password(ENCRYPTED_FILE, PASSWORD, "NEW SECRET")
 
         result = core.verify_ssh(ENCRYPTED_FILE, PRIVATE_KEY, None, AUTH_ID)
-        self.assertTrue(result)
\ No newline at end of file
+        self.assertTrue(result)
+
+    def test_ssh_rm_deep(self):
+
+        core = Core(_iterations=100)
+        core.encrypt(SOURCE, ENCRYPTED_FILE, PASSWORD)
+        core.ssh_add(ENCRYPTED_FILE, PASSWORD, PUBLIC_KEY, AUTH_ID)
+        core.ssh_add(ENCRYPTED_FILE, PASSWORD, "test/.ssh/custom_rsa.pub", "foo@bar")
+
+        core.ssh_rm(ENCRYPTED_FILE, PASSWORD, "foo@bar", deep=True)
+
+        self.assertTrue(core.verify_ssh(ENCRYPTED_FILE, PRIVATE_KEY, None, AUTH_ID))
+        self.assertTrue(core.verify(ENCRYPTED_FILE, PASSWORD))
+
+    def test_decrypt_with_session(self):
+
+        core = Core(_iterations=100, session_ttl=60)
+        core.encrypt(SOURCE, ENCRYPTED_FILE, PASSWORD)
+
+        core.decrypt(ENCRYPTED_FILE, OUTPUT, PASSWORD)
+        # The cached keys are not given to another password
+        self.assertRaises(Exception, core.decrypt, ENCRYPTED_FILE, OUTPUT, "wrong password", force=True)
+        core.decrypt(ENCRYPTED_FILE, OUTPUT, PASSWORD, force=True)
+
+        core.lock()
+
+        self.assertRaises(Exception, core.decrypt, ENCRYPTED_FILE, OUTPUT, "wrong password", force=True)
+
+    def test_decrypt_failed_remove_output(self):
+
+        core = Core(_iterations=100)
+        core.encrypt(SOURCE, ENCRYPTED_FILE, PASSWORD)
+
+        self.assertRaises(Exception, core.decrypt, ENCRYPTED_FILE, OUTPUT, "wrong password")
+        self.assertFalse(os.path.exists(OUTPUT))
+
+    def test_decrypt_failed_keep_output(self):
+
+        core = Core(_iterations=100)
+        core.encrypt(SOURCE, ENCRYPTED_FILE, PASSWORD)
+
+        existing = os.urandom(1024)
+        with open(OUTPUT, "wb") as f:
+            f.write(existing)
+
+        self.assertRaises(Exception, core.decrypt, ENCRYPTED_FILE, OUTPUT, "wrong password", force=True)
+        self.assertRaises(Exception, core.decrypt_ssh, ENCRYPTED_FILE, OUTPUT, PRIVATE_KEY, None, "nobody@test", force=True)
+
+        with open(OUTPUT, "rb") as f:
+            self.assertEqual(f.read(), existing)
+        self.assertEqual(sorted(os.listdir(TEST_DIR)), ["encrypted.x", "output.txt", "source.txt"])
+
+    def test_decrypt_corrupted_keep_output(self):
+        with open(SOURCE, "wb") as f:
+            f.write(os.urandom(3 * 1024 * 1024 + 10))
+
+        core = Core(_iterations=100)
+        core.encrypt(SOURCE, ENCRYPTED_FILE, PASSWORD)
+
+        # The last chunk fails once the first ones are written
+        with open(ENCRYPTED_FILE, "r+b") as f:
+            f.seek(-1, os.SEEK_END)
+            last = f.read(1)
+            f.seek(-1, os.SEEK_END)
+            f.write(bytes([last[0] ^ 1]))
+
+        existing = os.urandom(1024)
+        with open(OUTPUT, "wb") as f:
+            f.write(existing)
+
+        self.assertRaises(Exception, core.decrypt, ENCRYPTED_FILE, OUTPUT, PASSWORD, force=True)
+
+        with open(OUTPUT, "rb") as f:
+            self.assertEqual(f.read(), existing)
+        self.assertEqual(sorted(os.listdir(TEST_DIR)), ["encrypted.x", "output.txt", "source.txt"])
+
+    def test_encrypt_and_decrypt_workers(self):
+        with open(SOURCE, "wb") as f:
+            f.write(os.urandom(3 * 1024 * 1024 + 10))
+
+        core = Core(_iterations=100, workers=4)
+        core.encrypt(SOURCE, ENCRYPTED_FILE, PASSWORD)
+        core.decrypt(ENCRYPTED_FILE, OUTPUT, PASSWORD)
+
+        with open(SOURCE, "rb") as f:
+            expected = f.read()
+        with open(OUTPUT, "rb") as f:
+            result = f.read()
+
+        self.assertEqual(result, expected)
+
+    def test_ssh_rm_atomic_single_write(self):
+
+        core = Core(_iterations=100, atomic=True)
+        core.encrypt(SOURCE, ENCRYPTED_FILE, PASSWORD)
+        core.ssh_add(ENCRYPTED_FILE, PASSWORD, PUBLIC_KEY, AUTH_ID)
+
+        with patch("sf2.atomic_file.os.replace", side_effect=os.replace) as replace:
+            core.ssh_rm(ENCRYPTED_FILE, PASSWORD, AUTH_ID)
+
+        self.assertEqual(replace.call_count, 1)
+        self.assertEqual(len(core.ssh_ls(ENCRYPTED_FILE)), 0)
+        self.assertTrue(core.verify(ENCRYPTED_FILE, PASSWORD))
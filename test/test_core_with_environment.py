@@ -238,4 +238,12 @@ class TestCore(unittest.TestCase):
         result = core.verify_ssh(ENCRYPTED_FILE, config_file=CONFIG_FILE_PATH)
         self.assertTrue(result)
 
-    
\ No newline at end of file
+    
+    def test_get_auth_id_from_ed25519_public_key(self):
+        public_key_file = os.path.join(TEST_DIR, "id_ed25519.pub")
+        with open(public_key_file, "w") as f:
+            f.write("ssh-ed25519 AAAAC3NzaC1lZDI1NTE5AAAAIGQhKFhbqBJLlJ0lxGOg3P4QX1OzR0n4Yj4bQxqk0xPb ed@test\n")
+
+        core = CoreWithEnvironment(_iterations=100)
+
+        self.assertEqual(core.get_auth_id_from_public_key(public_key_file), "ed@test")
@@ -0,0 +1,66 @@
+import unittest
+import os
+import sys
+import json
+import shutil
+import subprocess
+
+from sf2.core import Core
+
+TEST_DIR = "/tmp/test_import_budget"
+PASSWORD = "password"
+ENCRYPTED_FILE = os.path.join(TEST_DIR, "encrypted.x")
+
+# Modules only needed by the GUI, open, the configuration or the administration commands
+HEAVY_MODULES = ["pywebio", "webview", "sf2.gui", "password_validator", "yaml", "inotify", "flufl", "multiprocessing"]
+# Seconds, generous to stay reliable on slow machines
+IMPORT_BUDGET = 1.0
+
+SCRIPT = """
+import sys
+import time
+import json
+
+start = time.perf_counter()
+from sf2.sf2 import SF2
+import_time = time.perf_counter() - start
+
+try:
+    SF2(sys.argv[1:], _iterations=100).main()
+except SystemExit:
+    pass
+
+heavy = {heavy}
+loaded = [m for m in heavy if any(k == m or k.startswith(m + ".") for k in sys.modules)]
+print(json.dumps({{"import_time" : import_time, "loaded" : loaded}}))
+"""
+
+class TestImportBudget(unittest.TestCase):
+    def setUp(self) -> None:
+        try:
+            shutil.rmtree(TEST_DIR)
+        except:
+            pass
+        os.mkdir(TEST_DIR)
+
+    def run_cli(self, *args)->dict:
+        script = SCRIPT.format(heavy=repr(HEAVY_MODULES))
+        output = subprocess.check_output([sys.executable, "-c", script] + list(args))
+        return json.loads(output.decode().strip().splitlines()[-1])
+
+    def test_verify(self):
+        core = Core(_iterations=100)
+        core.new(ENCRYPTED_FILE, PASSWORD)
+
+        result = self.run_cli("verify", "--password", "-m", PASSWORD, ENCRYPTED_FILE)
+
+        self.assertEqual(result["loaded"], [])
+        self.assertLess(result["import_time"], IMPORT_BUDGET)
+
+    def test_decrypt(self):
+        core = Core(_iterations=100)
+        core.new(ENCRYPTED_FILE, PASSWORD)
+
+        result = self.run_cli("decrypt", "--password", "-m", PASSWORD, "-i", ENCRYPTED_FILE, "-o", os.path.join(TEST_DIR, "plain.txt"))
+
+        self.assertEqual(result["loaded"], [])
@@ -0,0 +1,92 @@
+import unittest
+import os
+import time
+import shutil
+import threading
+
+from sf2.inotify_watcher import InotifyWatcher
+
+TEST_DIR = "/tmp/test_inotify_watcher"
+WATCHED = os.path.join(TEST_DIR, "watched.txt")
+
+
+class TestInotifyWatcher(unittest.TestCase):
+    def setUp(self) -> None:
+        shutil.rmtree(TEST_DIR, ignore_errors=True)
+        os.makedirs(TEST_DIR)
+        open(WATCHED, "w").close()
+
+        self.events = 0
+
+    def tearDown(self) -> None:
+        shutil.rmtree(TEST_DIR, ignore_errors=True)
+
+    def callback(self):
+        self.events += 1
+
+    def write(self, data:str):
+        with open(WATCHED, "w") as f:
+            f.write(data)
+
+    def test_write(self):
+        with InotifyWatcher(WATCHED, self.callback):
+            self.write("a")
+            deadline = time.monotonic() + 5
+            while self.events == 0 and time.monotonic() < deadline:
+                time.sleep(0.01)
+
+            self.assertEqual(self.events, 1)
+
+    def test_drain(self):
+        # The write is done just before the stop, it is handled by the stop
+        with InotifyWatcher(WATCHED, self.callback):
+            self.write("a")
+
+        self.assertEqual(self.events, 1)
+
+    def test_no_drain(self):
+        watcher = InotifyWatcher(WATCHED, self.callback, drain=False)
+        watcher._run = lambda: None
+        with watcher:
+            self.write("a")
+
+        self.assertEqual(self.events, 0)
+
+    def test_stop(self):
+        threads = threading.active_count()
+        start = time.monotonic()
+
+        with InotifyWatcher(WATCHED, self.callback):
+            self.assertEqual(threading.active_count(), threads + 1)
+
+        # Stopped without waiting for an event or a timeout
+        self.assertLess(time.monotonic() - start, 0.5)
+        self.assertEqual(threading.active_count(), threads)
+
+    def test_missing_file(self):
+        with self.assertRaises(Exception):
+            InotifyWatcher(os.path.join(TEST_DIR, "missing"), self.callback).start()
+
+
+    def test_follow_rename(self):
+        other = os.path.join(TEST_DIR, "other.txt")
+        renamed = os.path.join(TEST_DIR, "renamed.txt")
+
+        with InotifyWatcher(WATCHED, self.callback, follow_rename=True):
+            # Files of the same directory are ignored
+            with open(other, "w") as f:
+                f.write("a")
+            os.rename(other, renamed)
+
+            with open(other, "w") as f:
+                f.write("b")
+            os.rename(other, WATCHED)
+
+            # The new file is watched too
+            self.write("c")
+
+        self.assertEqual(self.events, 2)
+
+    def test_follow_rename_missing_file(self):
+        with self.assertRaises(FileNotFoundError):
+            InotifyWatcher(os.path.join(TEST_DIR, "missing"), self.callback, follow_rename=True).start()
@@ -0,0 +1,70 @@
+import unittest
+
+from sf2.json_codec import JsonCodec
+
+
+class TestJsonCodec(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.codec = JsonCodec()
+        self.container = {
+            "version" : "3",
+            "auth" : {
+                "master_iv" : b"\x00\x01",
+                "encrypted_master_data_key" : b"gAAAAAtoken",
+                "users" : {
+                    "test@test" : {
+                        "ssh" : {
+                            "public-key" : "abcd",
+                            "encrypted_master_key" : b"\xff"
+                        }
+                    }
+                },
+                "challenge" : None,
+                "signature" : None
+            },
+            "auth_signature" : b"\x02",
+            "data" : {
+                "cipher" : "aes-256-gcm",
+                "chunk_size" : 10,
+                "size" : 1,
+                "chunks" : [b"\x03"]
+            }
+        }
+
+    def test_encode(self):
+        result = self.codec.encode(self.container)
+
+        self.assertEqual(result["json_format"], 2)
+        self.assertEqual(result["auth"]["master_iv"], "AAE=")
+        # Fernet tokens are already base64
+        self.assertEqual(result["auth"]["encrypted_master_data_key"], "gAAAAAtoken")
+        self.assertEqual(result["auth"]["users"]["test@test"]["ssh"], {"public-key" : "abcd", "encrypted_master_key" : "/w=="})
+        self.assertEqual(result["data"], {"cipher" : "aes-256-gcm", "chunk_size" : 10, "size" : 1, "count" : 1, "chunks" : ["Aw=="]})
+
+    def test_decode(self):
+        result = self.codec.decode(self.codec.encode(self.container))
+
+        # "abcd" is valid base64, but public-key is a text field
+        self.assertEqual(result, self.container)
+
+    def test_fernet_data(self):
+        self.container["data"] = {"cipher" : "fernet", "chunk_size" : 10, "size" : 1, "chunks" : [b"gAAAAAchunk"]}
+        result = self.codec.encode(self.container)
+
+        self.assertEqual(result["data"]["chunks"], ["gAAAAAchunk"])
+        self.assertEqual(self.codec.decode(result), self.container)
+
+    def test_version_2_data(self):
+        self.container["data"] = b"gAAAAAdata"
+        result = self.codec.encode(self.container)
+
+        self.assertEqual(result["data"], "gAAAAAdata")
+        self.assertEqual(self.codec.decode(result), self.container)
+
+    def test_unknown_bytes(self):
+        container = {"x" : b"bytes", "y" : "Ynl0ZXM=", "z" : [b"b"]}
+        result = self.codec.encode(container)
+
+        self.assertEqual(result["x"], {"$base64" : "Ynl0ZXM="})
+        self.assertEqual(self.codec.decode(result), container)
@@ -1,4 +1,6 @@
 import unittest
+import json
+from unittest.mock import patch
 from pprint import pprint
 import os
 from contextlib import suppress
@@ -64,4 +66,74 @@ class TestJsonSupport(unittest.TestCase):
         js.dump(container)
         result = js.load()
 
-        self.assertDictEqual(result, container)
\ No newline at end of file
+        self.assertDictEqual(result, container)
+
+    def test_load_header(self):
+        js = JsonSupport(WORKING_FILE)
+        container = {"data" : b"data" * 1000, "version" : "3", "auth" : {"users" : {}}, "auth_signature" : b"signature"}
+        js.dump(container)
+
+        with patch.object(JsonSupport, "READ_SIZE", 16):
+            result = js.load_header()
+
+        self.assertEqual(result, {"version" : "3", "auth" : {"users" : {}}, "auth_signature" : b"signature"})
+
+    def test_load_header_data_first(self):
+        # Files written before the data section was last
+        container = {"version" : "3", "auth" : {"users" : {}}, "data" : "ZGF0YQ==", "auth_signature" : "c2lnbmF0dXJl"}
+        with open(WORKING_FILE, "w") as f:
+            json.dump(container, f)
+
+        result = JsonSupport(WORKING_FILE).load_header()
+
+        self.assertEqual(result, {"version" : "3", "auth" : {"users" : {}}, "auth_signature" : b"signature"})
+
+    def test_dump_header(self):
+        js = JsonSupport(WORKING_FILE)
+        container = {"version" : "3", "auth" : {"users" : {}}, "auth_signature" : b"signature", "data" : {"chunks" : [b"a", b"b"]}}
+        js.dump(container)
+
+        container["auth"]["users"]["foo@bar"] = {}
+        js.dump_header({k:v for k, v in container.items() if k != "data"})
+
+        self.assertEqual(js.load(), container)
+
+    def test_load_legacy(self):
+        # Files written before JsonCodec, every string is tried as base64
+        container = {"version" : "3", "auth" : {"users" : {}}, "auth_signature" : b"signature", "data" : b"token"}
+        js = JsonSupport(WORKING_FILE)
+        with open(WORKING_FILE, "w") as f:
+            json.dump(js.encode(container), f)
+
+        self.assertEqual(js.load(), container)
+        self.assertEqual(js.load_stream(), container)
+
+        # Written again with the schema
+        js.dump_header({"version" : "3", "auth" : {"users" : {"foo@bar" : {}}}, "auth_signature" : b"signature"})
+        container["auth"]["users"]["foo@bar"] = {}
+
+        with open(WORKING_FILE) as f:
+            self.assertEqual(json.load(f)["data"], "token")
+        self.assertEqual(js.load(), container)
+
+    def test_token_not_encoded_twice(self):
+        js = JsonSupport(WORKING_FILE)
+        js.dump({"version" : "2", "data" : b"gAAAAA" * 1000})
+
+        self.assertLess(os.path.getsize(WORKING_FILE), 6100)
+
+    def test_dump_and_load_stream(self):
+        js = JsonSupport(WORKING_FILE)
+
+        container = {
+            "version" : "3",
+            "data" : {
+                "cipher" : "fernet"
+            }
+        }
+
+        js.dump_stream(container, (bytes([i]) for i in range(3)), 3)
+        result = js.load_stream()
+
+        self.assertEqual(len(result["data"]["chunks"]), 3)
+        self.assertEqual(list(result["data"]["chunks"]), [b"\x00", b"\x01", b"\x02"])
@@ -0,0 +1,139 @@
+import unittest
+from unittest.mock import patch
+import os
+import shutil
+from contextlib import suppress
+
+from sf2.key_session import KeySession
+from sf2.json_support import JsonSupport
+from sf2.container_base import ContainerBase
+from sf2.container_ssh import ContainerSSH
+
+WORKING_FILE = "/tmp/test_key_session.x"
+SECRET = "secret"
+ITERATIONS = 100
+PRIVATE_SSH_KEY = "./test/.ssh/id_rsa"
+PUBLIC_SSH_KEY = "./test/.ssh/id_rsa.pub"
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+class TestKeySession(unittest.TestCase):
+
+    def setUp(self) -> None:
+        support = JsonSupport(WORKING_FILE)
+        self.c = ContainerBase(support)
+        self.c.create(SECRET, False, ITERATIONS)
+        self.c.write(b"hello", SECRET, ITERATIONS)
+
+    def tearDown(self) -> None:
+        with suppress(FileNotFoundError):
+            os.remove(WORKING_FILE)
+
+    def test_unlock_and_lock(self):
+        session = KeySession()
+        session.unlock(b"master", b"data", b"encrypted")
+
+        self.assertEqual(session.get_master_key(), b"master")
+        self.assertEqual(session.get_master_data_key(b"encrypted"), b"data")
+        self.assertIsNone(session.get_master_data_key(b"other"))
+
+        session.lock()
+
+        self.assertFalse(session.is_unlocked())
+        self.assertIsNone(session.get_master_key())
+
+    def test_lock_zeroize(self):
+        session = KeySession()
+        session.unlock(b"master", b"data", b"encrypted")
+        buffer = session._master_key
+
+        session.lock()
+
+        self.assertEqual(buffer, bytearray(6))
+
+    def test_ttl(self):
+        clock = FakeClock()
+        session = KeySession(10, _clock=clock)
+        session.unlock(b"master", b"data", b"encrypted")
+
+        clock.now = 9
+        self.assertTrue(session.is_unlocked())
+
+        clock.now = 10
+        self.assertFalse(session.is_unlocked())
+
+    def test_read_with_session(self):
+        with KeySession() as session:
+            self.c.read(SECRET, ITERATIONS, session)
+
+            # The KDF is not run again for the same password
+            with patch.object(ContainerBase, "kdf", autospec=True, side_effect=ContainerBase.kdf) as kdf:
+                results = self.c.read(SECRET, ITERATIONS, session)
+
+        self.assertEqual(results, b"hello")
+        self.assertEqual(kdf.call_count, 0)
+
+    def test_read_with_session_wrong_password(self):
+        with KeySession() as session:
+            self.c.read(SECRET, ITERATIONS, session)
+
+            # The keys are only given back to the password which unlocked them
+            self.assertRaises(Exception, self.c.read, "wrong", ITERATIONS, session)
+            self.assertRaises(Exception, self.c.read, None, ITERATIONS, session)
+
+    def test_write_with_session(self):
+        with KeySession() as session:
+            self.c.read(SECRET, ITERATIONS, session)
+            self.c.write(b"world", SECRET, ITERATIONS, session)
+            self.assertRaises(Exception, self.c.write, b"other", "wrong", ITERATIONS, session)
+
+        results = self.c.read(SECRET, ITERATIONS)
+
+        self.assertEqual(results, b"world")
+
+    def test_credential(self):
+        session = KeySession()
+        session.unlock(b"master", b"data", b"encrypted", b"password")
+
+        self.assertTrue(session.is_unlocked())
+        self.assertEqual(session.get_master_key(b"password"), b"master")
+        self.assertEqual(session.get_master_data_key(b"encrypted", "password"), b"data")
+        self.assertIsNone(session.get_master_key(b"wrong"))
+        self.assertIsNone(session.get_master_key())
+
+    def test_session_invalid_after_change_password(self):
+        session = KeySession()
+        self.c.read(SECRET, ITERATIONS, session)
+
+        self.c.change_password(SECRET, "new_pwd", ITERATIONS)
+
+        self.assertRaises(Exception, self.c.read, SECRET, ITERATIONS, session)
+        self.assertFalse(session.is_unlocked())
+
+        results = self.c.read("new_pwd", ITERATIONS, session)
+
+        self.assertEqual(results, b"hello")
+
+    def test_read_ssh_with_session(self):
+        ssh = ContainerSSH(self.c)
+        ssh.add_ssh_key(SECRET, PUBLIC_SSH_KEY, _iterations=ITERATIONS)
+
+        other_key = "/tmp/test_key_session_id_rsa"
+        shutil.copy(PRIVATE_SSH_KEY, other_key)
+
+        with KeySession() as session:
+            ssh.read("test@test", PRIVATE_SSH_KEY, None, session)
+            with patch.object(ContainerSSH, "get_master_key_ssh", autospec=True) as get_master_key_ssh:
+                # Same key at another path
+                results = ssh.read("test@test", other_key, None, session)
+
+            self.assertRaises(Exception, ssh.read, "test@test", "/does/not/exist", None, session)
+
+        os.remove(other_key)
+        self.assertEqual(results, b"hello")
+        self.assertEqual(get_master_key_ssh.call_count, 0)
@@ -0,0 +1,46 @@
+import unittest
+import os
+
+from sf2.memfd import Memfd
+
+
+class TestMemfd(unittest.TestCase):
+
+    def test_write(self):
+        with Memfd("test") as memfd:
+            memfd.write(b"hello")
+            path = memfd.path
+
+            with open(path, "rb") as f:
+                self.assertEqual(f.read(), b"hello")
+
+            # The program can write to it
+            with open(path, "wb") as f:
+                f.write(b"world")
+            with open(path, "rb") as f:
+                self.assertEqual(f.read(), b"world")
+
+        self.assertFalse(os.path.exists(path))
+
+    def test_sealed(self):
+        with Memfd("test", sealed=True) as memfd:
+            memfd.write(b"hello")
+
+            with self.assertRaises(PermissionError):
+                with open(memfd.path, "wb") as f:
+                    f.write(b"world")
+
+    def test_replace_sealed(self):
+        with Memfd("test", sealed=True) as memfd:
+            memfd.write(b"hello")
+            path = memfd.path
+            reader = open(path, "rb")
+
+            memfd.write(b"world")
+
+            # Same path, new data. Readers already opened keep the old data
+            self.assertEqual(memfd.path, path)
+            with open(path, "rb") as f:
+                self.assertEqual(f.read(), b"world")
+            self.assertEqual(reader.read(), b"hello")
+            reader.close()
@@ -1,4 +1,5 @@
 import unittest
+import msgpack
 from pprint import pprint
 import os
 from contextlib import suppress
@@ -30,4 +31,162 @@ class TestJsonSupport(unittest.TestCase):
         c.dump(container)
         result = c.load()
 
-        self.assertDictEqual(result, container)
\ No newline at end of file
+        self.assertDictEqual(result, container)
+
+    def test_data_last(self):
+        c = MsgpackSupport(WORKING_FILE)
+
+        container = {
+            "data" : b"data",
+            "version" : "3"
+        }
+
+        c.dump(container)
+        result = list(c.load())
+
+        self.assertEqual(result, ["version", "data"])
+
+    def test_load_header(self):
+        c = MsgpackSupport(WORKING_FILE)
+        c.dump({"data" : b"data" * 100000, "version" : "3", "auth" : {"users" : {}}})
+
+        # The data is never parsed, a truncated one is not detected
+        with open(WORKING_FILE, "r+b") as f:
+            f.truncate(1000)
+
+        result = c.load_header()
+
+        self.assertEqual(result, {"version" : "3", "auth" : {"users" : {}}})
+
+    def test_load_header_data_first(self):
+        # Files written before the data section was last
+        with open(WORKING_FILE, "wb") as f:
+            f.write(msgpack.packb({"data" : b"data", "version" : "3"}))
+
+        self.assertEqual(MsgpackSupport(WORKING_FILE).load_header(), {"version" : "3"})
+
+    def test_dump_header(self):
+        c = MsgpackSupport(WORKING_FILE)
+        c.dump({"version" : "3", "auth" : {"users" : {}}, "data" : b"data" * 1000})
+
+        c.dump_header({"version" : "3", "auth" : {"users" : {"foo@bar" : {}}}})
+        self.assertEqual(c.load(), {"version" : "3", "auth" : {"users" : {"foo@bar" : {}}}, "data" : b"data" * 1000})
+
+        c.dump_header({"version" : "3", "auth" : {"users" : {}}})
+        self.assertEqual(c.load(), {"version" : "3", "auth" : {"users" : {}}, "data" : b"data" * 1000})
+
+    def test_dump_and_load_stream(self):
+        c = MsgpackSupport(WORKING_FILE)
+
+        container = {
+            "version" : "3",
+            "data" : {
+                "cipher" : "fernet"
+            }
+        }
+
+        c.dump_stream(container, (bytes([i]) for i in range(3)), 3)
+        result = c.load_stream()
+        chunks = result["data"]["chunks"]
+
+        self.assertEqual(len(chunks), 3)
+        self.assertEqual(list(chunks), [b"\x00", b"\x01", b"\x02"])
+        self.assertEqual(c.load()["data"]["chunks"], [b"\x00", b"\x01", b"\x02"])
+
+    def test_dump_stream_wrong_count(self):
+        c = MsgpackSupport(WORKING_FILE)
+
+        container = {"data" : {}}
+
+        self.assertRaises(Exception, c.dump_stream, container, [b"a"], 2)
+
+    def test_load_stream_by_index(self):
+        c = MsgpackSupport(WORKING_FILE)
+
+        container = {"data" : {}}
+        chunks = [b"aaa", b"bbb", b"c"]
+
+        c.dump_stream(container, chunks, 3)
+        result = c.load_stream()["data"]["chunks"]
+
+        self.assertEqual([result[2], result[0], result[1]], [b"c", b"aaa", b"bbb"])
+        self.assertRaises(IndexError, result.__getitem__, 3)
+        result.close()
+
+    def test_load_stream_mapped(self):
+        c = MsgpackSupport(WORKING_FILE, atomic=True, mapped=True)
+
+        # Each size of binary header
+        chunks = [b"a" * 10, b"b" * 300, b"c" * 70000]
+        c.dump_stream({"data" : {}}, chunks, 3)
+
+        result = c.load_stream()["data"]["chunks"]
+        self.assertEqual([bytes(chunk) for chunk in result], chunks)
+
+    def test_load_stream_mapped_by_index(self):
+        c = MsgpackSupport(WORKING_FILE, atomic=True, mapped=True)
+
+        chunks = [b"a" * 70000, b"b" * 70000, b"c"]
+        c.dump_stream({"data" : {}}, chunks, 3)
+
+        result = c.load_stream()["data"]["chunks"]
+        self.assertIsInstance(result[0], memoryview)
+        self.assertEqual([bytes(result[2]), bytes(result[1])], [b"c", b"b" * 70000])
+        result.close()
+
+    def test_load_stream_mapped_needs_atomic(self):
+        # A file written in place can be truncated while it is mapped
+        c = MsgpackSupport(WORKING_FILE, mapped=True)
+
+        c.dump_stream({"data" : {}}, [b"a" * 70000, b"b"], 2)
+
+        result = c.load_stream()["data"]["chunks"]
+        self.assertIsInstance(result[0], bytes)
+        result.close()
+
+    def test_patch_chunks(self):
+        c = MsgpackSupport(WORKING_FILE)
+
+        container = {"data" : {"size" : 7}}
+        c.dump_stream(container, [b"aaa", b"bbb", b"c"], 3)
+
+        container = {"data" : {"size" : 7}}
+        result = c.patch_chunks(container, {1 : b"BBB"}, 3)
+
+        self.assertTrue(result)
+        self.assertEqual(c.load()["data"]["chunks"], [b"aaa", b"BBB", b"c"])
+
+    def test_patch_chunks_append_and_shrink(self):
+        c = MsgpackSupport(WORKING_FILE)
+
+        container = {"data" : {"size" : 7}}
+        c.dump_stream(container, [b"aaa", b"bbb", b"c"], 3)
+
+        self.assertTrue(c.patch_chunks({"data" : {"size" : 10}}, {2 : b"ccc", 3 : b"d"}, 4))
+        self.assertEqual(c.load()["data"]["chunks"], [b"aaa", b"bbb", b"ccc", b"d"])
+
+        self.assertTrue(c.patch_chunks({"data" : {"size" : 4}}, {1 : b"b"}, 2))
+        self.assertEqual(c.load()["data"], {"size" : 4, "chunks" : [b"aaa", b"b"]})
+
+    def test_patch_chunks_layout_changed(self):
+        c = MsgpackSupport(WORKING_FILE)
+
+        container = {"data" : {"size" : 7}}
+        c.dump_stream(container, [b"aaa", b"bbb", b"c"], 3)
+
+        # the size is encoded on more bytes, every chunk would move
+        self.assertFalse(c.patch_chunks({"data" : {"size" : 70000}}, {1 : b"BBB"}, 3))
+        # the last chunk flag changed, but the new last chunk is missing
+        self.assertFalse(c.patch_chunks({"data" : {"size" : 10}}, {3 : b"d"}, 4))
+        self.assertEqual(c.load()["data"]["chunks"], [b"aaa", b"bbb", b"c"])
+
+    def test_atomic_dump(self):
+        c = MsgpackSupport(WORKING_FILE, atomic=True)
+
+        c.dump({"data" : b"a"})
+        inode = os.stat(WORKING_FILE).st_ino
+        c.dump({"data" : b"b"})
+
+        self.assertNotEqual(os.stat(WORKING_FILE).st_ino, inode)
+        self.assertEqual(c.load(), {"data" : b"b"})
+        self.assertFalse(c.patch_chunks({"data" : {}}, {}, 1))
@@ -4,8 +4,11 @@ import shutil
 import logging
 import time
 import multiprocessing
+import threading
+from unittest.mock import patch
 
 from sf2.openinram import OpenInRAM
+from sf2.openinram import OpenManyInRAM
 from sf2.json_support import JsonSupport
 from sf2.file_object import FileObject
 from sf2.core import Core
@@ -19,6 +22,7 @@ PASSWORD = "password"
 SOURCE = os.path.join(TEST_DIR, "source.txt")
 ENCRYPTED = os.path.join(TEST_DIR, "encrypted.x")
 OUTPUT = os.path.join(TEST_DIR, "output.txt")
+ENCRYPTED2 = os.path.join(TEST_DIR, "encrypted2.x")
 
 class TestOpenInRAM(unittest.TestCase):
     def setUp(self) -> None:
@@ -110,6 +114,214 @@ class TestOpenInRAM(unittest.TestCase):
 
         process.join()
 
+    def test_open_coalesce_writes(self):
+        c = Core(100)
+        c.encrypt(SOURCE, ENCRYPTED, PASSWORD, "json")
+
+        support = JsonSupport(ENCRYPTED)
+        file_object = FileObject(support, PASSWORD, 100)
+
+        # The 5 writes are done in the debounce window, only the last one is synced on exit
+        open_in_ram = OpenInRAM(file_object, 'for i in 1 2 3 4 5; do echo "$i" >> {filename}; done', debounce=10)
+        with patch.object(file_object, "encrypt", wraps=file_object.encrypt) as encrypt:
+            open_in_ram.run()
+
+        self.assertEqual(encrypt.call_count, 1)
+        self.assertEqual(file_object.decrypt(), b"Example ! 1\n2\n3\n4\n5\n")
+
+    def test_open_stop_watcher(self):
+        c = Core(100)
+        c.encrypt(SOURCE, ENCRYPTED, PASSWORD, "json")
+
+        support = JsonSupport(ENCRYPTED)
+        file_object = FileObject(support, PASSWORD, 100)
+        threads = threading.active_count()
+
+        # The last write is done just before the command ends
+        open_in_ram = OpenInRAM(file_object, 'echo "hello" > {filename}')
+        open_in_ram.run()
+
+        self.assertEqual(threading.active_count(), threads)
+        self.assertEqual(file_object.decrypt(), b"hello\n")
+
+    def test_read_back_unchanged(self):
+        c = Core(100)
+        c.encrypt(SOURCE, ENCRYPTED, PASSWORD, "json")
+
+        support = JsonSupport(ENCRYPTED)
+        file_object = FileObject(support, PASSWORD, 100)
+        with open(OUTPUT, "w") as f:
+            f.write("Example ! ")
+
+        open_in_ram = OpenInRAM(file_object, "cat")
+        open_in_ram._read_state = open_in_ram.get_read_state()
+
+        with patch.object(file_object, "decrypt", wraps=file_object.decrypt) as decrypt:
+            # Saved again without change
+            os.utime(ENCRYPTED, ns=(0, 0))
+            open_in_ram.read_back_callback(OUTPUT)
+            # A new password only changes the header
+            c.change_password(ENCRYPTED, PASSWORD, "other_password", "json")
+            open_in_ram.read_back_callback(OUTPUT)
+
+            self.assertEqual(decrypt.call_count, 0)
+
+            FileObject(JsonSupport(ENCRYPTED), "other_password", 100).encrypt(SOURCE)
+            file_object._password = "other_password"
+            open_in_ram.read_back_callback(OUTPUT)
+
+            self.assertEqual(decrypt.call_count, 1)
+            self.assertFalse(open_in_ram.is_changed())
+
+    def test_read_back_atomic_writer(self):
+        c = Core(100)
+        c.encrypt(SOURCE, ENCRYPTED, PASSWORD, "json")
+
+        file_object = FileObject(JsonSupport(ENCRYPTED), PASSWORD, 100)
+        started = os.path.join(TEST_DIR, "started")
+
+        # The follower waits for the new plain text, at most 5 seconds
+        command = f'touch {started}; for i in $(seq 50); do grep -q new {{filename}} && break; sleep 0.1; done; cat {{filename}} > {OUTPUT}'
+        open_in_ram = OpenInRAM(file_object, command)
+        thread = threading.Thread(target=open_in_ram.run_read)
+        thread.start()
+
+        deadline = time.monotonic() + 5
+        while not os.path.exists(started) and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        # The writer replaces the container by a rename, its inode changes
+        inode = os.stat(ENCRYPTED).st_ino
+        with open(SOURCE, "w") as f:
+            f.write("new")
+        FileObject(JsonSupport(ENCRYPTED, atomic=True), PASSWORD, 100).encrypt(SOURCE)
+        self.assertNotEqual(os.stat(ENCRYPTED).st_ino, inode)
+
+        thread.join()
+
+        with open(OUTPUT) as f:
+            self.assertEqual(f.read(), "new")
+
+    def test_interpole_command_many(self):
+        oir = OpenManyInRAM([None, None], "")
+
+        self.assertEqual(oir.interpole_command("cat"), "cat {filename0} {filename1}")
+        self.assertEqual(oir.interpole_command("ls [ dir ]"), "ls {dir}")
+        self.assertEqual(oir.interpole_command("diff [filename0] {filename1}"), "diff {filename0} {filename1}")
+
+    def test_get_paths(self):
+        oir = OpenManyInRAM(["/a/x.x", "/b/x.x", "/a/y.x"], "")
+
+        self.assertEqual(oir.get_paths("/dir"), ["/dir/0-x.x", "/dir/1-x.x", "/dir/y.x"])
+
+    def test_open_many(self):
+        c = Core(100)
+        c.encrypt(SOURCE, ENCRYPTED, PASSWORD, "json")
+        c.encrypt(SOURCE, ENCRYPTED2, PASSWORD, "json")
+
+        command = 'ls {dir} > ' + OUTPUT + ' && echo "one" >> {filename0} && echo "two" >> {filename1}'
+        c.open_many([ENCRYPTED, ENCRYPTED2], command, PASSWORD, "json")
+
+        with open(OUTPUT) as f:
+            self.assertEqual(f.read(), "encrypted.x\nencrypted2.x\n")
+
+        self.assertEqual(FileObject(JsonSupport(ENCRYPTED), PASSWORD, 100).decrypt(), b"Example ! one\n")
+        self.assertEqual(FileObject(JsonSupport(ENCRYPTED2), PASSWORD, 100).decrypt(), b"Example ! two\n")
+        self.assertEqual([f for f in os.listdir("/dev/shm") if f.startswith("sf2-")], [])
+
+    def test_open_many_wrong_password(self):
+        c = Core(100)
+        c.encrypt(SOURCE, ENCRYPTED, PASSWORD, "json")
+        c.encrypt(SOURCE, ENCRYPTED2, "other_password", "json")
+        shm = set(os.listdir("/dev/shm"))
+
+        with self.assertRaises(Exception):
+            c.open_many([ENCRYPTED, ENCRYPTED2], "touch " + OUTPUT, PASSWORD, "json")
+
+        # Nothing was opened, the locks are released
+        self.assertFalse(os.path.exists(OUTPUT))
+        self.assertEqual(set(os.listdir("/dev/shm")), shm)
+        self.assertFalse(os.path.exists(ENCRYPTED + ".lock"))
+
+    def test_open_many_read_only(self):
+        c = Core(100)
+        c.encrypt(SOURCE, ENCRYPTED, PASSWORD, "json")
+        c.encrypt(SOURCE, ENCRYPTED2, PASSWORD, "json")
+
+        file_objects = [FileObject(JsonSupport(filename), PASSWORD, 100) for filename in (ENCRYPTED, ENCRYPTED2)]
+        # The first container is opened by someone else
+        lock = OpenInRAM(file_objects[0], "").acquire_lock()
+        try:
+            open_in_ram = OpenManyInRAM(file_objects, 'cat {filename0} > ' + OUTPUT + '; echo "x" > {filename0}; echo "y" > {filename1}')
+            open_in_ram.run()
+        finally:
+            lock.unlock()
+
+        with open(OUTPUT) as f:
+            self.assertEqual(f.read(), "Example ! ")
+
+        self.assertEqual(file_objects[0].decrypt(), b"Example ! ")
+        self.assertEqual(file_objects[1].decrypt(), b"y\n")
+
+    def test_open_memfd(self):
+        c = Core(100)
+        c.encrypt(SOURCE, ENCRYPTED, PASSWORD, "json")
+
+        support = JsonSupport(ENCRYPTED)
+        file_object = FileObject(support, PASSWORD, 100)
+        shm = set(os.listdir("/dev/shm"))
+
+        open_in_ram = OpenInRAM(file_object, 'cat {filename} > ' + OUTPUT + ' && echo "{filename}" >> ' + OUTPUT + ' && echo "hello" >> {filename}', memfd=True)
+        open_in_ram.run()
+
+        with open(OUTPUT) as f:
+            results = f.read().splitlines()
+
+        self.assertEqual(results[0], "Example ! /proc/" + str(os.getpid()) + "/fd/" + results[0].split("/")[-1])
+        self.assertEqual(file_object.decrypt(), b"Example ! hello\n")
+        self.assertEqual(set(os.listdir("/dev/shm")), shm)
+
+    def test_read_back_memfd(self):
+        c = Core(100)
+        c.encrypt(SOURCE, ENCRYPTED, PASSWORD, "json")
+
+        support = JsonSupport(ENCRYPTED)
+        file_object = FileObject(support, PASSWORD, 100)
+        open_in_ram = OpenInRAM(file_object, "cat", memfd=True)
+
+        with open_in_ram.open_memfd(open_in_ram.decrypt(False), False) as path:
+            # The read only memory file is sealed
+            with self.assertRaises(PermissionError):
+                open(path, "wb")
+
+            # The writer saves the container
+            with open(SOURCE, "w") as f:
+                f.write("new")
+            FileObject(JsonSupport(ENCRYPTED), PASSWORD, 100).encrypt(SOURCE)
+
+            # The watcher replaces the memory file
+            deadline = time.monotonic() + 5
+            while time.monotonic() < deadline:
+                with open(path, "rb") as f:
+                    results = f.read()
+                if results == b"new":
+                    break
+                time.sleep(0.01)
+
+            self.assertEqual(results, b"new")
+
+    def test_open_many_memfd(self):
+        c = Core(100)
+        c.encrypt(SOURCE, ENCRYPTED, PASSWORD, "json")
+        c.encrypt(SOURCE, ENCRYPTED2, PASSWORD, "json")
+
+        c.open_many([ENCRYPTED, ENCRYPTED2], 'echo "one" >> {filename0} && echo "two" >> {filename1}', PASSWORD, "json", memfd=True)
+
+        self.assertEqual(FileObject(JsonSupport(ENCRYPTED), PASSWORD, 100).decrypt(), b"Example ! one\n")
+        self.assertEqual(FileObject(JsonSupport(ENCRYPTED2), PASSWORD, 100).decrypt(), b"Example ! two\n")
+
+        with self.assertRaises(Exception):
+            c.open_many([ENCRYPTED, ENCRYPTED2], "ls {dir}", PASSWORD, "json", memfd=True)
 
     # def test_open_read_back(self):
     #     logging.basicConfig(level=logging.DEBUG)
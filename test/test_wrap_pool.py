@@ -0,0 +1,79 @@
+import unittest
+from unittest.mock import patch
+
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.serialization import load_ssh_private_key
+from cryptography.hazmat.primitives.asymmetric import padding
+
+from sf2.wrap_pool import WrapPool
+from sf2.wrap_pool import parse_public_key
+
+PUBLIC_KEY = "test/.ssh/id_rsa.pub"
+PRIVATE_KEY = "test/.ssh/id_rsa"
+MASTER_KEY = b"0123456789abcdef0123456789abcdef"
+
+class TestWrapPool(unittest.TestCase):
+
+    def setUp(self) -> None:
+        with open(PUBLIC_KEY) as f:
+            self.public_key = f.read().strip()
+        with open(PRIVATE_KEY, "rb") as f:
+            self.private_key = load_ssh_private_key(f.read(), None)
+
+    def unwrap(self, encrypted_master_key:bytes)->bytes:
+        return self.private_key.decrypt(
+            encrypted_master_key,
+            padding.OAEP(
+                mgf=padding.MGF1(algorithm=hashes.SHA256()),
+                algorithm=hashes.SHA256(),
+                label=None
+            )
+        )
+
+    def test_get_workers(self):
+        pool = WrapPool(max_workers=4)
+
+        results = [pool.get_workers(1), pool.get_workers(64), pool.get_workers(1000)]
+        expected = [1, 2, 4]
+
+        self.assertEqual(results, expected)
+
+    def test_wrap_inline(self):
+        with WrapPool() as pool:
+            result = pool.wrap({"a@b" : self.public_key}, MASTER_KEY)
+
+            self.assertIsNone(pool._executor)
+
+        self.assertEqual(self.unwrap(result["a@b"]), MASTER_KEY)
+
+    def test_wrap_threads(self):
+        public_keys = {f"user{i}@test" : self.public_key for i in range(100)}
+
+        with WrapPool("threads", 2) as pool:
+            result = pool.wrap(public_keys, MASTER_KEY)
+            executor = pool._executor
+            pool.wrap(public_keys, MASTER_KEY)
+
+            self.assertIs(pool._executor, executor)
+
+        self.assertEqual(sorted(result), sorted(public_keys))
+        self.assertEqual(self.unwrap(result["user99@test"]), MASTER_KEY)
+
+    def test_wrap_processes(self):
+        public_keys = {f"user{i}@test" : self.public_key for i in range(64)}
+
+        with WrapPool("processes", 2) as pool:
+            result = pool.wrap(public_keys, MASTER_KEY)
+
+        self.assertEqual(self.unwrap(result["user0@test"]), MASTER_KEY)
+
+    def test_parse_once(self):
+        parse_public_key.cache_clear()
+
+        with WrapPool() as pool:
+            pool.wrap({f"user{i}@test" : self.public_key for i in range(10)}, MASTER_KEY)
+
+        self.assertEqual(parse_public_key.cache_info().misses, 1)
+
+    def test_unknown_kind(self):
+        self.assertRaises(Exception, WrapPool, "fibers")
@@ -0,0 +1,58 @@
+import unittest
+import time
+
+from sf2.write_back_queue import WriteBackQueue
+
+
+class TestWriteBackQueue(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.synced = list()
+
+    def callback(self, path:str):
+        self.synced.append(path)
+
+    def test_coalesce(self):
+        with WriteBackQueue(self.callback, 10) as queue:
+            for _ in range(5):
+                queue.push("a")
+
+        self.assertEqual(self.synced, ["a"])
+        self.assertEqual([queue.requests, queue.syncs, queue.coalesced], [5, 1, 4])
+
+    def test_debounce(self):
+        with WriteBackQueue(self.callback, 0.01) as queue:
+            queue.push("a")
+            deadline = time.monotonic() + 5
+            while not self.synced and time.monotonic() < deadline:
+                time.sleep(0.01)
+
+            # Synced before the queue is closed
+            self.assertEqual(self.synced, ["a"])
+            queue.push("b")
+
+        self.assertEqual(self.synced, ["a", "b"])
+        self.assertEqual(queue.coalesced, 0)
+
+    def test_close_without_write(self):
+        with WriteBackQueue(self.callback) as queue:
+            pass
+
+        self.assertEqual(self.synced, [])
+        self.assertEqual(queue.syncs, 0)
+
+    def test_close_not_started(self):
+        queue = WriteBackQueue(self.callback)
+        queue.push("a")
+        queue.close()
+
+        self.assertEqual(self.synced, ["a"])
+
+    def test_callback_error(self):
+        def callback(path):
+            raise Exception("failed")
+
+        with WriteBackQueue(callback, 0) as queue:
+            queue.push("a")
+
+        self.assertEqual(queue.syncs, 1)
@@ -0,0 +1,39 @@
+import unittest
+
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
+from cryptography.hazmat.primitives.serialization import Encoding
+from cryptography.hazmat.primitives.serialization import PublicFormat
+
+from sf2 import x25519_wrap
+
+MASTER_KEY = b"0123456789abcdef0123456789abcdef"
+
+class TestX25519Wrap(unittest.TestCase):
+
+    def test_key_conversion(self):
+        private_key = Ed25519PrivateKey.generate()
+
+        result = x25519_wrap.to_x25519_public_key(private_key.public_key()).public_bytes(Encoding.Raw, PublicFormat.Raw)
+        expected = x25519_wrap.to_x25519_private_key(private_key).public_key().public_bytes(Encoding.Raw, PublicFormat.Raw)
+
+        self.assertEqual(result, expected)
+
+    def test_wrap_unwrap(self):
+        private_key = Ed25519PrivateKey.generate()
+
+        encrypted_master_key = x25519_wrap.wrap(private_key.public_key(), MASTER_KEY)
+        result = x25519_wrap.unwrap(private_key, encrypted_master_key)
+
+        self.assertEqual(len(encrypted_master_key), 32 + len(MASTER_KEY) + 16)
+        self.assertEqual(result, MASTER_KEY)
+
+    def test_wrap_is_randomized(self):
+        public_key = Ed25519PrivateKey.generate().public_key()
+
+        self.assertNotEqual(x25519_wrap.wrap(public_key, MASTER_KEY), x25519_wrap.wrap(public_key, MASTER_KEY))
+
+    def test_unwrap_wrong_key(self):
+        encrypted_master_key = x25519_wrap.wrap(Ed25519PrivateKey.generate().public_key(), MASTER_KEY)
+
+        self.assertRaises(InvalidTag, x25519_wrap.unwrap, Ed25519PrivateKey.generate(), encrypted_master_key)